@@ -2,8 +2,6 @@
 Management utility to award badges to all users.
 """
 
-import os.path
-
 from django.core.management.base import BaseCommand
 
 class Command(BaseCommand):
@@ -13,14 +11,13 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
 
         from django.contrib.auth.models import User
-        
+
         import openPLM.apps.badges as b
         from openPLM.apps.badges import meta_badges
-        
-        badges = b.models.Badge.objects.active().order_by("level")
-        users = User.objects.all()
-        
-        for u in users:
-            for badge in badges:
-                badge.award_to(u,ignore_message=True)
+        from openPLM.apps.badges.utils import award_in_bulk
 
+        badges = b.models.Badge.objects.active()
+        users = set(User.objects.values_list("id", flat=True))
+        awards = award_in_bulk(dict((badge.id, users) for badge in badges),
+                ignore_message=True)
+        self.stdout.write("%d badges awarded.\n" % len(awards))
@@ -2,13 +2,15 @@
 .. module:: meta_badges
 """
 
+import os.path
+
 from django.db.models import Q
 from django.contrib.comments import Comment
 from django.utils.translation import ugettext_lazy as _
 
 from openPLM.plmapp import models
 
-from utils import MetaBadge
+from utils import MetaBadge, count_in_bulk
 
 class Autobiographer(MetaBadge):
     """
@@ -49,11 +51,7 @@ class SerialKiller(MetaBadge):
 
     #assuming the badge serial killer is awarded when user has cancelled 20 objects
     progress_finish = 20
-
-
-    def get_progress(self, user):
-        cancel_hist = self.model.objects.filter(user=user,action='Cancel').count()
-        return cancel_hist
+    counted_actions = ("Cancel",)
 
 
 #: badges won by sponsoring or delegating
@@ -79,6 +77,10 @@ class WelcomeAA(MetaBadge):
         sponsored = self.model.current_objects.filter(delegator=user,role='sponsor').count()
         return sponsored
 
+    def get_progress_in_bulk(self, users):
+        links = self.model.current_objects.filter(delegator__in=users, role='sponsor')
+        return count_in_bulk(links, "delegator", users)
+
 
 class GodFather(MetaBadge):
     """
@@ -102,6 +104,10 @@ class GodFather(MetaBadge):
         sponsored = self.model.current_objects.filter(delegator=user,role='sponsor').count()
         return sponsored
 
+    def get_progress_in_bulk(self, users):
+        links = self.model.current_objects.filter(delegator__in=users, role='sponsor')
+        return count_in_bulk(links, "delegator", users)
+
 
 class DelegateSponsor(MetaBadge):
     """
@@ -134,8 +140,32 @@ class DelegateSponsor(MetaBadge):
 
 PONY_NAMES = set(["pinkie pie", "applejack", "twilight sparkle", "rarity", "rainbow dash", "fluttershy"])
 
-_added_file_query = Q(action__in=("File added", "added file"))
-_deleted_file_query = Q(action__in=("File deleted", "deleted file"))
+_ADDED_FILE_ACTIONS = ("File added", "added file", "added file to ")
+_DELETED_FILE_ACTIONS = ("File deleted", "deleted file", "deleted file in ")
+
+def get_file_name(details):
+    """
+    Returns the name (without extension) of the file of a file history
+    whose details are ``file : <name> added`` or ``file : <name> was deleted``.
+    """
+    name = details.split(" : ", 1)[-1]
+    for suffix in (" added", " was deleted"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return os.path.splitext(name)[0].lower()
+
+def _get_file_names(user, actions, names):
+    """
+    Returns the set of file names of *names* added or deleted (according to
+    *actions*) by *user*.
+    """
+    query = Q()
+    for name in names:
+        query |= Q(details__istartswith="file : " + name)
+    histories = models.History.objects.filter(query, user=user, action__in=actions)
+    details = histories.with_archive().values_list("details", flat=True)
+    return set(get_file_name(d) for d in details) & set(names)
+
 
 class PonyRider(MetaBadge):
     """
@@ -149,15 +179,12 @@ class PonyRider(MetaBadge):
     description = _("Added a file named pinkie pie, applejack, twilight sparkle, rarity, rainbow dash or fluttershy")
     level = "2"
 
+    def check_pony_file(self, instance):
+        return instance.action in _ADDED_FILE_ACTIONS and \
+                get_file_name(instance.details) in PONY_NAMES
+
     def get_progress(self, user):
-        doc_file_hist = self.model.objects.filter(user=user).filter(_added_file_query)
-        progress = 0
-        for h in doc_file_hist :
-            f_name = h.details.split(" : ")[1]
-            if f_name in PONY_NAMES:
-                progress = 1
-                break
-        return progress
+        return int(bool(_get_file_names(user, _ADDED_FILE_ACTIONS, PONY_NAMES)))
 
 
 class SuperPonyRider(MetaBadge):
@@ -174,14 +201,13 @@ class SuperPonyRider(MetaBadge):
 
     pony_names=["pinkie pie", "applejack", "twilight sparkle", "rarity", "rainbow dash", "fluttershy"]
 
+    def check_pony_file(self, instance):
+        return instance.action in _ADDED_FILE_ACTIONS and \
+                get_file_name(instance.details) in PONY_NAMES
+
     def get_progress(self, user):
-        doc_file_hist = self.model.objects.filter(user=user).filter(_added_file_query)
-        progress = 0
-        f_names = []
-        for h in doc_file_hist :
-            f_names.append(h.details.split(" : ")[1])
-        progress = int(set(f_names).issuperset(PONY_NAMES))
-        return progress
+        names = _get_file_names(user, _ADDED_FILE_ACTIONS, PONY_NAMES)
+        return int(names == PONY_NAMES)
 
 
 class DragonSlayer(MetaBadge):
@@ -196,16 +222,14 @@ class DragonSlayer(MetaBadge):
     description = _("Added and destroyed a file named spike")
     level = "4"
 
-    def get_progress(self, user):
-        spike_hist = self.model.objects.filter(user=user, action__icontains="file", details__icontains=" spike")
-        if not spike_hist:
-            return 0
+    def check_spike_file(self, instance):
+        return instance.action in _DELETED_FILE_ACTIONS and \
+                get_file_name(instance.details) == "spike"
 
-        if spike_hist.filter(_added_file_query) and spike_hist.filter(_deleted_file_query):
-            progress = 1
-        else:
-            progress = 0
-        return progress
+    def get_progress(self, user):
+        added = _get_file_names(user, _ADDED_FILE_ACTIONS, ["spike"])
+        deleted = _get_file_names(user, _DELETED_FILE_ACTIONS, ["spike"])
+        return int(bool(added and deleted))
 
 
 #: badges won by user who diffused informations
@@ -224,9 +248,7 @@ class Herald(MetaBadge):
 
     progress_finish = 50
 
-    def get_progress(self, user):
-        notified = self.model.objects.filter(user=user, action="New notified").count()
-        return notified
+    counted_actions = ("New notified",)
 
 
 class Journalist(MetaBadge):
@@ -244,12 +266,7 @@ class Journalist(MetaBadge):
     # until the numbers of objects to published, to won this badge , is set
     progress_finish = 20
 
-    def get_progress(self, user):
-        published = self.model.objects.filter(user=user, action="Publish").count()
-        return published
-
-    def check_action(self, instance):
-        return instance.action == "Publish"
+    counted_actions = ("Publish",)
 
     def check_can_publish(self, instance):
         """
@@ -275,12 +292,7 @@ class HiruleHero(MetaBadge):
 
     progress_finish = 100
 
-    def get_progress(self, user):
-        linked = self.model.objects.filter(user=user, action="Link : document-part").count()
-        return linked
-
-    def check_action(self, instance):
-        return instance.action == "Link : document-part"
+    counted_actions = ("Link : document-part",)
 
 
 class WelcomeToHogwarts(MetaBadge):
@@ -319,6 +331,10 @@ class EmmettBrown(MetaBadge):
         created = models.PLMObject.objects.filter(creator=user).count()
         return created
 
+    def get_progress_in_bulk(self, users):
+        objects = models.PLMObject.objects.filter(creator__in=users)
+        return count_in_bulk(objects, "creator", users)
+
 
 
 class Guru(MetaBadge):
@@ -342,6 +358,10 @@ class Guru(MetaBadge):
         created = models.GroupInfo.objects.filter(creator=user).count()
         return created
 
+    def get_progress_in_bulk(self, users):
+        groups = models.GroupInfo.objects.filter(creator__in=users)
+        return count_in_bulk(groups, "creator", users)
+
 
 #: badges won manipulating object
 class Archivist(MetaBadge):
@@ -379,11 +399,8 @@ class WisedOne(MetaBadge):
     link_to_doc = "PLMObject/1_common.html#lifecycle"
     level = "4"
 
-    progress_finish = 10
-
-    def get_progress(self, user):
-        rejected = self.model.objects.filter(user=user, action__in=("Demote", "demoted")).count()
-        return rejected/50
+    progress_finish = 500
+    counted_actions = ("Demote", "demoted")
 
 
 class Replicant(MetaBadge):
@@ -399,9 +416,7 @@ class Replicant(MetaBadge):
     link_to_doc = "PLMObject/1_common.html#attributes"
     level = "1"
 
-    def get_progress(self, user):
-        progress = 1 if self.model.objects.filter(user=user, action__in=("Clone", "cloned")).exists() else 0
-        return progress
+    counted_actions = ("Clone", "cloned")
 
 
 class Frankeinstein(MetaBadge):
@@ -417,6 +432,9 @@ class Frankeinstein(MetaBadge):
     link_to_doc = "PLMObject/1_common.html#attributes"
     level = "2"
 
+    def check_clone(self, instance):
+        return instance.action in ("Clone", "cloned")
+
     def get_progress(self, user):
         cloned = self.model.objects.filter(user=user, action__in=("Clone", "cloned"))
         if not cloned :
@@ -440,6 +458,9 @@ class Tipiak(MetaBadge):
     link_to_doc = "PLMObject/1_common.html#attributes"
     level = "3"
 
+    def check_clone(self, instance):
+        return instance.action in ("Clone", "cloned")
+
     def get_progress(self, user):
         cloned = self.model.objects.filter(user=user, action__in=("Clone", "cloned"))
         if not cloned :
@@ -470,7 +491,11 @@ class Materialistic(MetaBadge):
 
     def get_progress(self, user):
         owned = self.model.objects.filter(owner=user).count()
-        return owned/100
+        return owned // 100
+
+    def get_progress_in_bulk(self, users):
+        owned = count_in_bulk(self.model.objects.filter(owner__in=users), "owner", users)
+        return dict((user_id, count // 100) for user_id, count in owned.items())
 
 
 class Popular(MetaBadge):
@@ -2,6 +2,8 @@
 
 from threading import current_thread
 
+from .utils import notify_awards
+
 class GlobalRequest(object):
     _requests = {}
 
@@ -26,3 +28,26 @@ class GlobalRequest(object):
 
 def get_request():
     return GlobalRequest.get_request()
+
+
+class BadgeNotificationMiddleware(object):
+    """
+    Shows a message to the authenticated user for each badge they have won
+    since their previous request. Badges are evaluated by a background
+    task, so the message cannot be shown by the request which queued the
+    evaluation. Awards are queried only if the profile of the user is
+    flagged (see :func:`.utils.notify_awards`).
+
+    It must be placed after
+    :class:`~django.contrib.auth.middleware.AuthenticationMiddleware` and
+    :class:`~django.contrib.messages.middleware.MessageMiddleware`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            notify_awards(request)
+        return self.get_response(request)
@@ -2,14 +2,11 @@ from django.utils import timezone
 
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
-from django.contrib import messages
 from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
-from signals import badge_awarded
 from managers import BadgeManager
-from middleware import get_request
 
 from openPLM.plmapp.models import UserProfile
 
@@ -71,24 +68,14 @@ class Badge(models.Model):
         return reverse('badge_detail', kwargs={'slug': self.id})
 
     def award_to(self, user, ignore_message=False):
-        request = get_request()
-        if request is None or request.user != user:
-            return False
-        has_badge = user.badges.filter(id=self.id).exists()
-        if self.meta_badge.one_time_only and has_badge:
-            return False
-        if self.meta_badge.get_progress_percentage(user=user) < 100 :
+        """
+        Awards this badge to *user* if they have completed it.
+        Returns the number of times *user* has won this badge,
+        False if it has not been awarded.
+        """
+        from utils import award_in_bulk
+        if not award_in_bulk({self.id : [user.id]}, ignore_message):
             return False
-
-        BadgeToUser.objects.create(badge=self, user=user)
-
-        badge_awarded.send(sender=self.meta_badge, user=user, badge=self)
-
-        if not ignore_message:
-            message_template = _(u"You just got the %s Badge!")
-            if request is not None:
-                messages.info(request, message_template % self.title)
-
         return BadgeToUser.objects.filter(badge=self, user=user).count()
 
     def number_awarded(self, user_or_qs=None):
@@ -107,7 +94,34 @@ class Badge(models.Model):
 
 
 class BadgeToUser(models.Model):
+    """
+    Badge won by a user. A user wins a badge only once.
+
+    :attr:`notified` is False until the user has been told that they
+    have won the badge (see :func:`.utils.notify_awards`).
+    """
     badge = models.ForeignKey(Badge)
     user = models.ForeignKey(User)
 
     created = models.DateTimeField(default=timezone.now)
+    notified = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = (("badge", "user"),)
+
+
+class BadgeEvent(models.Model):
+    """
+    Queued evaluation of a badge for a user.
+
+    Events are added when an instance meets the conditions of a badge
+    and are evaluated by batches by a background task
+    (see :func:`.utils.evaluate_events`).
+    """
+    badge = models.ForeignKey(Badge)
+    user = models.ForeignKey(User)
+
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = (("badge", "user"),)
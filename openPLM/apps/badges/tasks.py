@@ -0,0 +1,10 @@
+from djcelery_transactions import task
+
+from openPLM.apps.badges.utils import evaluate_events
+
+@task(name="openPLM.apps.badges.tasks.evaluate_badges", ignore_result=True)
+def evaluate_badges():
+    """
+    Evaluates the queued badge events (see :func:`.utils.evaluate_events`).
+    """
+    return evaluate_events()
@@ -1,11 +1,17 @@
 from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import IntegrityError, transaction
+from django.test.client import RequestFactory
 
+from openPLM.plmapp.models import ScheduledTask
 from openPLM.plmapp.tests import CommonViewTest
 
 from utils import MetaBadge, registered_badges, RequiresUserOrProgress
-from utils import register as register_badge
+from utils import register as register_badge, award_in_bulk, evaluate_events, \
+    notify_awards, EVALUATION_TASK_NAME
 from signals import badge_awarded
-from models import Badge
+from models import Badge, BadgeEvent, BadgeToUser
 from templatetags.badges_tags import badge_count, level_title, \
     level_count, number_awarded
 
@@ -111,3 +117,58 @@ class BadgeTestCase(CommonViewTest):
         self.post(self.user_url + "modify/", data)
         self.assertEqual(badge_count(self.user), [{'count': 1, 'badge__level': '1'}, {'count': 0, 'badge__level': '2'}, {'count': 0, 'badge__level': '3'}, {'count': 0, 'badge__level': '4'}])
 
+    def test_badge_conditions(self):
+        self.assertEqual(("check_can_win_badge", "check_counted_action",
+            "check_email", "check_user"), self.meta_badge.conditions)
+
+    def test_badge_events(self):
+        user = User(username='zodiac', email="zodiac@example.com")
+        user.save()
+        evaluate_events()
+        self.assertFalse(BadgeEvent.objects.exists())
+        self.assertTrue(BadgeToUser.objects.filter(user=user,
+            badge=self.meta_badge.id).exists())
+
+    def test_badge_events_scheduled_once(self):
+        # an evaluation is already scheduled: events are only queued
+        self.assertTrue(ScheduledTask.schedule(EVALUATION_TASK_NAME))
+        for i in range(3):
+            User.objects.create(username="u%d" % i, email="u@example.com")
+        self.assertEqual(3, BadgeEvent.objects.count())
+        self.assertEqual(3, evaluate_events())
+        self.assertFalse(BadgeEvent.objects.exists())
+        self.assertFalse(ScheduledTask.objects.exists())
+
+    def test_award_in_bulk(self):
+        users = [User.objects.create(username="u%d" % i, email="" if i % 2 else "u@example.com")
+                for i in range(4)]
+        BadgeToUser.objects.all().delete()
+        awards = award_in_bulk({self.meta_badge.id : [u.id for u in users]})
+        self.assertEqual(set([users[0].id, users[2].id]), set(a.user_id for a in awards))
+        # one time only badge
+        self.assertEqual([], award_in_bulk({self.meta_badge.id : [users[0].id]}))
+        # a badge is won only once
+        with transaction.atomic():
+            self.assertRaises(IntegrityError, BadgeToUser.objects.create,
+                badge_id=self.meta_badge.id, user=users[0])
+
+    def test_notify_awards(self):
+        BadgeToUser.objects.all().delete()
+        self.user.email = "test@example.com"
+        self.user.save()
+        evaluate_events()
+        award = BadgeToUser.objects.get(user=self.user, badge=self.meta_badge.id)
+        self.assertFalse(award.notified)
+        request = RequestFactory().get(self.user_url)
+        request.user = User.objects.select_related("profile").get(id=self.user.id)
+        self.assertTrue(request.user.profile.unseen_badges)
+        request._messages = CookieStorage(request)
+        notify_awards(request)
+        self.assertEqual(1, len(get_messages(request)))
+        self.assertTrue(BadgeToUser.objects.get(id=award.id).notified)
+        self.assertFalse(User.objects.get(id=self.user.id).profile.unseen_badges)
+        # the message is shown only once and the awards are not queried again
+        request._messages = CookieStorage(request)
+        with self.assertNumQueries(0):
+            notify_awards(request)
+        self.assertEqual(0, len(get_messages(request)))
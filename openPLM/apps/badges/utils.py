@@ -1,9 +1,24 @@
-from django.db import models
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import models, transaction, IntegrityError
 from django.db.models.signals import post_save
 from django.contrib.auth.models import User
+from django.utils.translation import gettext as _
+
+from openPLM.plmapp.models import UserActivity, UserProfile, ScheduledTask
 
 from .models import Badge as BadgeModel
-from .models import BadgeToUser, LEVEL_CHOICES
+from .models import BadgeToUser, BadgeEvent, LEVEL_CHOICES
+from .signals import badge_awarded
+
+#: delay (in seconds) before the evaluation of queued badge events
+EVALUATION_DELAY = getattr(settings, "BADGE_EVALUATION_DELAY", 0)
+#: number of events evaluated by :func:`evaluate_events`
+EVALUATION_BATCH_SIZE = 1000
+#: name of the evaluation task (see :class:`.ScheduledTask`)
+EVALUATION_TASK_NAME = "badges"
 
 
 class RequiresUserOrProgress(Exception): pass
@@ -57,6 +72,9 @@ class MetaBadgeMeta(type):
         if not parents:
             # If this isn't a subclass of MetaBadge, don't do anything special.
             return new_badge
+        # condition methods are resolved once per class
+        new_badge.conditions = tuple(sorted(c for c in dir(new_badge)
+            if c.startswith('check')))
         return register(new_badge)
 
 
@@ -71,6 +89,13 @@ class MetaBadge(object):
     progress_start = 0
     progress_finish = 1
 
+    #: actions (see :class:`.UserActivity`) counted by :meth:`get_progress`.
+    #: If set, the badge is only evaluated when one of these actions is recorded.
+    counted_actions = ()
+
+    #: names of the ``check*`` methods, set by the metaclass
+    conditions = ()
+
     def __init__(self):
         # whenever the server is reloaded, the badge will be initialized and
         # added to the database
@@ -82,10 +107,8 @@ class MetaBadge(object):
         self.award_ceremony(i)
 
     def _test_conditions(self, instance):
-        condition_callbacks = [getattr(self, c) for c in dir(self) if c.startswith('check')]
-
         # will return False on the first False condition
-        return all( fn(instance) for fn in condition_callbacks )
+        return all(getattr(self, c)(instance) for c in self.conditions)
 
     def get_user(self, instance):
         """
@@ -95,8 +118,23 @@ class MetaBadge(object):
         return instance.user
 
     def get_progress(self, user):
+        if self.counted_actions:
+            return UserActivity.get_count(user, *self.counted_actions)
         return int(BadgeToUser.objects.filter(user=user, badge=self.badge).exists())
 
+    def get_progress_in_bulk(self, users):
+        """
+        Returns a dictionary {user id: progress} for each user of *users*.
+
+        Badges that can compute the progress of several users with a few
+        queries should override this method.
+        """
+        if self.counted_actions:
+            activities = UserActivity.objects.filter(user__in=users,
+                    action__in=self.counted_actions)
+            return count_in_bulk(activities, "user", users, models.Sum("count"))
+        return dict((user.id, self.get_progress(user)) for user in users)
+
     def get_progress_percentage(self, progress=None, user=None):
         """
         Return the percentage of progress for a user.
@@ -104,7 +142,7 @@ class MetaBadge(object):
         if user is None and progress is None:
             raise RequiresUserOrProgress("This method requires either a user or progress keyword argument")
 
-        if not progress:
+        if progress is None:
             progress = self.get_progress(user)
 
         progress = min(progress, self.progress_finish)
@@ -122,9 +160,21 @@ class MetaBadge(object):
         self.badge = badge
 
     def award_ceremony(self, instance):
+        """
+        Queues an evaluation of the badge (see :func:`queue_event`) if
+        *instance* meets the conditions of the badge.
+        """
         if self._test_conditions(instance):
             user = self.get_user(instance)
-            self.badge.award_to(user)
+            queue_event(self.badge, user)
+
+    def check_counted_action(self, instance):
+        """
+        checks that the recorded action is one of :attr:`counted_actions`
+        """
+        if not self.counted_actions:
+            return True
+        return getattr(instance, "action", None) in self.counted_actions
 
     def check_user(self, instance):
         """
@@ -146,3 +196,147 @@ class MetaBadge(object):
             return user.profile.is_contributor
         else :
             return False
+
+
+def count_in_bulk(queryset, field, users, aggregate=None):
+    """
+    Returns a dictionary {user id: count} where count is the number of rows
+    of *queryset* whose *field* is the user (or *aggregate* of these rows).
+    """
+    aggregate = aggregate or models.Count("pk")
+    counts = dict((user.id, 0) for user in users)
+    rows = queryset.order_by().values_list(field).annotate(total=aggregate)
+    counts.update((user_id, total) for user_id, total in rows)
+    return counts
+
+
+def queue_event(badge, user):
+    """
+    Adds an event to the badge queue: *badge* will be evaluated for *user*
+    by :func:`evaluate_events` which is run by a background task.
+
+    The task is sent only if it is not already scheduled: it evaluates
+    all events queued until it starts.
+    """
+    from .tasks import evaluate_badges
+    BadgeEvent.objects.bulk_create([BadgeEvent(badge=badge, user=user)],
+            ignore_conflicts=True)
+    if ScheduledTask.schedule(EVALUATION_TASK_NAME, EVALUATION_DELAY):
+        evaluate_badges.apply_async(countdown=EVALUATION_DELAY)
+
+
+def evaluate_events(batch_size=EVALUATION_BATCH_SIZE):
+    """
+    Evaluates queued badge events (see :func:`queue_event`) by batches of
+    *batch_size* events.
+
+    Each batch is claimed and evaluated in a transaction: events locked
+    by a concurrent evaluation are skipped and the events of a failed
+    evaluation are kept in the queue.
+
+    Returns the number of awarded badges.
+    """
+    # events queued from now schedule a new evaluation
+    ScheduledTask.start(EVALUATION_TASK_NAME)
+    count = 0
+    while True:
+        with transaction.atomic():
+            events = BadgeEvent.objects.select_for_update(skip_locked=True)
+            events = list(events.order_by("id")[:batch_size])
+            if not events:
+                return count
+            BadgeEvent.objects.filter(id__in=[e.id for e in events]).delete()
+            users_by_badge = defaultdict(set)
+            for event in events:
+                users_by_badge[event.badge_id].add(event.user_id)
+            count += len(award_in_bulk(users_by_badge))
+
+
+def _create_awards(awards):
+    """
+    Saves *awards* (a list of :class:`.BadgeToUser`) and returns the saved
+    awards. An award already created by a concurrent process is skipped.
+    """
+    try:
+        with transaction.atomic():
+            return BadgeToUser.objects.bulk_create(awards)
+    except IntegrityError:
+        pass
+    created = []
+    for award in awards:
+        try:
+            with transaction.atomic():
+                award.save()
+        except IntegrityError:
+            continue
+        created.append(award)
+    return created
+
+
+def award_in_bulk(users_by_badge, ignore_message=False):
+    """
+    Awards badges to the users who have completed them.
+
+    :param users_by_badge: dictionary {badge id: iterable of user ids}
+    :param ignore_message: if False, a message is shown to the users who
+                           win a badge on their next request
+                           (see :func:`notify_awards`)
+    :returns: the list of new :class:`.BadgeToUser`
+
+    It runs a constant number of queries per badge if the meta badges
+    implement :meth:`MetaBadge.get_progress_in_bulk`.
+    """
+    user_ids = set()
+    for ids in users_by_badge.values():
+        user_ids.update(ids)
+    users = User.objects.select_related("profile").in_bulk(user_ids)
+    owned = set(BadgeToUser.objects.filter(badge__in=users_by_badge.keys(),
+        user__in=user_ids).values_list("badge", "user"))
+    awards = []
+    for badge_id, ids in users_by_badge.items():
+        meta_badge = registered_badges.get(badge_id)
+        if meta_badge is None:
+            continue
+        # a badge is won only once (see :class:`.BadgeToUser`)
+        candidates = [users[i] for i in ids if i in users and (badge_id, i) not in owned]
+        if not candidates:
+            continue
+        progress = meta_badge.get_progress_in_bulk(candidates)
+        for user in candidates:
+            if meta_badge.get_progress_percentage(progress=progress[user.id]) >= 100:
+                awards.append(BadgeToUser(badge=meta_badge.badge, user=user,
+                    notified=ignore_message))
+    awards = _create_awards(awards)
+    if not ignore_message and awards:
+        UserProfile.objects.filter(user__in=set(a.user_id for a in awards))\
+                .update(unseen_badges=True)
+    for award in awards:
+        meta_badge = registered_badges[award.badge_id]
+        badge_awarded.send(sender=meta_badge, user=award.user, badge=meta_badge.badge)
+    return awards
+
+
+def notify_awards(request):
+    """
+    Shows a message to the user of *request* for each badge they have won
+    and which has not been shown yet (see :class:`.BadgeNotificationMiddleware`).
+
+    It does not query the awards if the profile of the user is not
+    flagged by :func:`award_in_bulk`.
+    """
+    profile = request.user.profile
+    if not profile.unseen_badges:
+        return
+    # the flag is cleared before reading the awards: an award created
+    # after this update flags the profile again
+    profile.unseen_badges = False
+    UserProfile.objects.filter(id=profile.id).update(unseen_badges=False)
+    awards = BadgeToUser.objects.filter(user=request.user, notified=False)
+    for award_id, badge_id in awards.values_list("id", "badge"):
+        # only the request which marks the award shows it
+        if not BadgeToUser.objects.filter(id=award_id, notified=False).update(notified=True):
+            continue
+        meta_badge = registered_badges.get(badge_id)
+        if meta_badge is not None:
+            messages.info(request, _(u"You just got the %s Badge!") % meta_badge.title,
+                fail_silently=True)
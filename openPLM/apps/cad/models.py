@@ -63,7 +63,8 @@ class DrawingController(DocumentController):
         ext = os.path.splitext(doc_file.file.path)[1].lower() 
         if os.path.splitext(doc_file.file.path)[1].lower() == ".pdf":
             handler_cls = HandlersManager.get_best_handler(".pdf")
-            handler = handler_cls(doc_file.file.path, doc_file.filename)
+            handler = handler_cls(doc_file.file.path, doc_file.filename,
+                    getattr(doc_file, "mapped_file", None))
             if handler.is_valid():
                 self.nb_pages = handler.nb_pages
                 self.name = handler.title
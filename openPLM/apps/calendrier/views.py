@@ -1,9 +1,10 @@
 from calendar import HTMLCalendar
-from datetime import date, MAXYEAR
+from datetime import date, datetime, MAXYEAR
 from itertools import groupby
 # the datetime strftime() methods require year >= 1900
 MINYEAR = 1900
 
+from django.utils import timezone
 from django.utils.dates import WEEKDAYS
 from django.utils.html import conditional_escape as esc
 from django.utils.html import strip_tags
@@ -22,6 +23,29 @@ from openPLM.plmapp.utils import r2r
 from openPLM.plmapp.views import display_object_history
 from openPLM.plmapp import models
 
+def get_month_bounds(year, month):
+    """
+    Returns a tuple (first datetime of the month, first datetime of the
+    next month) in the current timezone.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime(year, month, 1), tz)
+    if month == 12:
+        end = datetime(year + 1, 1, 1)
+    else:
+        end = datetime(year, month + 1, 1)
+    return start, timezone.make_aware(end, tz)
+
+def get_month_timeline(user, year, month):
+    """
+    Returns the list of histories of the timeline of *user* during
+    the month *month* of *year*, sorted by date.
+    """
+    start, end = get_month_bounds(year, month)
+    histories = models.timeline_histories(user, end, start)
+    histories.reverse()
+    return histories
+
 def parse_date(year, month):
     """ Parse *year* and *month* (string, integer or None) and
     returns a tuple of int (*year*, *month*).
@@ -198,16 +222,17 @@ def history_calendar(request, year=None, month=None, obj_type="-", obj_ref="-",
     obj, ctx = get_generic_data(request, obj_type, obj_ref, obj_revi)
     if timeline:
         hcls = TimelineCalendar
-        histories = models.timeline_histories(request.user, None, None, None, None)
+        histories = get_month_timeline(request.user, year, month)
         ctx['object_type'] = _("Timeline")
-    elif hasattr(obj, "get_all_revisions"):
-        # display history of all revisions
-        histories = obj.histories
-        hcls = RevisionHistoryCalendar
     else:
-        histories = obj.histories
-        hcls = HistoryCalendar
-    histories = histories.filter(date__year=year, date__month=month).order_by("date")
+        if hasattr(obj, "get_all_revisions"):
+            # display history of all revisions
+            hcls = RevisionHistoryCalendar
+        else:
+            hcls = HistoryCalendar
+        start = get_month_bounds(year, month)[0]
+        histories = obj.histories.filter(date__year=year, date__month=month)\
+                .with_archive(start).order_by("date")
     cal = hcls(histories).formatmonth(year, month)
 
     current_month = date(year=year, month=month, day=1)
@@ -262,7 +287,9 @@ if ICAL_INSTALLED:
         def items(self, obj):
             year = obj.h_year
             month = obj.h_month
-            return obj.histories.filter(date__year=year, date__month=month).order_by("date")
+            start = get_month_bounds(year, month)[0]
+            return obj.histories.filter(date__year=year, date__month=month)\
+                    .with_archive(start).order_by("date")
 
 
         def item_title(self, item):
@@ -292,7 +319,7 @@ if ICAL_INSTALLED:
         def items(self, obj):
             year = obj.h_year
             month = obj.h_month
-            return models.timeline_histories(obj, None, None, None, None).filter(date__year=year, date__month=month).order_by("date")
+            return get_month_timeline(obj, year, month)
 
         def item_title(self, item):
             return strip_tags(item.title)
@@ -12,6 +12,7 @@ from django.core.files.base import ContentFile
 from openPLM.plmapp.views.base import object_to_dict, get_obj_by_id
 from openPLM.plmapp.models import DocumentFile, DelegationLink, Part, ROLE_OWNER, ROLE_NOTIFIED
 from openPLM.plmapp.controllers import PartController
+from openPLM.plmapp.files.deletable import remove_unreferenced_files
 from openPLM.plmapp.references import get_new_reference
 from openPLM.plmapp.tasks import update_indexes
 
@@ -86,9 +87,8 @@ class AssemblyBuilder(object):
         try:
             native = self._build(tree, native_files, step_files)
         except:
-            # remove added files
-            for path in self._files:
-                os.remove(path)
+            # remove added files (stored files may be shared)
+            remove_unreferenced_files(self._files)
             raise
         return native
 
@@ -129,9 +129,8 @@ class AssemblyBuilder(object):
         try:
             native = self._update(tree, native_files, step_files)
         except:
-            # remove added files
-            for path in self._files:
-                os.remove(path)
+            # remove added files (stored files may be shared)
+            remove_unreferenced_files(self._files)
             raise
         return native
 
@@ -178,7 +177,7 @@ class AssemblyBuilder(object):
         # no thumbnail
         doc.checkin(df, fake_file, True, False)
         self.added_files.append(df)
-        self._files.append(df.file.path)
+        self._files.append(df.file.name)
         if self._lock:
             doc.lock(df)
 
@@ -187,7 +186,7 @@ class AssemblyBuilder(object):
         filename = df.filename.lower()
         doc.checkin(df, self._native_files[filename])
         self.added_files.append(df)
-        self._files.append(df.file.path)
+        self._files.append(df.file.name)
         if self._lock:
             doc.lock(df)
         return df
@@ -197,7 +196,7 @@ class AssemblyBuilder(object):
         filename = df.filename.lower()
         doc.checkin(df, self._step_files[filename])
         self.added_files.append(df)
-        self._files.append(df.file.path)
+        self._files.append(df.file.name)
         if self._lock:
             doc.lock(df)
 
@@ -274,7 +273,7 @@ class AssemblyBuilder(object):
         filename = node["native"].lower()
         df = doc.add_file(self._native_files[filename])
         self.added_files.append(df)
-        self._files.append(df.file.path)
+        self._files.append(df.file.name)
         return df
 
     def _add_step_file(self, doc, node):
@@ -282,7 +281,7 @@ class AssemblyBuilder(object):
         # the thumbnail is generated by handle_step_file
         df = doc.add_file(self._step_files[filename], True, False)
         self.added_files.append(df)
-        self._files.append(df.file.path)
+        self._files.append(df.file.name)
         if self._lock:
             doc.lock(df)
         return df
@@ -295,7 +294,7 @@ class AssemblyBuilder(object):
         # no thumbnail
         df = doc.add_file(fake_file, True, False)
         self.added_files.append(df)
-        self._files.append(df.file.path)
+        self._files.append(df.file.name)
         if self._lock:
             doc.lock(df)
         return df
@@ -166,15 +166,15 @@ class ECRController(Controller):
 
     def approve_promotion(self):
         if self.object.is_promotable():
-            lcl = self.lifecycle.to_states_list()
-            role = level_to_sign_str(lcl.index(self.state.name))
+            info = models.get_lifecycle_info(self.lifecycle_id)
+            role = level_to_sign_str(info.rank(self.state_id))
             self.check_permission(role)
 
             represented = self.get_represented_approvers()
             if not represented:
                 raise PromotionError()
-            next_state = lcl.next_state(self.state.name)
-            nxt = models.State.objects.get(name=next_state)
+            next_state = info.next_state(self.state_id)
+            nxt = models.get_state(next_state)
             users = list(models.User.objects.filter(id__in=represented))
             for user in users:
                 self.approvals.create(user=user, current_state=self.object.state, next_state=nxt)
@@ -206,19 +206,20 @@ class ECRController(Controller):
         :raise: :exc:`.PermissionError` if the use can not sign :attr:`object`
         """
         if checked or self.object.is_promotable():
-            state = self.object.state
-            lifecycle = self.object.lifecycle
-            lcl = lifecycle.to_states_list()
+            state = self.object.state_id
+            info = models.get_lifecycle_info(self.object.lifecycle_id)
             if not checked:
-                self.check_permission(level_to_sign_str(lcl.index(state.name)))
+                self.check_permission(level_to_sign_str(info.rank(state)))
             try:
-                new_state = lcl.next_state(state.name)
-                self.object.state = models.State.objects.get_or_create(name=new_state)[0]
+                new_state = info.next_state(state)
+                if new_state is None:
+                    raise IndexError()
+                self.object.state = models.get_state(new_state)
                 self.object.save()
                 details = "change state from %(first)s to %(second)s" % \
-                                     {"first" :state.name, "second" : new_state}
+                                     {"first" :state, "second" : new_state}
                 self._save_histo("Promote", details, roles=["sign_"])
-                if self.object.state == lifecycle.official_state:
+                if new_state == info.official_state:
                     self._officialize()
                 #self._update_state_history()
                 self._clear_approvals()
@@ -243,17 +244,18 @@ class ECRController(Controller):
         """
         if not self.is_proposed:
             raise PromotionError()
-        state = self.object.state
-        lifecycle = self.object.lifecycle
-        lcl = lifecycle.to_states_list()
+        state = self.object.state_id
+        info = models.get_lifecycle_info(self.object.lifecycle_id)
         try:
-            new_state = lcl.previous_state(state.name)
-            self.check_permission(level_to_sign_str(lcl.index(new_state)))
-            self.object.state = models.State.objects.get_or_create(name=new_state)[0]
+            new_state = info.previous_state(state)
+            if new_state is None:
+                raise IndexError()
+            self.check_permission(level_to_sign_str(info.rank(new_state)))
+            self.object.state = models.get_state(new_state)
             self.object.save()
             self._clear_approvals()
             details = "change state from %(first)s to %(second)s" % \
-                    {"first" :state.name, "second" : new_state}
+                    {"first" :state, "second" : new_state}
             self._save_histo("Demote", details, roles=["sign_"])
             #self._update_state_history()
         except IndexError:
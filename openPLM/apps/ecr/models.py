@@ -117,7 +117,7 @@ class ECR(models.Model, pmodels.IObject):
         Returns True if the object's state is the last state of its lifecycle.
         """
         self._promotion_errors = ErrorList()
-        if self.lifecycle.last_state == self.state:
+        if pmodels.get_lifecycle_info(self.lifecycle_id).last_state == self.state_id:
             self._promotion_errors.append(_(u"The object is at its last state."))
             return False
         return True
@@ -153,16 +153,14 @@ class ECR(models.Model, pmodels.IObject):
         """
         if self.is_cancelled or self.is_draft:
             return False
-        lcs = self.lifecycle.lifecyclestates_set.only("rank")
-        current_rank = lcs.get(state=self.state).rank
-        official_rank = lcs.get(state=self.lifecycle.official_state).rank
-        return current_rank < official_rank
+        info = pmodels.get_lifecycle_info(self.lifecycle_id)
+        return info.rank(self.state_id) < info.official_rank
 
     @property
     @pmodels.cache_lifecycle_stuff
     def is_cancelled(self):
         """ True if the object is cancelled. """
-        return self.lifecycle == pmodels.get_cancelled_lifecycle()
+        return pmodels.get_lifecycle_info(self.lifecycle_id).is_cancelled
 
     @property
     @pmodels.cache_lifecycle_stuff
@@ -174,13 +172,15 @@ class ECR(models.Model, pmodels.IObject):
     @pmodels.cache_lifecycle_stuff
     def is_official(self):
         u"Returns True if object is official."""
-        return not self.is_cancelled and self.state == self.lifecycle.official_state
+        info = pmodels.get_lifecycle_info(self.lifecycle_id)
+        return not info.is_cancelled and self.state_id == info.official_state
 
     @property
     @pmodels.cache_lifecycle_stuff
     def is_draft(self):
         u""" Returns True if the object is a draft. """
-        return not self.is_cancelled and self.state == self.lifecycle.first_state
+        info = pmodels.get_lifecycle_info(self.lifecycle_id)
+        return not info.is_cancelled and self.state_id == info.first_state
 
     @pmodels.cache_lifecycle_stuff
     def get_current_sign_level(self):
@@ -188,8 +188,7 @@ class ECR(models.Model, pmodels.IObject):
         Returns the current sign level that a user must have to promote this
         object.
         """
-        rank = pmodels.LifecycleStates.objects.get(state=self.state,
-                            lifecycle=self.lifecycle).rank
+        rank = pmodels.get_lifecycle_registry().rank(self.state_id, self.lifecycle_id)
         return level_to_sign_str(rank)
 
     @pmodels.cache_lifecycle_stuff
@@ -198,8 +197,7 @@ class ECR(models.Model, pmodels.IObject):
         Returns the current sign level that a user must have to demote this
         object.
         """
-        rank = pmodels.LifecycleStates.objects.get(state=self.state,
-                            lifecycle=self.lifecycle).rank
+        rank = pmodels.get_lifecycle_registry().rank(self.state_id, self.lifecycle_id)
         return level_to_sign_str(rank - 1)
 
     @property
@@ -234,8 +232,7 @@ class ECR(models.Model, pmodels.IObject):
         return ["name", "description"]
 
     def get_current_signer_role(self):
-        lcl = self.lifecycle.to_states_list()
-        return level_to_sign_str(lcl.index(self.state.name))
+        return level_to_sign_str(pmodels.get_lifecycle_info(self.lifecycle_id).rank(self.state_id))
 
     def get_current_signers(self):
         role = self.get_current_signer_role()
@@ -244,9 +241,8 @@ class ECR(models.Model, pmodels.IObject):
     def get_approvers(self):
         if self.is_official or self.is_cancelled:
             return self.approvals.none()
-        lcl = self.lifecycle.to_states_list()
-        next_state = lcl.next_state(self.state.name)
-        approvers = self.approvals.now().filter(current_state=self.state,
+        next_state = pmodels.get_lifecycle_info(self.lifecycle_id).next_state(self.state_id)
+        approvers = self.approvals.now().filter(current_state=self.state_id,
                 next_state=next_state).values_list("user", flat=True)
         return approvers
 
@@ -69,7 +69,8 @@ class OfficeDocumentController(DocumentController):
     def handle_added_file(self, doc_file):
         if os.path.splitext(doc_file.file.path)[1].lower() == ".odt":
             handler_cls = HandlersManager.get_best_handler(".odt")
-            handler = handler_cls(doc_file.file.path, doc_file.filename)
+            handler = handler_cls(doc_file.file.path, doc_file.filename,
+                    getattr(doc_file, "mapped_file", None))
             if handler.is_valid():
                 self.nb_pages = handler.nb_pages
                 self.format = handler.format
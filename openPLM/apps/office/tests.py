@@ -50,6 +50,16 @@ class OfficeTest(DocumentControllerTest):
         self.assertTrue(f2.file.path.endswith(".odt"))
         self.controller.delete_file(f2)
 
+    def test_checkin_odt(self):
+        # the check-in updates the fields like add_file
+        f2 = self.controller.add_file(self.get_file("plop.odt"), False)
+        f = file("datatests/office_a4_3p.odt", "rb")
+        self.controller.checkin(f2, File(f, "plop.odt"))
+        self.assertEquals(self.controller.nb_pages, 3)
+        self.assertEquals(self.controller.format, "A4")
+        f2 = self.controller.files.all()[0]
+        self.controller.delete_file(f2)
+
     def test_add_odt2(self):
         # fake odt
         # No exceptions should be raised
@@ -182,6 +182,15 @@ class Backend(object):
         """
         raise NotImplementedError()
 
+    def dav_get_file(self, path):
+        """
+        Return a tuple (readable file object, size, ETag, path of the
+        stored file). Size, ETag and path may be None if they are unknown.
+
+        .. versionadded:: 2.0
+        """
+        return self.dav_get(path), None, None, None
+
     def dav_head(self, path):
         """
         Not sure yet! FIXME!!!
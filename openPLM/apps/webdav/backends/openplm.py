@@ -37,6 +37,7 @@ from openPLM.apps.webdav.backends import BackendResourceNotFoundException
 
 from openPLM.plmapp.models import get_all_documents, Document, DocumentFile, docfs
 from openPLM.plmapp.views.base import get_obj
+from openPLM.plmapp.utils.fileresponse import get_etag
 
 
 logger = logging.getLogger("webdav")
@@ -206,6 +207,9 @@ class OpenPLMBackend(Backend):
         raise NotImplementedError()
 
     def dav_get(self, path):
+        return self.dav_get_file(path)[0]
+
+    def dav_get_file(self, path):
         d, p = self.get_doc(path)
         if len(p) != 1:
             raise BackendResourceNotFoundException(path)
@@ -214,9 +218,12 @@ class OpenPLMBackend(Backend):
         try:
             f, size = d.get_content_and_size(df)
             logger.debug("opened file '%s' for reading"%p)
-            return f
         except IOError, ioe:
             raise BackendIOException(ioe)
+        stored = df.file.path
+        if getattr(f, "name", None) == stored:
+            return f, size, get_etag(df, size), stored
+        return f, size, None, None
 
     def dav_head(self, path):
         ctrl, p = self.get_doc(path)
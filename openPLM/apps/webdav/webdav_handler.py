@@ -36,6 +36,7 @@ from openPLM.apps.webdav.util import get_propfind_properties_from_xml
 from openPLM.apps.webdav.util import get_multistatus_response_xml
 from openPLM.apps.webdav.util import get_lock_response_xml
 from openPLM.apps.webdav.util import format_http_datetime
+from openPLM.plmapp.utils.fileresponse import serve_file
 
 
 logger = logging.getLogger("webdav")
@@ -193,9 +194,10 @@ class WebDavHandler(object):
 
     def handle_get(self, request):
         path = self.get_final_path_part(request.path)
-        f = self.backend.dav_get(path)
-        response = StreamingHttpResponse(f, None, 200, "text/plain")
-        return response
+        f, size, etag, stored = self.backend.dav_get_file(path)
+        if size is None:
+            return StreamingHttpResponse(f, None, 200, "text/plain")
+        return serve_file(request, f, size, "text/plain", etag, stored)
 
     def handle_head(self, request):
         path = self.get_final_path_part(request.path)
@@ -0,0 +1,210 @@
+############################################################################
+# openPLM - open source PLM
+# Copyright 2010 Philippe Joulaud, Pierre Cosquer
+#
+# This file is part of openPLM.
+#
+#    openPLM is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    openPLM is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with openPLM.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Contact :
+#    Philippe Joulaud : ninoo.fr@gmail.com
+#    Pierre Cosquer : pcosquer@linobject.com
+################################################################################
+
+"""
+.. versionadded:: 2.0
+
+This module provides a cache of BOM snapshots used by
+:meth:`.PartController.get_bom` and :meth:`.PartController.cmp_bom`.
+
+A BOM at a past date never changes (links and state histories are never
+modified, they are only ended), so it is cached without any invalidation.
+A transaction may however commit links and states dated from its start,
+so a date is considered as past once it is older than ``BOM_CACHE_PAST_DELAY``
+seconds (one hour by default).
+
+A BOM at the current time is cached with the version of the part
+(:attr:`.Part.bom_version`). The version is stored in the database so that
+all processes see the same version whatever the cache backend is. A new
+random version is given to a part and to all its ancestors
+(see :func:`invalidate`) when one of the following objects is saved:
+
+    * a :class:`.ParentChildLink` (the parent is invalidated)
+    * a :class:`.DocumentPartLink` (the part is invalidated)
+    * a :class:`.StateHistory` (the object, its alternates and, if it is
+      a document, its attached parts are invalidated)
+    * an :class:`.AlternatePartSet` (its parts are invalidated)
+
+Updates made with :meth:`~django.db.models.query.QuerySet.update` do not
+send signals, callers must call :func:`invalidate` themselves.
+
+Snapshots only contain ids and plain values (links, states, extension
+data). Parts and documents are fetched again (in two queries) each time
+a snapshot is read so that a modified object (a new name for example)
+is never displayed with its old values.
+
+The timeout (in seconds) can be set with the ``BOM_CACHE_TIMEOUT``
+setting (one week by default).
+"""
+
+import calendar
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, m2m_changed
+from django.utils import timezone
+
+from openPLM.plmapp import models
+
+#: timeout of cached BOMs (in seconds)
+TIMEOUT = getattr(settings, "BOM_CACHE_TIMEOUT", 60 * 60 * 24 * 7)
+#: age (in seconds) of a date before its BOMs are cached
+PAST_DELAY = getattr(settings, "BOM_CACHE_PAST_DELAY", 60 * 60)
+
+def get_key(part_id, date, *options):
+    """
+    Returns the cache key of the BOM of *part_id* at time *date*
+    (None means now). *options* are the other arguments given to
+    :meth:`.PartController.get_bom`.
+
+    Returns None if *date* is not older than :const:`PAST_DELAY` seconds
+    or if *part_id* has no version: such a BOM must not be cached.
+    """
+    if date is None:
+        version = models.Part.objects.filter(id=part_id).values_list("bom_version",
+                flat=True).first()
+        if not version:
+            return None
+        date_key = "now%s" % version
+    elif date < timezone.now() - datetime.timedelta(seconds=PAST_DELAY):
+        date_key = "%d.%06d" % (calendar.timegm(date.utctimetuple()), date.microsecond)
+    else:
+        return None
+    return "bom:%d:%s:%s" % (part_id, date_key, ":".join(str(o) for o in options))
+
+def get_snapshot(key):
+    """
+    Returns the BOM cached with *key* (a dictionary returned by
+    :meth:`.PartController.get_bom` without its ``obj`` entry),
+    or None if it is not cached or if one of its objects has been deleted.
+    """
+    if key is None:
+        return None
+    data = cache.get(key)
+    if data is None:
+        return None
+    return _load(data)
+
+def set_snapshot(key, bom):
+    """
+    Caches *bom* (a dictionary returned by :meth:`.PartController.get_bom`
+    without its ``obj`` entry).
+    """
+    if key is not None:
+        cache.set(key, _dump(bom), TIMEOUT)
+
+def _dump(bom):
+    """
+    Returns a copy of *bom* which contains only ids and plain values.
+    """
+    data = dict(bom)
+    fields = [f.attname for f in models.ParentChildLink._meta.concrete_fields]
+    data["children"] = [(c.level, tuple(getattr(c.link, f) for f in fields))
+            for c in bom["children"]]
+    data["link_fields"] = fields
+    for name in ("documents", "alternates"):
+        data[name] = dict((part_id, [o.id for o in objects])
+                for part_id, objects in bom[name].items())
+    return data
+
+def _load(data):
+    """
+    Rebuilds a BOM dumped by :func:`_dump`: parts and documents are fetched
+    in two queries. Returns None if an object does not exist anymore.
+    """
+    from openPLM.plmapp.controllers.part import Child
+    bom = dict(data)
+    fields = bom.pop("link_fields")
+    child_index = fields.index("child_id")
+    part_ids = set(values[child_index] for level, values in data["children"])
+    doc_ids = set()
+    for ids in data["alternates"].values():
+        part_ids.update(ids)
+    for ids in data["documents"].values():
+        doc_ids.update(ids)
+    parts = models.Part.objects.select_related("state", "lifecycle").in_bulk(part_ids)
+    documents = models.Document.objects.select_related("state").in_bulk(doc_ids)
+    if len(parts) != len(part_ids) or len(documents) != len(doc_ids):
+        return None
+    bom["children"] = children = []
+    for level, values in data["children"]:
+        link = models.ParentChildLink.from_db(None, fields, values)
+        link.child = parts[link.child_id]
+        children.append(Child(level, link))
+    for name, objects in (("documents", documents), ("alternates", parts)):
+        bom[name] = defaultdict(list, ((part_id, [objects[i] for i in ids])
+            for part_id, ids in data[name].items()))
+    return bom
+
+def invalidate(part_ids):
+    """
+    Invalidates the current BOMs of the parts *part_ids* and of all
+    their ancestors.
+    """
+    ids = set(part_ids)
+    if not ids:
+        return
+    ids.update(models.ParentChildClosure.get_related_ids(ids, "parent"))
+    models.Part.objects.filter(id__in=ids).update(bom_version=models.new_bom_version())
+
+def invalidate_plmobjects(plmobject_ids):
+    """
+    Invalidates the current BOMs that may display the states of
+    *plmobject_ids*: BOMs of the objects, of their alternates and of
+    the parts attached to them (if they are documents).
+
+    It must be called after a :meth:`~django.db.models.query.QuerySet.bulk_create`
+    of :class:`.StateHistory`.
+    """
+    ids = list(plmobject_ids)
+    ids.extend(models.AlternatePartSet.get_related_parts(ids))
+    links = models.DocumentPartLink.current_objects.filter(document__in=plmobject_ids)
+    ids.extend(links.values_list("part", flat=True))
+    invalidate(ids)
+
+def _parentchildlink_saved(sender, instance, **kwargs):
+    invalidate([instance.parent_id])
+
+def _documentpartlink_saved(sender, instance, **kwargs):
+    invalidate([instance.part_id])
+
+def _statehistory_saved(sender, instance, **kwargs):
+    invalidate_plmobjects([instance.plmobject_id])
+
+def _alternatepartset_saved(sender, instance, **kwargs):
+    if instance.pk:
+        invalidate(instance.parts.values_list("id", flat=True))
+
+def _alternatepartset_parts_changed(sender, instance, action, pk_set, **kwargs):
+    if action in ("post_add", "post_remove") and pk_set:
+        invalidate(pk_set)
+
+post_save.connect(_parentchildlink_saved, sender=models.ParentChildLink)
+post_save.connect(_documentpartlink_saved, sender=models.DocumentPartLink)
+post_save.connect(_statehistory_saved, sender=models.StateHistory)
+post_save.connect(_alternatepartset_saved, sender=models.AlternatePartSet)
+m2m_changed.connect(_alternatepartset_parts_changed,
+        sender=models.AlternatePartSet.parts.through)
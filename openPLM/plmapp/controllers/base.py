@@ -36,7 +36,7 @@ from django.core.exceptions import FieldDoesNotExist
 
 import openPLM.plmapp.models as models
 from openPLM.plmapp.exceptions import PermissionError
-from openPLM.plmapp.mail import send_histories_mail
+from openPLM.plmapp.mail import queue_histories
 
 _controller_rx = re.compile(r"(?P<type>\w+)Controller")
 
@@ -204,8 +204,7 @@ class Controller(object):
         if self._user not in users:
             blacklist += (self._user.email,)
         roles = [models.ROLE_OWNER] + list(roles)
-        self._send_mail(send_histories_mail, self.object, roles, action, [h],
-                self._user, blacklist, users)
+        self._send_mail(queue_histories, [h], roles, blacklist, users)
 
     def get_verbose_name(self, attr_name):
         """
@@ -39,17 +39,19 @@ from openPLM.plmapp.controllers.plmobject import PLMObjectController
 from openPLM.plmapp.controllers.base import get_controller
 from openPLM.plmapp.thumbnailers import generate_thumbnail
 from openPLM.plmapp.files.formats import native_to_standards
+from openPLM.plmapp.files.content import sniff_type, read_header, map_file
 from openPLM.plmapp.files.deletable import (get_deletable_files, ON_CHECKIN_SELECTORS,
-        ON_DEPRECATE_SELECTORS, ON_DELETE_SELECTORS, ON_CANCEL_SELECTORS)
+        ON_DEPRECATE_SELECTORS, ON_DELETE_SELECTORS, ON_CANCEL_SELECTORS,
+        remove_unreferenced_files)
 from openPLM.plmapp.tasks import update_indexes
 
 
 @task
 def delete_old_files(doc_file_pk, selectors):
     doc_file = models.DocumentFile.objects.get(id=doc_file_pk)
+    names = []
     for df in get_deletable_files(doc_file, selectors):
-        os.chmod(df.file.path, Oo700)
-        os.remove(df.file.path)
+        names.append(df.file.name)
         if df.thumbnail:
             df.thumbnail.delete(save=False)
             df.thumbnail = None
@@ -58,6 +60,24 @@ def delete_old_files(doc_file_pk, selectors):
         df.deleted = True
         df.deprecated = True
         df.save()
+    # stored files may be shared with other revisions
+    remove_unreferenced_files(names)
+
+
+def set_content_info(doc_file, f=None):
+    """
+    .. versionadded:: 2.0
+
+    Sets :attr:`.DocumentFile.sha256` and :attr:`.DocumentFile.mimetype`
+    of *doc_file* (not saved). *f* is the saved file, its ``header``
+    attribute (see :class:`.VaultUploadedFile`) is used if it is present
+    so that the stored file is not read again.
+    """
+    doc_file.sha256 = models.docfs.get_digest(doc_file.file.name)
+    header = getattr(f, "header", None)
+    if header is None:
+        header = read_header(doc_file.file.path)
+    doc_file.mimetype = sniff_type(header, doc_file.filename)
 
 
 class DocumentController(PLMObjectController):
@@ -77,8 +97,10 @@ class DocumentController(PLMObjectController):
             if any(pf.creator != user for pf in private_files):
                 raise PermissionError("Not your file")
             for pf in private_files:
-                doc_file = models.DocumentFile.objects.create(filename=pf.filename, size=pf.size,
-                    file=pf.file.path, document=obj.object)
+                doc_file = models.DocumentFile(filename=pf.filename, size=pf.size,
+                    file=pf.file.name, document=obj.object)
+                set_content_info(doc_file)
+                doc_file.save()
                 generate_thumbnail.delay(doc_file.id)
                 # django < 1.2.5 deletes the file when pf is deleted
                 pf.file = ""
@@ -90,7 +112,7 @@ class DocumentController(PLMObjectController):
                 else:
                     raise ValueError("invalid template")
             for df in obj.files:
-                obj.handle_added_file(df)
+                obj._handle_added_file(df)
         return obj
 
     def has_standard_related_locked(self, new_filename):
@@ -211,6 +233,7 @@ class DocumentController(PLMObjectController):
 
         doc_file = models.DocumentFile(filename=f.name, size=f.size,
                         file=models.docfs.save(f.name,f), document=self.object)
+        set_content_info(doc_file, f)
         doc_file.no_index = getattr(self.object, "no_index", False)
         doc_file.save()
         self.save(False)
@@ -218,7 +241,7 @@ class DocumentController(PLMObjectController):
         os.chmod(doc_file.file.path, Oo400)
         self._save_histo("added file to ", "file : %s added" % f.name)
         if update_attributes:
-            self.handle_added_file(doc_file)
+            self._handle_added_file(doc_file)
         if thumbnail:
            generate_thumbnail.delay(doc_file.id)
         return doc_file
@@ -297,9 +320,27 @@ class DocumentController(PLMObjectController):
 
         :param doc_file:
         :type doc_file: :class:`.DocumentFile`
+
+        .. versionchanged:: 2.0
+            *doc_file* has a ``mapped_file`` attribute, a read-only memory
+            map of its content (or None if the file is empty) which should
+            be given to :class:`.FileHandler` instances.
         """
         pass
 
+    def _handle_added_file(self, doc_file):
+        """
+        Calls :meth:`handle_added_file` with a memory map of *doc_file*
+        shared by all file handlers.
+        """
+        doc_file.mapped_file = map_file(doc_file.file.path)
+        try:
+            self.handle_added_file(doc_file)
+        finally:
+            if doc_file.mapped_file is not None:
+                doc_file.mapped_file.close()
+            doc_file.mapped_file = None
+
     def attach_to_part(self, part):
         """
         Links *part* (a :class:`.Part`) with
@@ -417,13 +458,18 @@ class DocumentController(PLMObjectController):
             return models.Part.objects.none()
 
     def copy_files(self, src):
+        """
+        Copies the files of *src* (a document) to the document.
+
+        .. versionchanged:: 2.0
+            Stored files are shared with *src* instead of being copied,
+            only thumbnails are copied.
+        """
         for doc_file in src.files.all():
             filename = doc_file.filename
-            path = models.docfs.get_available_name(filename.encode("utf-8"))
-            shutil.copy(doc_file.file.path, models.docfs.path(path))
-            new_doc = models.DocumentFile.objects.create(file=path,
-                filename=filename, size=doc_file.size, document=self.object)
-            os.chmod(new_doc.file.path, Oo400)
+            new_doc = models.DocumentFile.objects.create(file=doc_file.file.name,
+                filename=filename, size=doc_file.size, sha256=doc_file.sha256,
+                mimetype=doc_file.mimetype, document=self.object)
             new_doc.thumbnail = doc_file.thumbnail
             if doc_file.thumbnail:
                 ext = os.path.splitext(doc_file.thumbnail.path)[1]
@@ -468,6 +514,10 @@ class DocumentController(PLMObjectController):
                          in :meth:`add_file`
         :param update_attributes: True if :meth:`handle_added_file` should be
                                   called
+
+        .. versionchanged:: 2.0
+            The deprecated revision shares the stored file of *doc_file*
+            instead of copying it.
         """
         self.check_edit_files()
         if doc_file.document.pk != self.object.pk:
@@ -490,8 +540,10 @@ class DocumentController(PLMObjectController):
                     document=self.object,
                     deprecated=True,
                     size=doc_file.size,
+                    sha256=doc_file.sha256,
+                    mimetype=doc_file.mimetype,
                     filename=doc_file.filename,
-                    file=models.docfs.save(new_file.name, doc_file.file),
+                    file=doc_file.file.name,
                     thumbnail=None,
                     ctime=doc_file.ctime,
                     revision=doc_file.revision,
@@ -506,6 +558,7 @@ class DocumentController(PLMObjectController):
         # update the doc_file
         doc_file.file = models.docfs.save(new_file.name, new_file)
         doc_file.size = new_file.size
+        set_content_info(doc_file, new_file)
         doc_file.previous_revision = deprecated_df
         doc_file.revision += 1
         doc_file.ctime = now
@@ -516,7 +569,7 @@ class DocumentController(PLMObjectController):
         self._delete_old_files(doc_file, ON_CHECKIN_SELECTORS)
         self._save_histo("checked-in ", doc_file.filename)
         if update_attributes:
-            self.handle_added_file(doc_file)
+            self._handle_added_file(doc_file)
         if thumbnail:
             generate_thumbnail.delay(doc_file.id)
 
@@ -21,12 +21,13 @@
 #    Philippe Joulaud : ninoo.fr@gmail.com
 #    Pierre Cosquer : pcosquer@linobject.com
 ################################################################################
+import bisect
 import difflib
 #from itertools import imap, izip_longest, groupby
 from operator import attrgetter, itemgetter
 from collections import namedtuple, defaultdict
-from itertools import zip_longest, groupby
-from django.db import transaction
+from itertools import zip_longest, groupby, count
+from django.db import transaction, connection
 from django.db.models.query import Q
 from django.utils import timezone
 import openPLM.plmapp.models as models
@@ -37,6 +38,8 @@ from openPLM.plmapp.files.formats import is_cad_file
 from openPLM.plmapp.exceptions import PermissionError, PromotionError
 from openPLM.plmapp.tasks import update_indexes
 from openPLM.plmapp.utils import level_to_sign_str
+from openPLM.plmapp.mail import queue_histories
+from openPLM.plmapp import bom_cache, permissions
 
 Child = namedtuple("Child", "level link")
 Parent = namedtuple("Parent", "level link")
@@ -52,11 +55,11 @@ def flatten_bom(data):
         flatten.append(("document", doc, data["states"][doc.id]))
     for part in data["alternates"][data["obj"].id]:
         flatten.append(("alternate", part, data["states"][part.id]))
-    for child in data["children"]:
+    for child, path in zip(data["children"], data["paths"]):
         link = child.link
         ext_data = data["extension_data"][link.id]
         ext = tuple(ext_data.get(key, "") for key, name in data["extra_columns"])
-        flatten.append(("part", child, data["states"].get(link.child_id), ext))
+        flatten.append(("part", child, data["states"].get(link.child_id), ext, path))
         for doc in data["documents"][link.child_id]:
             flatten.append(("document", doc, data["states"].get(doc.id)))
         for part in data["alternates"][link.child_id]:
@@ -64,6 +67,139 @@ def flatten_bom(data):
     return flatten
 
 
+def get_bom_paths(children):
+    """
+    .. versionadded:: 2.0
+
+    Returns the list of paths of *children*, a complete depth-first list
+    of :class:`Child` (see :meth:`.PartController.get_children`). A path is
+    the tuple of child ids of the chain of links from the top assembly
+    to the child.
+    """
+    paths = []
+    path = ()
+    for child in children:
+        path = path[:child.level - 1] + (child.link.child_id,)
+        paths.append(path)
+    return paths
+
+def _bom_row_keys(rows):
+    """
+    Returns a list of (key, signature) for each row of a flattened BOM
+    (see :func:`flatten_bom`).
+
+    The key identifies a row: a part is identified by its path
+    (see :func:`get_bom_paths`), a document or an alternate part by its id
+    and the path of its part. The signature is a tuple of plain values
+    which differs if the row has been modified.
+
+    Keys are unique: the link id is added to the key of a part which
+    is linked twice to the same parent.
+    """
+    keys = []
+    seen = set()
+    path = ()
+    for row in rows:
+        if row[0] == "part":
+            child = row[1]
+            link = child.link
+            path = row[4]
+            key = ("part", path)
+            if key in seen:
+                key = ("part", path, link.id)
+            signature = (child.level, link.quantity, link.unit, link.order,
+                    row[2], row[3])
+        else:
+            key = (row[0], path, row[1].id)
+            signature = (row[2],)
+        seen.add(key)
+        keys.append((key, signature))
+    return keys
+
+
+def diff_flat_boms(s1, s2):
+    """
+    .. versionadded:: 2.0
+
+    Compares two flattened BOMs (see :func:`flatten_bom`) in linear time.
+
+    Rows are matched by their path (see :func:`_bom_row_keys`)
+    instead of by a longest common subsequence like
+    :class:`difflib.SequenceMatcher`.
+
+    Returns a list of (tag, list of (row1, row2)) where tag is one of:
+
+        ``equal``
+            unchanged rows
+        ``replace``
+            modified rows (quantity, unit, order, state, ...)
+        ``move``
+            rows whose position has changed
+        ``delete``
+            rows only in *s1* (row2 is None)
+        ``insert``
+            rows only in *s2* (row1 is None)
+    """
+    keys1 = _bom_row_keys(s1)
+    keys2 = _bom_row_keys(s2)
+    index1 = dict((key, i) for i, (key, sig) in enumerate(keys1))
+    # matches must be distinct for the longest increasing subsequence
+    if len(index1) != len(keys1) or len(set(k for k, sig in keys2)) != len(keys2):
+        raise ValueError("BOM rows are not uniquely keyed")
+    matches = [index1.get(key) for key, sig in keys2]
+    stable = _longest_increasing_subsequence(m for m in matches if m is not None)
+    matched1 = set(m for m in matches if m is not None)
+    result = []
+    def emit(tag, row1, row2):
+        if result and result[-1][0] == tag:
+            result[-1][1].append((row1, row2))
+        else:
+            result.append((tag, [(row1, row2)]))
+    i = 0
+    for j, i1 in enumerate(matches):
+        if i1 is None:
+            emit("insert", None, s2[j])
+        elif i1 not in stable:
+            emit("move", s1[i1], s2[j])
+        else:
+            for k in range(i, i1):
+                if k not in matched1:
+                    emit("delete", s1[k], None)
+            i = i1 + 1
+            tag = "equal" if keys1[i1][1] == keys2[j][1] else "replace"
+            emit(tag, s1[i1], s2[j])
+    for k in range(i, len(s1)):
+        if k not in matched1:
+            emit("delete", s1[k], None)
+    return result
+
+
+def _longest_increasing_subsequence(seq):
+    """
+    Returns the set of values of a longest increasing subsequence
+    of *seq* (a sequence of distinct integers), in O(n log n).
+    """
+    seq = list(seq)
+    tails = [] # tails[k]: smallest tail of an increasing subsequence of length k+1
+    tail_indexes = []
+    previous = []
+    for n, value in enumerate(seq):
+        k = bisect.bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_indexes.append(n)
+        else:
+            tails[k] = value
+            tail_indexes[k] = n
+        previous.append(tail_indexes[k - 1] if k else None)
+    result = set()
+    n = tail_indexes[-1] if tail_indexes else None
+    while n is not None:
+        result.add(seq[n])
+        n = previous[n]
+    return result
+
+
 def get_last_children(children):
     previous_level = 0
     last_children = []
@@ -75,6 +211,218 @@ def get_last_children(children):
     return last_children
 
 
+#: database vendors that support ``WITH RECURSIVE`` common table expressions
+RECURSIVE_CTE_VENDORS = ("postgresql", "sqlite")
+
+_BOM_NODES_QUERY = """{column} IN (
+    WITH RECURSIVE bom_nodes(id) AS (
+        SELECT %s
+        UNION
+        SELECT l.{next} FROM {table} l
+            INNER JOIN bom_nodes ON l.{prev} = bom_nodes.id
+            WHERE {alive}
+    )
+    SELECT id FROM bom_nodes
+)"""
+
+def _get_bom_nodes_clause(part_id, direction, date):
+    """
+    Returns a tuple (where clause, params) that can be given to
+    :meth:`~django.db.models.query.QuerySet.extra` to select all
+    links whose parent (if *direction* is ``"child"``) or child (if
+    *direction* is ``"parent"``) is *part_id* or one of its
+    descendants (respectively ancestors) at time *date*.
+    """
+    qn = connection.ops.quote_name
+    table = qn(models.ParentChildLink._meta.db_table)
+    prev, nxt = ("parent_id", "child_id") if direction == "child" \
+            else ("child_id", "parent_id")
+    params = [part_id]
+    if date is None:
+        alive = "l.end_time IS NULL"
+    else:
+        alive = "l.ctime <= %s AND (l.end_time IS NULL OR l.end_time >= %s)"
+        value = connection.ops.adapt_datetimefield_value(date)
+        params.extend((value, value))
+    where = _BOM_NODES_QUERY.format(column="%s.%s" % (table, qn(prev)),
+            table=table, prev=prev, next=nxt, alive=alive)
+    return where, params
+
+def get_bom_links(part_id, direction, max_level=-1, date=None,
+        related=(), only=None):
+    """
+    .. versionadded:: 2.0
+
+    Retrieves all :class:`.ParentChildLink` alive at time *date* that
+    are reachable from the part *part_id*.
+
+    :param direction: ``"child"`` to walk down the BOM (descendants),
+                      ``"parent"`` to walk up (ancestors)
+    :param max_level: maximum depth, ``-1`` means no limit
+
+    Unlimited traversals run only one query (a recursive
+    common table expression) if the database supports it. Otherwise,
+    one query per level is made.
+
+    :return: a dictionary (part id -> list of links) where each list
+             is ordered by :attr:`.ParentChildLink.order`. Keys are
+             parents' ids if *direction* is ``"child"`` and children's
+             ids otherwise.
+    """
+    key = "parent" if direction == "child" else "child"
+    key_id = key + "_id"
+    next_id = direction + "_id"
+    links = models.ParentChildLink.objects.at(date).order_by("order")\
+            .select_related(*related)
+    if only is not None:
+        # fields required to rebuild the tree
+        links = links.only(*(tuple(only) + ("order", "parent", "child")))
+    adjacency = defaultdict(list)
+    if max_level < 0 and connection.vendor in RECURSIVE_CTE_VENDORS:
+        where, params = _get_bom_nodes_clause(part_id, direction, date)
+        for link in links.extra(where=[where], params=params).iterator():
+            adjacency[getattr(link, key_id)].append(link)
+        return adjacency
+    nodes = [part_id]
+    seen = set(nodes)
+    level = 1
+    while nodes and (max_level < 0 or level <= max_level):
+        qs = links.filter(**{key + "__in" : nodes})
+        nodes = []
+        for link in qs.iterator():
+            adjacency[getattr(link, key_id)].append(link)
+            node = getattr(link, next_id)
+            if node not in seen:
+                seen.add(node)
+                nodes.append(node)
+        level += 1
+    return adjacency
+
+def build_bom_tree(part_id, adjacency, direction, cls, max_level=-1):
+    """
+    .. versionadded:: 2.0
+
+    Builds a depth-first ordered list of *cls* (:class:`Child` or
+    :class:`Parent`) tuples from *adjacency*, as returned by
+    :func:`get_bom_links`. This runs in linear time of the size of
+    the result.
+
+    A sub-assembly is expanded each time it appears in the BOM.
+    """
+    next_id = direction + "_id"
+    res = []
+    stack = [(1, link) for link in reversed(adjacency.get(part_id, ()))]
+    while stack:
+        level, link = stack.pop()
+        res.append(cls(level, link))
+        if max_level < 0 or level < max_level:
+            links = adjacency.get(getattr(link, next_id), ())
+            stack.extend((level + 1, l) for l in reversed(links))
+    return res
+
+def prune_unofficial(items, direction, date):
+    """
+    .. versionadded:: 2.0
+
+    Removes unofficial parts (at time *date*) and all their descendants
+    (or ancestors) from *items*, a list returned by :func:`build_bom_tree`.
+    """
+    # retrieves all official parts at *date* and then prunes the
+    # tree so that we only run one query
+    next_id = direction + "_id"
+    ids = set(getattr(item.link, next_id) for item in items)
+    sh = models.StateHistory.objects.at(date).officials().filter(plmobject__in=ids)
+    if date is not None:
+        sh = sh.with_archive(date)
+    valid_ids = set(sh.values_list("plmobject_id", flat=True))
+    res = []
+    # level_threshold is used to cut a "branch" of the tree
+    level_threshold = len(items) + 1 # all levels are inferior to this value
+    for item in items:
+        if item.level > level_threshold:
+            continue
+        if getattr(item.link, next_id) in valid_ids:
+            res.append(item)
+            level_threshold = len(items) + 1
+        else:
+            level_threshold = item.level
+    return res
+
+def get_reachable_parts(ids, direction):
+    """
+    .. versionadded:: 2.0
+
+    Walks the current BOM from the parts *ids*, down (*direction* is
+    ``"child"``) or up (*direction* is ``"parent"``), following also the
+    alternate parts of each visited part.
+
+    This function uses :class:`.ParentChildClosure` so that the number
+    of queries only depends on the number of alternate hops, not on the
+    height of the BOM.
+
+    :return: a tuple (reached ids, alternates ids): ids of the parts
+             reached through a link and ids of the alternate parts of
+             the given and reached parts
+    """
+    closure = models.ParentChildClosure
+    expanded = set(ids)
+    alternates = set(models.AlternatePartSet.get_related_parts(expanded))
+    frontier = expanded | alternates
+    reached = set()
+    while frontier:
+        expanded.update(frontier)
+        new = closure.get_related_ids(frontier, direction) - reached
+        reached.update(new)
+        new_alternates = set(models.AlternatePartSet.get_related_parts(new))
+        alternates.update(new_alternates)
+        frontier = new_alternates - expanded
+    return reached, alternates
+
+def _get_components(graph):
+    """
+    .. versionadded:: 2.0
+
+    Returns a dictionary (node -> index of its strongly connected component)
+    of *graph*, a dictionary (node -> set of successors).
+
+    This is an iterative version of Tarjan's algorithm.
+    """
+    index, low, components = {}, {}, {}
+    stack, on_stack = [], set()
+    counter = count()
+    for root in list(graph):
+        if root in index:
+            continue
+        index[root] = low[root] = next(counter)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = low[succ] = next(counter)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph.get(succ, ()))))
+                    break
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    previous = work[-1][0]
+                    low[previous] = min(low[previous], low[node])
+                if low[node] == index[node]:
+                    while True:
+                        n = stack.pop()
+                        on_stack.discard(n)
+                        components[n] = index[node]
+                        if n == node:
+                            break
+    return components
+
+
 class PartController(PLMObjectController):
     u"""
     Controller for :class:`.Part`.
@@ -142,16 +490,8 @@ class PartController(PLMObjectController):
     def precompute_can_add_child2(self):
         is_owner = self.check_permission("owner", raise_=False)
         if is_owner and self.is_editable:
-            links = models.ParentChildLink.current_objects
-            parents = set([self.id])
-            parents.update(models.AlternatePartSet.get_related_parts(parents))
-            invalid_ids = set(parents)
-            while parents:
-                parents = set(links.filter(child__in=parents).values_list("parent",
-                        flat=True))
-                parents.update(models.AlternatePartSet.get_related_parts(parents))
-                parents.difference_update(invalid_ids)
-                invalid_ids.update(parents)
+            ancestors, alternates = get_reachable_parts([self.id], "parent")
+            invalid_ids = ancestors | alternates
             children = set(self.parentchildlink_parent.now().values_list("child", flat=True))
             children.update(models.AlternatePartSet.get_related_parts(children))
             invalid_ids.update(children)
@@ -199,21 +539,29 @@ class PartController(PLMObjectController):
         :raises: :exc:`.PermissionError` if :attr:`_user` is not the owner of
             :attr:`object`.
         :raises: :exc:`.PermissionError` if :attr:`object` is not editable.
+
+        .. versionchanged:: 2.0
+            the BOM is locked (see :meth:`.ParentChildClosure.lock_parts`)
+            before it is checked so that a concurrent transaction can not
+            create a cycle
         """
 
         if isinstance(child, PLMObjectController):
             child = child.object
-        self.check_add_child(child)
-        if order < 0 or quantity < 0:
-            raise ValueError("Quantity or order is negative")
-        # data are valid : create the link
-        link = models.ParentChildLink()
-        link.parent = self.object
-        link.child = child
-        link.quantity = quantity
-        link.order = order
-        link.unit = unit
-        link.save()
+        with transaction.atomic():
+            models.ParentChildClosure.lock_parts([self.object.id], [child.id])
+            self.check_add_child(child)
+            if order < 0 or quantity < 0:
+                raise ValueError("Quantity or order is negative")
+            # data are valid : create the link
+            link = models.ParentChildLink()
+            link.parent = self.object
+            link.child = child
+            link.quantity = quantity
+            link.order = order
+            link.unit = unit
+            link.save()
+            models.ParentChildClosure.add_link(link)
         # handle plces
         for PCLE in models.get_PCLEs(self.object):
             name = PCLE._meta.module_name
@@ -225,6 +573,174 @@ class PartController(PLMObjectController):
                          "parent : %s (%s//%s//%s) => child : %s (%s//%s//%s), quantity : %s %s, order : %s" % (self.object.name, self.object.type, self.object.reference, self.object.revision, child.name, child.type, child.reference, child.revision, link.quantity, link.unit, link.order))
         return link
 
+    @classmethod
+    def check_add_children(cls, links, user):
+        """
+        .. versionadded:: 2.0
+
+        Checks, like :meth:`check_add_child`, that *user* can create
+        *links*, a list of unsaved :class:`.ParentChildLink` whose parent
+        and child are set.
+
+        The proposed BOM is checked at once, the number of queries does not
+        depend on the number of links: cycles are detected on a graph
+        of the current BOM and the new links where alternate parts are
+        merged.
+
+        :return: a dictionary (index of an invalid link -> list of errors)
+        """
+        errors = defaultdict(list)
+        if not links:
+            return errors
+        parents = dict((link.parent_id, link.parent) for link in links)
+        children = dict((link.child_id, link.child) for link in links)
+
+        # permissions
+        context = permissions.get_context(user)
+        activated = context is None
+        if activated:
+            context = permissions.activate(user)
+        try:
+            context.prefetch(parents.keys())
+            approved = set(models.PromotionApproval.current_objects.filter(
+                plmobject__in=parents.keys()).values_list("plmobject", flat=True))
+            owned = set(p.id for p in parents.values()
+                if get_controller(p.type)(p, user).check_permission("owner", False))
+            readable = set(c.id for c in permissions.filter_readable(user, children.values()))
+        finally:
+            if activated:
+                permissions.deactivate(user)
+
+        # current BOM, alternate parts are merged in a single node
+        ids = set(parents) | set(children)
+        reached, alternates = get_reachable_parts(ids, "child")
+        nodes = ids | reached | alternates
+        through = models.AlternatePartSet.parts.through
+        partsets = dict(through.objects.filter(alternatepartset__end_time=None,
+            part__in=nodes).values_list("part", "alternatepartset"))
+        def node(part_id):
+            partset = partsets.get(part_id)
+            return part_id if partset is None else ("partset", partset)
+        graph = defaultdict(set)
+        current_children = defaultdict(set)
+        for parent, child in models.ParentChildLink.current_objects.filter(
+                parent__in=nodes).values_list("parent", "child"):
+            graph[node(parent)].add(node(child))
+            if parent in parents:
+                current_children[parent].add(child)
+        for link in links:
+            graph[node(link.parent_id)].add(node(link.child_id))
+        components = _get_components(graph)
+
+        sibling_partsets = defaultdict(set)
+        for parent, child_ids in current_children.items():
+            sibling_partsets[parent].update(partsets[i] for i in child_ids if i in partsets)
+        for i, link in enumerate(links):
+            parent, child = link.parent, link.child
+            if parent.id not in owned:
+                errors[i].append(u"action not allowed for %s" % user)
+            elif not parent.is_draft or parent.id in approved:
+                errors[i].append(u"The object is not editable")
+            if child.is_cancelled:
+                errors[i].append(u"Can not add child: child is cancelled.")
+            elif child.is_deprecated:
+                errors[i].append(u"Can not add child: child is deprecated.")
+            if link.order < 0 or link.quantity < 0:
+                errors[i].append(u"Quantity or order is negative")
+            if child.id == parent.id:
+                errors[i].append(u"Can not add child: child is current object")
+                continue
+            if child.id not in readable:
+                errors[i].append(u"You can not see this object.")
+            pnode, cnode = node(parent.id), node(child.id)
+            if pnode == cnode:
+                errors[i].append(u"Can not add child, %s is an alternate part of %s" %
+                        (child, parent))
+            elif components[pnode] == components[cnode]:
+                errors[i].append(u"Can not add child %s to %s, it is a parent" %
+                        (child, parent))
+            if child.id in current_children[parent.id]:
+                errors[i].append(u"Can not add child, %s is already a child of %s" %
+                        (child, parent))
+            elif partsets.get(child.id) in sibling_partsets[parent.id]:
+                errors[i].append(u"Can not add child, %s is an alternate part of one of the children" % child)
+            current_children[parent.id].add(child.id)
+            if child.id in partsets:
+                sibling_partsets[parent.id].add(partsets[child.id])
+        return errors
+
+    @classmethod
+    def add_children_in_bulk(cls, links, user, extension_data=None, check=True):
+        """
+        .. versionadded:: 2.0
+
+        Creates *links*, a list of unsaved :class:`.ParentChildLink` whose
+        parent, child, quantity, order and unit are set, like
+        :meth:`add_child` but with bulk inserts.
+
+        :param extension_data: an optional list (one item per link) of
+            dictionaries used to create relevant
+            :class:`.ParentChildLinkExtension`
+        :param check: if True (the default), links are checked with
+            :meth:`check_add_children`
+
+        :raises: :exc:`ValueError` if a link is invalid.
+        :return: *links*
+        """
+        if check:
+            errors = cls.check_add_children(links, user)
+            if errors:
+                raise ValueError(errors[min(errors)][0])
+        if not links:
+            return links
+        now = timezone.now()
+        with transaction.atomic():
+            models.ParentChildLink.objects.bulk_create(links)
+            if links[0].pk is None:
+                # the database does not return primary keys of bulk created rows
+                qs = models.ParentChildLink.current_objects.filter(
+                    parent__in=set(l.parent_id for l in links),
+                    child__in=set(l.child_id for l in links))
+                ids = dict(((p, c), i) for i, p, c in qs.values_list("id", "parent", "child"))
+                for link in links:
+                    link.id = ids[(link.parent_id, link.child_id)]
+            models.ParentChildClosure.add_links(links)
+            # handle plces
+            extensions = []
+            for link, data in zip(links, extension_data or ()):
+                if not data:
+                    continue
+                for PCLE in models.get_PCLEs(link.parent):
+                    name = PCLE._meta.model_name
+                    if name in data and PCLE.one_per_link():
+                        ext = PCLE(link=link, **data[name])
+                        ext._child_name = ext.get_child_name()
+                        extensions.append(ext)
+            def get_ids(extensions):
+                ids = dict(((l, n), i) for i, l, n in models.ParentChildLinkExtension.objects.filter(
+                    link__in=links).values_list("id", "link", "_child_name"))
+                return [ids[(e.link_id, e._child_name)] for e in extensions]
+            models.bulk_create_multi_table(models.ParentChildLinkExtension, extensions, get_ids)
+            # records creation in history
+            histories = []
+            for link in links:
+                parent, child = link.parent, link.child
+                details = "parent : %s (%s//%s//%s) => child : %s (%s//%s//%s), quantity : %s %s, order : %s" % (parent.name, parent.type, parent.reference, parent.revision, child.name, child.type, child.reference, child.revision, link.quantity, link.unit, link.order)
+                history = models.History(plmobject=parent, action=link.ACTION_NAME,
+                        details=details, user=user)
+                history.denormalize()
+                histories.append(history)
+            histories = models.History.objects.bulk_create(histories)
+            if histories[0].pk is None:
+                # the database does not return primary keys of bulk created rows
+                histories = models.History.objects.filter(
+                        plmobject__in=set(l.parent_id for l in links),
+                        action=models.ParentChildLink.ACTION_NAME, user=user, date__gte=now)
+            models.record_histories(histories)
+        bom_cache.invalidate(set(l.parent_id for l in links))
+        queue_histories(list(histories), [models.ROLE_OWNER], (user.email,))
+        return links
+
     def delete_child(self, child):
         u"""
         Deletes *child* from current children and records this action in the
@@ -245,6 +761,7 @@ class PartController(PLMObjectController):
             child = child.object
         link = self.parentchildlink_parent.now().get(child=child)
         link.end()
+        models.ParentChildClosure.remove_link(link)
         self._save_histo("Undo - %s" % link.ACTION_NAME, "child : %s (%s//%s//%s)" % (child.name, child.type, child.reference, child.revision))
 
     def modify_child(self, child, new_quantity, new_order, new_unit,
@@ -297,6 +814,9 @@ class PartController(PLMObjectController):
 
         self._save_histo("Modify - %s" % link.ACTION_NAME, details)
         link2.save(force_insert=True)
+        if link.quantity != new_quantity:
+            models.ParentChildClosure.remove_link(link)
+            models.ParentChildClosure.add_link(link2)
         # save cloned extensions
         for ext in extensions:
             ext.link = link2
@@ -340,14 +860,17 @@ class PartController(PLMObjectController):
             existing_link = None
             extra_qty = 0
         link.end()
+        models.ParentChildClosure.remove_link(link)
         if existing_link is not None:
             existing_link.end()
+            models.ParentChildClosure.remove_link(existing_link)
         # make a new link
         link2, extensions = link.clone(child=new_child, end_time=None,
             quantity=link.quantity + extra_qty)
         details = u"Child changes from %s to %s" % (link.child, new_child)
         self._save_histo("Modify - %s" % link.ACTION_NAME, details)
         link2.save(force_insert=True)
+        models.ParentChildClosure.add_link(link2)
         # save cloned extensions
         for ext in extensions:
             ext.link = link2
@@ -377,82 +900,38 @@ class PartController(PLMObjectController):
         :param only: a list of fields that are given to limit the
             retrieved field of the :class:`.ParentChildLink`
         :rtype: list of :class:`Child`
+
+        .. versionchanged:: 2.0
+            A part reached through several parents is expanded under each
+            of them. It was only expanded under the first one.
+
+        .. seealso:: :func:`get_bom_links` and :func:`build_bom_tree`
         """
 
-        links = models.ParentChildLink.objects.at(date).order_by("-order")\
-                .select_related(*related)
-        if only is not None:
-            links = links.only(*only)
-        res = []
-        parents = [self.object.id]
-        level = 1
-        last_children = []
-        children_ids = []
-        while parents and (max_level < 0 or level <= max_level):
-            qs = links.filter(parent__in=parents)
-            parents = []
-            last = []
-            for link in qs.iterator():
-                parents.append(link.child_id)
-                child = Child(level, link)
-                last.append(child)
-                children_ids.append(link.child_id)
-                if level == 1:
-                    res.insert(0, child)
-                else:
-                    for c in last_children:
-                        if c.link.child_id == link.parent_id:
-                            res.insert(res.index(c) +1, child)
-                            break
-            last_children = last
-            level += 1
+        adjacency = get_bom_links(self.object.id, "child", max_level, date,
+                related, only)
+        res = build_bom_tree(self.object.id, adjacency, "child", Child, max_level)
         if only_official and res:
-            # retrieves all official children at *date* and then prunes the
-            # tree so that we only run one query
-            res2 = []
-            sh = models.StateHistory.objects.at(date).officials().filter(plmobject__in=children_ids)
-            valid_children = set(sh.values_list("plmobject_id", flat=True))
-            # level_threshold is used to cut a "branch" of the tree
-            level_threshold = len(res) + 1 # all levels are inferior to this value
-            for child in res:
-                if child.level > level_threshold:
-                    continue
-                if child.link.child_id in valid_children:
-                    res2.append(child)
-                    level_threshold = len(res) + 1
-                else:
-                    level_threshold = child.level
-            res = res2
+            res = prune_unofficial(res, "child", date)
         return res
 
     def is_ancestor(self, part):
         """
         Returns True if *part* is an ancestor of the current object.
         """
-        links = models.ParentChildLink.current_objects
-        parents = [part.id]
-        while parents:
-            parents = links.filter(parent__in=parents).values_list("child",
-                    flat=True)
-            if self.id in parents:
-                return True
-        return False
+        return models.ParentChildClosure.is_ancestor(part.id, self.id)
 
     def is_ancestor2(self, part):
+        """
+        Returns True if *part* or one of its alternates is an ancestor of
+        the current object or one of its alternates.
+        """
         # TODO: rename this method
-        links = models.ParentChildLink.current_objects
         alternates = self.get_alternates()
         tested_parts = set(p.id for p in alternates)
         tested_parts.add(self.id)
-        parents = [part.id]
-        parents += models.AlternatePartSet.get_related_parts(parents)
-        while parents:
-            parents += models.AlternatePartSet.get_related_parts(parents)
-            parents = list(links.filter(parent__in=parents).values_list("child",
-                    flat=True))
-            if not tested_parts.isdisjoint(parents):
-                return True
-        return False
+        descendants = get_reachable_parts([part.id], "child")[0]
+        return not tested_parts.isdisjoint(descendants)
 
 
     def get_parents(self, max_level=1, date=None,
@@ -470,52 +949,19 @@ class PartController(PLMObjectController):
         :param only: a list of fields that are given to limit the
             retrieved field of the :class:`.ParentChildLink`
         :rtype: list of :class:`Parent`
+
+        .. versionchanged:: 2.0
+            A part reached through several children is expanded under each
+            of them. It was only expanded under the first one.
+
+        .. seealso:: :func:`get_bom_links` and :func:`build_bom_tree`
         """
 
-        links = models.ParentChildLink.objects.at(date).order_by("-order")\
-                .select_related(*related)
-        if only is not None:
-            links = links.only(*only)
-        res = []
-        children = [self.object.id]
-        level = 1
-        last_parents = []
-        parents_ids = []
-        while children and (max_level < 0 or level <= max_level):
-            qs = links.filter(child__in=children)
-            children = []
-            last = []
-            for link in qs.iterator():
-                children.append(link.parent_id)
-                parent = Parent(level, link)
-                last.append(parent)
-                parents_ids.append(link.parent_id)
-                if level == 1:
-                    res.insert(0, parent)
-                else:
-                    for c in last_parents:
-                        if c.link.parent_id == link.child_id:
-                            res.insert(res.index(c) +1, parent)
-                            break
-            last_parents = last
-            level += 1
+        adjacency = get_bom_links(self.object.id, "parent", max_level, date,
+                related, only)
+        res = build_bom_tree(self.object.id, adjacency, "parent", Parent, max_level)
         if only_official and res:
-            # retrieves all official children at *date* and then prunes the
-            # tree so that we only run one query
-            res2 = []
-            sh = models.StateHistory.objects.at(date).officials().filter(plmobject__in=parents_ids)
-            valid_parents = set(sh.values_list("plmobject_id", flat=True))
-            # level_threshold is used to cut a "branch" of the tree
-            level_threshold = len(res) + 1 # all levels are inferior to this value
-            for parent in res:
-                if parent.level > level_threshold:
-                    continue
-                if parent.link.parent_id in valid_parents:
-                    res2.append(parent)
-                    level_threshold = len(res) + 1
-                else:
-                    level_threshold = parent.level
-            res = res2
+            res = prune_unofficial(res, "parent", date)
         return res
 
     def update_children(self, formset):
@@ -553,6 +999,9 @@ class PartController(PLMObjectController):
         """
         .. versionadded:: 1.2
 
+        .. versionchanged:: 2.0
+            results are cached, see :mod:`.bom_cache`
+
         Returns some data about children that will be displayed
         in BOM view.
 
@@ -567,6 +1016,9 @@ class PartController(PLMObjectController):
         ``children``
             list of :class:`Child`, see :meth:`.get_children`
 
+        ``paths``
+            list of the paths of *children*, see :func:`get_bom_paths`
+
         ``extra_columens``
             list of extra column headers (field name, verbose name):
             its the list of BOMs extensions bound to the object
@@ -587,13 +1039,42 @@ class PartController(PLMObjectController):
         ``obj``
             this controller
         """
+        return self.get_flat_bom(date, level, state, show_documents,
+                show_alternates)[0]
+
+    def get_flat_bom(self, date, level, state="all", show_documents=False,
+            show_alternates=False):
+        """
+        .. versionadded:: 2.0
+
+        Returns a tuple (BOM, flattened BOM) where BOM is the dictionary
+        returned by :meth:`get_bom` and flattened BOM is the list
+        returned by :func:`flatten_bom`.
+
+        Results are cached (see :mod:`.bom_cache`).
+        """
+        key = bom_cache.get_key(self.id, date, level, state, show_documents,
+                show_alternates)
+        bom = bom_cache.get_snapshot(key)
+        if bom is None:
+            bom = self._build_bom(date, level, state, show_documents, show_alternates)
+            del bom["obj"]
+            bom_cache.set_snapshot(key, bom)
+        bom["obj"] = self
+        return bom, flatten_bom(bom)
+
+    def _build_bom(self, date, level, state, show_documents, show_alternates):
         max_level = 1 if level == "first" else -1
         only_official = state == "official"
         children = self.get_children(max_level, date=date, only_official=only_official)
+        # paths are computed before removing the ancestors of "last" children
+        paths = get_bom_paths(children)
         if level == "last" and children:
-            # only get "leaf" children
-            children = get_last_children(children)
-        children = list(children)
+            # only get "leaf" children (see get_last_children)
+            leaves = [i for i, c in enumerate(children) if i + 1 == len(children)
+                    or children[i + 1].level <= c.level]
+            children = [children[i] for i in leaves]
+            paths = [paths[i] for i in leaves]
         # pcle
         extra_columns = []
         extension_data = defaultdict(dict)
@@ -617,6 +1098,8 @@ class PartController(PLMObjectController):
                     extra(select={"psid":"alternatepartset_id"}))
             if only_official and alt:
                 sh = models.StateHistory.objects.at(date).officials().filter(plmobject__in=alt)
+                if date is not None:
+                    sh = sh.with_archive(date)
                 official_alt = set(sh.values_list("plmobject_id", flat=True))
                 alt = [p for p in alt if p.id in official_alt]
             id2ps = dict((p.id, p.psid) for p in alt)
@@ -642,6 +1125,8 @@ class PartController(PLMObjectController):
         states = models.StateHistory.objects.at(date).filter(plmobject__in=ids | doc_ids)
         if only_official:
             states = states.officials()
+        if date is not None:
+            states = states.with_archive(date)
         states = dict(states.values_list("plmobject", "state"))
         if only_official and show_documents:
             # remove unofficial documents
@@ -650,6 +1135,7 @@ class PartController(PLMObjectController):
                 docs[:] = official_docs # in place copy
         return {
                 'children' : children,
+                'paths' : paths,
                 'extra_columns' : extra_columns,
                 'extension_data' : extension_data,
                 'states' : states,
@@ -660,33 +1146,42 @@ class PartController(PLMObjectController):
                 }
 
     def cmp_bom(self, date1, date2, level="first", state="all", show_documents=False,
-            show_alternates=False):
+            show_alternates=False, keyed=True):
         """
         .. versionadded:: 1.2
 
+        .. versionchanged:: 2.0
+            added the *keyed* argument
+
         Compares two BOMs at date *date1* and *date2*.
 
         dates, *level*, *state* and *show_documents* are described in :meth:`.get_bom`.
 
+        If *keyed* is True (the default), rows are matched by their path
+        in linear time (see :func:`diff_flat_boms`), otherwise they are
+        compared with a :class:`difflib.SequenceMatcher` which is much
+        slower on large BOMs.
+
         It returns a dictionary containing the following keys:
 
         ``diff``
             diff result, it is a sequence of tuples
-            (tag, first BOM rows, second BOM rows)
-            (see :meth:`.difflib.SequenceMatcher.get_opcodes`)
+            (tag, sequence of (first BOM row, second BOM row))
+            (see :meth:`.difflib.SequenceMatcher.get_opcodes`);
+            a keyed diff may also return ``move`` tags
 
         ``boms``
             tuple of BOMs (at date *date1* and date *date2*)
 
         """
-        bom1 = self.get_bom(date1, level, state, show_documents, show_alternates)
-        bom2 = self.get_bom(date2, level, state, show_documents, show_alternates)
-        s1 = flatten_bom(bom1)
-        s2 = flatten_bom(bom2)
-        matcher = difflib.SequenceMatcher(None, s1, s2)
-        
-        diff = ((tag, zip_longest(s1[i1:i2], s2[j1:j2]))
-            for tag, i1, i2, j1, j2 in matcher.get_opcodes())
+        bom1, s1 = self.get_flat_bom(date1, level, state, show_documents, show_alternates)
+        bom2, s2 = self.get_flat_bom(date2, level, state, show_documents, show_alternates)
+        if keyed:
+            diff = diff_flat_boms(s1, s2)
+        else:
+            matcher = difflib.SequenceMatcher(None, s1, s2)
+            diff = ((tag, zip_longest(s1[i1:i2], s2[j1:j2]))
+                for tag, i1, i2, j1, j2 in matcher.get_opcodes())
         ctx = {
                 "diff" : diff,
                 "boms" : (bom1, bom2),
@@ -723,7 +1218,8 @@ class PartController(PLMObjectController):
         if child_links is None:
             child_links = (x.link for x in self.get_children(1))
         for link in child_links:
-            link.clone(save=True, parent=new_controller.object)
+            link2 = link.clone(save=True, parent=new_controller.object)[0]
+            models.ParentChildClosure.add_link(link2)
         # attach the documents
         for doc in documents:
             models.DocumentPartLink.objects.create(part=new_controller.object,
@@ -731,10 +1227,12 @@ class PartController(PLMObjectController):
         # for each parent, replace its child with the new revision
         now = timezone.now()
         for link, parent in parents:
-            link.clone(save=True, parent=parent, child=new_controller.object)
+            link2 = link.clone(save=True, parent=parent, child=new_controller.object)[0]
             if link.parent_id == parent.id:
                 link.end_time = now
                 link.save()
+                models.ParentChildClosure.remove_link(link)
+            models.ParentChildClosure.add_link(link2)
         return new_controller
 
     def get_suggested_documents(self):
@@ -1006,6 +1504,7 @@ class PartController(PLMObjectController):
                     self.check_attach_document(doc, True)
                 ids = (d.id for d in docs)
                 self.documentpartlink_part.filter(document__in=ids).end()
+                bom_cache.invalidate([self.id])
 
     def _deprecate(self):
         super(PartController, self)._deprecate()
@@ -1023,7 +1522,10 @@ class PartController(PLMObjectController):
         self.get_attached_documents().end()
         self.end_alternate()
         q = Q(parent=self.object) | Q(child=self.object)
+        links = list(models.ParentChildLink.current_objects.filter(q))
         models.ParentChildLink.current_objects.filter(q).end()
+        for link in links:
+            models.ParentChildClosure.remove_link(link)
 
     def check_cancel(self,raise_=True):
         res = super(PartController, self).check_cancel(raise_=raise_)
@@ -1049,7 +1551,8 @@ class PartController(PLMObjectController):
         new_ctrl = super(PartController, self).clone(form, user, block_mails, no_index)
         if child_links :
             for link in child_links:
-                link.clone(save=True, parent=new_ctrl.object)
+                link2 = link.clone(save=True, parent=new_ctrl.object)[0]
+                models.ParentChildClosure.add_link(link2)
         if documents :
             for doc in documents:
                 models.DocumentPartLink.objects.create(part=new_ctrl.object,
@@ -1143,14 +1646,11 @@ class PartController(PLMObjectController):
 
         # ancestors
         links = models.ParentChildLink.current_objects
-        parents = [part.id, self.id] + [p.id for p in alternates]
-        built_set = set(parents[:])
-        while parents:
-            parents = list(links.filter(child__in=parents).values_list("parent",
-                    flat=True))
-            parents += models.AlternatePartSet.get_related_parts(parents)
-            if not built_set.isdisjoint(parents):
-                raise ValueError("Ancestor")
+        built_set = set([part.id, self.id] + [p.id for p in alternates])
+        ancestors = get_reachable_parts(built_set, "parent")[0]
+        ancestors.update(models.AlternatePartSet.get_related_parts(ancestors))
+        if not built_set.isdisjoint(ancestors):
+            raise ValueError("Ancestor")
 
         # siblings
         if not alternates:
@@ -1232,7 +1732,14 @@ class PartController(PLMObjectController):
     @transaction.atomic 
     #@transaction.commit_on_success
     def promote_assembly(self):
-        # FIXME Inefficient version
+        """
+        Promotes the assembly: the part and all its children which have
+        the same state and lifecycle.
+
+        .. versionchanged:: 2.0
+            signers are checked and objects are promoted in bulk
+            (see :meth:`_promote_in_bulk`)
+        """
         # FIXME does not check if alternates part are promoted
         if not (self.is_proposed or self.is_draft):
             raise ValueError("invalid state")
@@ -1243,8 +1750,7 @@ class PartController(PLMObjectController):
             return
 
         # check permission
-        lcl = self.lifecycle.to_states_list()
-        role = level_to_sign_str(lcl.index(self.state.name))
+        role = level_to_sign_str(models.get_lifecycle_info(self.lifecycle_id).rank(self.state_id))
         self.check_permission(role)
 
         self.block_mails()
@@ -1297,22 +1803,12 @@ class PartController(PLMObjectController):
                 # fixme: list parts
                 raise PromotionError("Some children are not promotable")
 
-        ctrls = [PartController(c, self._user, True, True) for c in to_promote]
-        ctrls.append(self)
-        updated = to_promote[:]
-        updated.append(self.object)
-        if not all(ctrl.is_last_promoter() for ctrl in ctrls):
-            # TODO: get all required signers in one query
-            # and compare with represented signers
-            # must still check signer permission
+        objects = to_promote + [self.object]
+        if not self.is_last_promoter_in_bulk(objects):
             raise PromotionError()
-        for ctrl in ctrls:
-            # TODO: create (state) histories in bulk
-            updated.extend(ctrl.promote(checked=True)["updated_revisions"])
+        updated = objects + self._promote_in_bulk(objects)
 
         # send mails and update indexes
-        for ctrl in ctrls:
-            # TODO merge mails ?
-            ctrl.unblock_mails()
+        self.unblock_mails()
         update_indexes.delay([(c._meta.app_label, c._meta.module_name, c.pk) for c in updated])
 
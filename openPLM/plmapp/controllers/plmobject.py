@@ -26,6 +26,7 @@
 """
 
 import re
+from collections import defaultdict
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
@@ -38,6 +39,8 @@ from openPLM.plmapp.exceptions import RevisionError, PermissionError,\
     PromotionError
 from openPLM.plmapp.references import parse_reference_number, validate_reference, validate_revision
 from openPLM.plmapp.utils import level_to_sign_str
+from openPLM.plmapp.mail import queue_histories
+from openPLM.plmapp import bom_cache, permissions
 from openPLM.plmapp.controllers import get_controller
 from openPLM.plmapp.controllers.base import Controller
 
@@ -140,10 +143,111 @@ class PLMObjectController(Controller):
             links.append(models.PLMObjectUserLink(plmobject=obj, user=sponsor,
                 role=level_to_sign_str(i), ctime=ctime))
         models.PLMObjectUserLink.objects.bulk_create(links)
+        permissions.reset_contexts()
 
         res._update_state_history()
         return res
 
+    @classmethod
+    def create_in_bulk(cls, rows, user):
+        u"""
+        .. versionadded:: 2.0
+
+        Creates several objects like :meth:`create` but with a constant
+        number of queries.
+
+        :param rows: a list of dictionaries (like the *data* argument of
+                     :meth:`create`) that must contain the keys ``type``,
+                     ``reference``, ``revision``, ``group`` and ``lifecycle``
+        :param user: user who creates/owns the objects
+        :rtype: list of :class:`PLMObjectController` (with blocked mails)
+
+        Created objects are not indexed and no mails are sent (a new
+        object has no notified users).
+        """
+        profile = user.profile
+        if not (profile.is_contributor or profile.is_administrator):
+            raise PermissionError("%s is not a contributor" % user)
+        if not user.is_active:
+            raise PermissionError(u"%s's account is inactive" % user)
+        if profile.restricted:
+            raise PermissionError("Restricted account can not create a part or document.")
+        classes = models.get_all_plmobjects()
+        objects = []
+        details = []
+        for data in rows:
+            reference, type, revision = data["reference"], data["type"], data["revision"]
+            if not reference or not type or not revision:
+                raise ValueError("Empty value not permitted for reference/type/revision")
+            validate_reference(reference)
+            validate_revision(revision)
+            try:
+                class_ = classes[type]
+            except KeyError:
+                raise ValueError("Incorrect type")
+            obj = class_(reference=reference, type=type, revision=revision, owner=user,
+                    creator=user, reference_number=parse_reference_number(reference, class_))
+            obj.no_index = True
+            for key, value in data.iteritems():
+                if key not in ["reference", "type", "revision", "auto", "pfiles"]:
+                    setattr(obj, key, value)
+            obj.state = models.get_default_state(obj.lifecycle)
+            objects.append(obj)
+            details.append(u" / ".join(u"%s : %s" % (k, v) for k, v in data.items()
+                if k not in ("auto", "pfiles", "type", "reference", "revision", "name")))
+        models.bulk_create_plmobjects(objects)
+
+        histories = []
+        for obj, detail in zip(objects, details):
+            history = models.History(plmobject=obj, action="created",
+                    details=detail, user=user)
+            history.denormalize()
+            histories.append(history)
+        histories = models.History.objects.bulk_create(histories)
+        if histories and histories[0].pk is None:
+            # the database does not return primary keys of bulk created rows
+            histories = models.History.objects.filter(plmobject__in=objects,
+                    action="created")
+        models.record_histories(histories)
+
+        # links, see create()
+        try:
+            l = models.DelegationLink.current_objects.select_related("delegator").get(delegatee=user,
+                    role=models.ROLE_SPONSOR)
+            sponsor = l.delegator
+            if sponsor.username == settings.COMPANY:
+                sponsor = user
+            else:
+                sponsor_groups = set(sponsor.groups.values_list("id", flat=True))
+        except models.DelegationLink.DoesNotExist:
+            sponsor = user
+        links = []
+        state_histories = []
+        for obj in objects:
+            ctime = obj.ctime
+            links.append(models.PLMObjectUserLink(plmobject=obj, user=user,
+                role="owner", ctime=ctime))
+            links.append(models.PLMObjectUserLink(plmobject=obj, user=user,
+                role=level_to_sign_str(0), ctime=ctime))
+            signer = sponsor
+            if sponsor != user and obj.group_id not in sponsor_groups:
+                signer = user
+            for i in range(1, obj.lifecycle.nb_states - 1):
+                links.append(models.PLMObjectUserLink(plmobject=obj, user=signer,
+                    role=level_to_sign_str(i), ctime=ctime))
+            sh = models.StateHistory(plmobject=obj, start_time=ctime, end_time=None,
+                    state=obj.state, lifecycle=obj.lifecycle)
+            sh.state_category = sh.get_state_category()
+            state_histories.append(sh)
+        models.PLMObjectUserLink.objects.bulk_create(links)
+        permissions.reset_contexts()
+        models.StateHistory.objects.bulk_create(state_histories)
+        controllers = []
+        for obj in objects:
+            ctrl = cls(obj, user, True, True)
+            controllers.append(ctrl)
+        return controllers
+
     @classmethod
     def create_from_form(cls, form, user, block_mails=False, no_index=False):
         u"""
@@ -180,12 +284,22 @@ class PLMObjectController(Controller):
         if user is None:
             user = self._user
         role = self.get_current_signer_role()
-        delegators = set(models.DelegationLink.get_delegators(self._user, role))
+        delegators = set(self._get_delegators(role))
         delegators.add(self._user.id)
         delegators.difference_update(self.get_approvers())
         delegators.intersection_update(self.get_current_signers())
         return delegators
 
+    def _get_delegators(self, role):
+        """
+        Returns the ids of the delegators of :attr:`_user` for *role*.
+        It uses the :class:`.PermissionContext` of the user if it is active.
+        """
+        context = permissions.get_context(self._user)
+        if context is not None:
+            return context.get_delegators(role)
+        return models.DelegationLink.get_delegators(self._user, role)
+
     def is_last_promoter(self):
         role = self.get_current_signer_role()
         is_signer = self.has_permission(role)
@@ -198,21 +312,51 @@ class PLMObjectController(Controller):
         else:
             return False
 
+    def is_last_promoter_in_bulk(self, objects):
+        """
+        .. versionadded:: 2.0
+
+        Returns True if :attr:`_user` is the last promoter (see
+        :meth:`is_last_promoter`) of all *objects*.
+
+        *objects* must have the same state and lifecycle as :attr:`object`.
+        Signers and approvers of all objects are fetched in two queries.
+        """
+        if not self._user.is_active:
+            return False
+        role = self.get_current_signer_role()
+        represented = set(self._get_delegators(role))
+        represented.add(self._user.id)
+        ids = [obj.id for obj in objects]
+        not_approvers = defaultdict(set)
+        signers = models.PLMObjectUserLink.objects.now().filter(plmobject__in=ids,
+                role=role).values_list("plmobject", "user")
+        for plmobject, user in signers:
+            not_approvers[plmobject].add(user)
+        next_state = models.get_lifecycle_info(self.lifecycle_id).next_state(self.state_id)
+        approvers = models.PromotionApproval.objects.now().filter(plmobject__in=ids,
+                current_state=self.state_id, next_state=next_state)
+        for plmobject, user in approvers.values_list("plmobject", "user"):
+            not_approvers[plmobject].discard(user)
+        # the user must represent at least one remaining signer and
+        # all remaining signers
+        return all(not_approvers[i] and not_approvers[i] <= represented for i in ids)
+
     def _all_approved(self):
         not_approvers = self.get_current_signers().exclude(user__in=self.get_approvers())
         return not not_approvers.exists()
 
     def approve_promotion(self):
         if self.object.is_promotable():
-            lcl = self.lifecycle.to_states_list()
-            role = level_to_sign_str(lcl.index(self.state.name))
+            info = models.get_lifecycle_info(self.lifecycle_id)
+            role = level_to_sign_str(info.rank(self.state_id))
             self.check_permission(role)
 
             represented = self.get_represented_approvers()
             if not represented:
                 raise PromotionError()
-            next_state = lcl.next_state(self.state.name)
-            nxt = models.State.objects.get(name=next_state)
+            next_state = info.next_state(self.state_id)
+            nxt = models.get_state(next_state)
             users = list(models.User.objects.filter(id__in=represented))
             for user in users:
                 self.approvals.create(user=user, current_state=self.object.state, next_state=nxt)
@@ -251,19 +395,18 @@ class PLMObjectController(Controller):
                 a list of updated (deprecated or cancelled) revisions
         """
         if checked or self.object.is_promotable():
-            state = self.object.state
-            lifecycle = self.object.lifecycle
-            lcl = lifecycle.to_states_list()
+            state = self.object.state_id
+            info = models.get_lifecycle_info(self.object.lifecycle_id)
             if not checked:
-                self.check_permission(level_to_sign_str(lcl.index(state.name)))
-            new_state = lcl.next_state(state.name)
-            self.object.state = models.State.objects.get_or_create(name=new_state)[0]
+                self.check_permission(level_to_sign_str(info.rank(state)))
+            new_state = info.next_state(state)
+            self.object.state = models.get_state(new_state)
             self.object.save()
             details = "from state %(first)s to state %(second)s" % \
-                                 {"first" :state.name, "second" : new_state}
+                                 {"first" :state, "second" : new_state}
             self._save_histo("promoted", details, roles=["sign_"])
             updated_revisions = []
-            if self.object.state == lifecycle.official_state:
+            if new_state == info.official_state:
                updated_revisions = self._officialize()
             self._update_state_history()
             self._clear_approvals()
@@ -271,11 +414,105 @@ class PLMObjectController(Controller):
         else:
             raise PromotionError()
 
+    def _promote_in_bulk(self, objects):
+        """
+        .. versionadded:: 2.0
+
+        Promotes *objects* like :meth:`promote` (with *checked* set to True)
+        but with a constant number of queries (except to cancel or
+        deprecate previous revisions).
+
+        *objects* must have the same state and lifecycle as :attr:`object`
+        (which may be in *objects*). Permissions are not checked.
+        Histories are sent in one merged mail per recipient and objects
+        are not indexed.
+
+        :returns: a list of updated (deprecated or cancelled) revisions
+        """
+        state = self.object.state_id
+        info = models.get_lifecycle_info(self.object.lifecycle_id)
+        new_state = models.get_state(info.next_state(state))
+        category = info.get_category(new_state.name)
+        ids = [obj.id for obj in objects]
+        now = timezone.now()
+        models.PLMObject.objects.filter(id__in=ids).update(state=new_state,
+                state_category=category, mtime=now)
+        for obj in objects:
+            obj.state = new_state
+            obj.state_category = category
+            obj.mtime = now
+        details = "from state %(first)s to state %(second)s" % \
+                             {"first" :state, "second" : new_state.name}
+        histories = []
+        for obj in objects:
+            history = models.History(plmobject=obj, action="promoted",
+                    details=details, user=self._user)
+            history.denormalize()
+            histories.append(history)
+        histories = models.History.objects.bulk_create(histories)
+        if histories and histories[0].pk is None:
+            # the database does not return primary keys of bulk created rows
+            histories = models.History.objects.filter(plmobject__in=ids,
+                    action="promoted", user=self._user, date__gte=now)
+        models.record_histories(histories)
+        updated_revisions = []
+        if new_state.name == info.official_state:
+            updated_revisions = self._officialize_in_bulk(objects)
+        # updates state histories
+        models.StateHistory.objects.filter(plmobject__in=ids,
+                end_time=None).update(end_time=now)
+        state_histories = []
+        for obj in objects:
+            sh = models.StateHistory(plmobject=obj, start_time=now, end_time=None,
+                    state=new_state, lifecycle_id=info.name)
+            sh.state_category = sh.get_state_category()
+            state_histories.append(sh)
+        models.StateHistory.objects.bulk_create(state_histories)
+        bom_cache.invalidate_plmobjects(ids)
+        models.PromotionApproval.objects.now().filter(plmobject__in=ids).end()
+        roles = [models.ROLE_OWNER, "notified", "sign_"]
+        self._send_mail(queue_histories, list(histories), roles,
+                (self._user.email,))
+        return updated_revisions
+
+    def _officialize_in_bulk(self, objects):
+        """ Officialize *objects* (called by :meth:`_promote_in_bulk`)."""
+        cie = models.User.objects.get(username=settings.COMPANY)
+        ids = [obj.id for obj in objects]
+        models.PLMObjectUserLink.objects.now().filter(plmobject__in=ids,
+                role="owner").end()
+        models.PLMObjectUserLink.objects.bulk_create([models.PLMObjectUserLink(
+            user=cie, plmobject=obj, role="owner") for obj in objects])
+        permissions.reset_contexts()
+        models.PLMObject.objects.filter(id__in=ids).update(owner=cie)
+        models.History.objects.filter(plmobject__in=ids).update(public=True)
+        for obj in objects:
+            obj.owner = cie
+        # only objects with several revisions must update their previous revisions
+        references = set((obj.type, obj.reference) for obj in objects)
+        revisions = models.PLMObject.objects.filter(reference__in=set(r for t, r in references))\
+                .exclude(id__in=ids).values_list("type", "reference")
+        revised = references.intersection(revisions)
+        updated_revisions = []
+        for obj in objects:
+            if (obj.type, obj.reference) in revised:
+                ctrl = type(self)(obj, self._user, self._mail_blocked, True)
+                updated_revisions.extend(ctrl._update_previous_revisions())
+                self._pending_mails.extend(ctrl._pending_mails)
+        return updated_revisions
+
     def _officialize(self):
         """ Officialize the object (called by :meth:`promote`)."""
         # changes the owner to the company
         cie = models.User.objects.get(username=settings.COMPANY)
         self.set_owner(cie, True)
+        return self._update_previous_revisions()
+
+    def _update_previous_revisions(self):
+        """
+        Cancels editable previous revisions and deprecates official
+        previous revisions (called by :meth:`_officialize`).
+        """
         updated_revisions = []
         for rev in self.get_previous_revisions():
             if rev.is_cancelled:
@@ -290,7 +527,7 @@ class PLMObjectController(Controller):
                 else:
                     ctrl._deprecate()
                 if self._mail_blocked:
-                    self._pending_mails.extends(ctrl._pending_mails)
+                    self._pending_mails.extend(ctrl._pending_mails)
                     del ctrl._pending_mails[:]
                 updated_revisions.append(ctrl.object)
         return updated_revisions
@@ -326,17 +563,18 @@ class PLMObjectController(Controller):
         """
         if not self.is_proposed:
             raise PromotionError()
-        state = self.object.state
-        lifecycle = self.object.lifecycle
-        lcl = lifecycle.to_states_list()
+        state = self.object.state_id
+        info = models.get_lifecycle_info(self.object.lifecycle_id)
         try:
-            new_state = lcl.previous_state(state.name)
-            self.check_permission(level_to_sign_str(lcl.index(new_state)))
-            self.object.state = models.State.objects.get_or_create(name=new_state)[0]
+            new_state = info.previous_state(state)
+            if new_state is None:
+                raise IndexError()
+            self.check_permission(level_to_sign_str(info.rank(new_state)))
+            self.object.state = models.get_state(new_state)
             self.object.save()
             self._clear_approvals()
             details = "from state %(first)s to state %(second)s" % \
-                    {"first" :state.name, "second" : new_state}
+                    {"first" :state, "second" : new_state}
             self._save_histo("demoted", details, roles=["sign_"])
             self._update_state_history()
         except IndexError:
@@ -361,8 +599,11 @@ class PLMObjectController(Controller):
     def has_permission(self, role):
         if not self._user.is_active:
             return False
-        if role == models.ROLE_OWNER and self.owner == self._user:
+        if role == models.ROLE_OWNER and self.owner_id == self._user.id:
             return True
+        context = permissions.get_context(self._user)
+        if context is not None:
+            return context.has_role(self.object.id, role)
         if self.users.now().filter(user=self._user, role=role).exists():
             return True
 
@@ -394,13 +635,23 @@ class PLMObjectController(Controller):
         """
         if user.username == settings.COMPANY:
             return True
-        if not self.group.user_set.filter(id=user.id).exists():
+        if not self._is_in_group(user):
             if raise_:
                 raise PermissionError("The user %s does not belong to the group." % user.username)
             else:
                 return False
         return True
 
+    def _is_in_group(self, user):
+        """
+        Returns True if *user* belongs to the object's group.
+        It uses the :class:`.PermissionContext` of *user* if it is active.
+        """
+        context = permissions.get_context(user)
+        if context is not None:
+            return self.group_id in context.group_ids
+        return self.group.user_set.filter(id=user.id).exists()
+
     def revise(self, new_revision, group=None):
         u"""
         Makes a new revision: duplicates :attr:`object`. The duplicated
@@ -529,6 +780,8 @@ class PLMObjectController(Controller):
         else:
             self.owner = new_owner
             self.save()
+        if new_owner.username == settings.COMPANY:
+            models.History.objects.filter(plmobject=self.object).update(public=True)
         # we do not need to write this event in a history since save() has
         # already done it
 
@@ -775,7 +1028,7 @@ class PLMObjectController(Controller):
         if self._user.username == settings.COMPANY:
             # the company is like a super user
             return True
-        if not self.group.user_set.filter(id=self._user.id).exists():
+        if not self._is_in_group(self._user):
             if raise_:
                 raise PermissionError("action not allowed for %s" % self._user)
             else:
@@ -799,7 +1052,7 @@ class PLMObjectController(Controller):
                 return True
             if self.owner_id == self._user.id:
                 return True
-            if self.group.user_set.filter(id=self._user.id).exists():
+            if self._is_in_group(self._user):
                 return True
         if raise_:
             raise PermissionError("You can not see this object.")
@@ -31,6 +31,7 @@ from :class:`.PLMObjectController` are not defined.
 
 import os
 from django.conf import settings
+from django.db import transaction
 from django.core.exceptions import FieldDoesNotExist
 from django.utils.translation import gettext_lazy as _
 from django.contrib.sites.models import Site
@@ -42,6 +43,7 @@ from openPLM.plmapp.mail import send_mail
 from openPLM.plmapp.tasks import update_index
 from openPLM.plmapp.utils import generate_password
 from openPLM.plmapp.exceptions import PermissionError, DeleteFileError
+from openPLM.plmapp.files.deletable import remove_unreferenced_files
 from openPLM.plmapp.controllers.base import Controller, permission_required
 
 NEW_ACCOUNT_SUBJECT = u"New account on OpenPLM"
@@ -249,9 +251,11 @@ class UserController(Controller):
             roles = set(link.role for link in qset)
         else:
             roles = [role]
-        for r in roles:
-            models.DelegationLink.current_objects.get_or_create(delegator=self.object,
-                        delegatee=user, role=r)
+        # the version of the delegation index is replaced in the same transaction
+        with transaction.atomic():
+            for r in roles:
+                models.DelegationLink.current_objects.get_or_create(delegator=self.object,
+                            delegatee=user, role=r)
         details = "%(delegator)s delegated the role %(role)s to %(delegatee)s"
         details = details % dict(role=role, delegator=self.object,
                                  delegatee=user)
@@ -269,7 +273,8 @@ class UserController(Controller):
         details = details % dict(role=delegation_link.role, delegator=self.object,
                                  delegatee=delegation_link.delegatee)
         self._save_histo(models.DelegationLink.ACTION_NAME, details)
-        delegation_link.end()
+        with transaction.atomic():
+            delegation_link.end()
 
     def get_user_delegation_links(self):
         """
@@ -404,9 +409,10 @@ class UserController(Controller):
         path = os.path.realpath(doc_file.file.path)
         if not path.startswith(settings.DOCUMENTS_DIR):
             raise DeleteFileError("Bad path : %s" % path)
-        os.chmod(path, Oo700)
-        os.remove(path)
+        name = doc_file.file.name
         doc_file.delete()
+        # the stored file may be shared with other files
+        remove_unreferenced_files([name])
 
     def update_file(self, formset):
         u"""
@@ -7,13 +7,15 @@ from functools import partial
 from itertools import islice
 from collections import defaultdict
 
+from django.core.exceptions import NON_FIELD_ERRORS
 from django.db import transaction
 from django.forms.utils import ErrorList
 from django.utils.safestring import mark_safe
 
 from openPLM.plmapp import models
 from openPLM.plmapp.utils.unicodecsv import UnicodeReader
-from openPLM.plmapp.controllers import PLMObjectController, UserController
+from openPLM.plmapp.controllers import PLMObjectController, PartController,\
+        UserController, get_controller
 from openPLM.plmapp.tasks import update_indexes
 # function that replace spaces by an underscore
 _to_underscore = partial(re.compile(r"\s+").sub, "_")
@@ -138,8 +140,14 @@ class CSVImporter(object):
         self.csv_file.seek(0)
         return Preview(self.csv_file, self.encoding, self.get_headers_set())
 
-    @transaction.atomic
-    def __do_import_csv(self, headers):
+    def _get_reader(self, headers):
+        """
+        .. versionadded:: 2.0
+
+        Checks that *headers* contains the required headers, resets
+        the detected errors and returns a reader positioned on the
+        first non-headers row.
+        """
         self.csv_file.seek(0)
         reader = UnicodeReader(self.csv_file, encoding=self.encoding)
         self.headers_dict = dict((h, i) for i, h in enumerate(headers))
@@ -150,6 +158,11 @@ class CSVImporter(object):
         # read the header
         reader.next()
         self._errors = defaultdict(ErrorList)
+        return reader
+
+    @transaction.atomic
+    def __do_import_csv(self, headers):
+        reader = self._get_reader(headers)
         self.objects = []
         # parse each row
         for line, row in enumerate(reader):
@@ -303,6 +316,154 @@ class PLMObjectsImporter(CSVImporter):
             self.objects.append(obj)
 
 
+class BulkPLMObjectsImporter(PLMObjectsImporter):
+    """
+    .. versionadded:: 2.0
+
+    A :class:`PLMObjectsImporter` suited to large files.
+
+    The CSV file has the same columns as a file imported by
+    a :class:`PLMObjectsImporter`.
+
+    The import is done in two steps:
+
+        #. all rows are validated, groups, lifecycles and types are looked up
+           once and uniqueness of references is checked with one query
+           per chunk of rows; a :exc:`CSVImportError` is raised if
+           a row is invalid and nothing is written
+        #. objects are created by chunks of :attr:`CHUNK_SIZE` rows with
+           :meth:`.PLMObjectController.create_in_bulk`, all chunks in one
+           transaction so that a failed import does not create any object
+
+    Unlike :class:`PLMObjectsImporter`, no signals are sent when an object
+    is created.
+    """
+
+    #: Number of rows created by one call to
+    #: :meth:`.PLMObjectController.create_in_bulk`
+    CHUNK_SIZE = 1000
+
+    def import_csv(self, headers):
+        """
+        Imports the csv file, see :meth:`CSVImporter.import_csv`.
+
+        :return: A list of :class:`.PLMObjectController` of all created objects.
+        """
+        rows = self.validate(headers)
+        self.objects = []
+        with transaction.atomic():
+            for i in xrange(0, len(rows), self.CHUNK_SIZE):
+                self.objects.extend(PLMObjectController.create_in_bulk(
+                    rows[i:i+self.CHUNK_SIZE], self.user))
+        self.tear_down()
+        return self.objects
+
+    def validate(self, headers):
+        """
+        Validates all rows of the csv file and returns a list of
+        dictionaries suitable to :meth:`.PLMObjectController.create_in_bulk`.
+
+        Raises a :exc:`CSVImportError` with all detected errors if a row
+        is invalid.
+        """
+        reader = self._get_reader(headers)
+        self.classes = models.get_all_plmobjects()
+        self.groups = dict((g.name, g) for g in models.GroupInfo.objects.filter(
+            id__in=self.user.groups.values_list("id", flat=True)))
+        lifecycles = models.Lifecycle.objects.filter(type__in=(models.Lifecycle.STANDARD,
+            models.Lifecycle.TEMPLATE)).exclude(pk=models.get_cancelled_lifecycle().pk)
+        self.lifecycles = dict((lc.name, lc) for lc in lifecycles)
+        # (type, reference) -> revisions of valid rows
+        self.references = defaultdict(set)
+        rows = []
+        chunk = []
+        for line, row in enumerate(reader):
+            try:
+                data = self.parse_row(line + 2, row)
+            except Exception as e:
+                self.store_errors(line + 2, e)
+            else:
+                if data is not None:
+                    chunk.append((line + 2, data))
+            if len(chunk) == self.CHUNK_SIZE:
+                rows.extend(self.check_references(chunk))
+                chunk = []
+        rows.extend(self.check_references(chunk))
+        if self._errors:
+            raise CSVImportError(self._errors)
+        return rows
+
+    def parse_row(self, line, row):
+        """
+        Method called by :meth:`validate` for each row.
+
+        Returns the validated data of the row or None if the row is invalid.
+        """
+        from openPLM.plmapp.forms import get_bulk_creation_form, INVALID_GROUP
+        type_, group, lifecycle = self.get_values(row, "type", "group", "lifecycle")
+        errors = []
+        try:
+            cls = self.classes[type_]
+        except KeyError:
+            errors.append(("type", ErrorList([u"Invalid type: %s" % type_])))
+        if group not in self.groups:
+            errors.append(("group", ErrorList([INVALID_GROUP])))
+        if lifecycle not in self.lifecycles:
+            errors.append(("lifecycle", ErrorList([u"Invalid lifecycle: %s" % lifecycle])))
+        if errors:
+            self.store_errors(line, *(mark_safe(u"%s: %s" % item) for item in errors))
+            return None
+        data = {}
+        for field in cls.get_creation_fields():
+            if field in self.headers_dict:
+                data[field] = self.get_value(row, field)
+        form = get_bulk_creation_form(cls, data)
+        if not form.is_valid():
+            items = (mark_safe(u"%s: %s" % item) for item
+                    in form.errors.iteritems())
+            self.store_errors(line, *items)
+            return None
+        data = dict(form.cleaned_data)
+        data.update(type=type_, group=self.groups[group],
+                lifecycle=self.lifecycles[lifecycle])
+        return data
+
+    def check_references(self, chunk):
+        """
+        Checks that the references of *chunk*, a list of (line, data), are
+        not already taken and returns the list of valid data.
+        """
+        if not chunk:
+            return []
+        references = set(data["reference"] for line, data in chunk)
+        for type_, reference, revision in models.PLMObject.objects.filter(
+                reference__in=references).values_list("type", "reference", "revision"):
+            self.references[(type_, reference)].add(revision)
+        rows = []
+        for line, data in chunk:
+            key = data["type"], data["reference"]
+            revisions = self.references[key]
+            if data["revision"] in revisions:
+                msg = u"An object with the same type, reference and revision already exists"
+            elif revisions:
+                msg = u"An object with the same type and reference exists, you may consider to revise it."
+            else:
+                revisions.add(data["revision"])
+                rows.append(data)
+                continue
+            self.store_errors(line, mark_safe(u"%s: %s" % (NON_FIELD_ERRORS, ErrorList([msg]))))
+        return rows
+
+    def tear_down(self):
+        for i in xrange(0, len(self.objects), self.CHUNK_SIZE):
+            instances = []
+            for obj in self.objects[i:i+self.CHUNK_SIZE]:
+                instance = obj.object
+                instances.append((instance._meta.app_label,
+                        instance._meta.module_name, instance._get_pk_val()))
+            update_indexes.delay(instances)
+
+
 class BOMImporter(CSVImporter):
     """
     A :class:`CSVImporter` that builds a bom from a CSV file.
@@ -352,6 +513,110 @@ class BOMImporter(CSVImporter):
 
         parent.add_child(child, quantity, order)
 
+class BulkBOMImporter(BOMImporter):
+    """
+    .. versionadded:: 2.0
+
+    A :class:`BOMImporter` suited to large BOMs.
+
+    The CSV file has the same columns as a file imported by
+    a :class:`BOMImporter`.
+
+    All rows are read before any write: referenced parts are loaded with
+    one query per type, the whole proposed BOM is checked by
+    :meth:`.PartController.check_add_children` and links are created by
+    :meth:`.PartController.add_children_in_bulk`. Thus the number of
+    queries does not depend on the number of rows.
+
+    The parts of the links are locked (see
+    :meth:`.ParentChildClosure.lock_parts`) and the BOM is checked and
+    created in one transaction so that a concurrent import or
+    :meth:`.PartController.add_child` can not add a link which makes
+    the checked BOM invalid (a cycle for example).
+    """
+
+    def import_csv(self, headers):
+        """
+        Imports the csv file, see :meth:`CSVImporter.import_csv`.
+
+        :return: A list of :class:`.PartController` (parents and children
+                 of the rows, each part is listed once).
+        """
+        reader = self._get_reader(headers)
+        rows = []
+        references = defaultdict(set)
+        for line, row in enumerate(reader):
+            try:
+                data = self.parse_row(line + 2, row)
+            except Exception as e:
+                self.store_errors(line + 2, e)
+            else:
+                rows.append((line + 2, data))
+                for type_, reference, revision in data[:2]:
+                    references[type_].add(reference)
+        with transaction.atomic():
+            parts = self.get_parts(references)
+            links = []
+            lines = []
+            for line, (parent, child, quantity, order) in rows:
+                missing = [u"%s//%s//%s does not exist or is not a part" % key
+                        for key in (parent, child) if key not in parts]
+                if missing:
+                    self.store_errors(line, *missing)
+                else:
+                    links.append(models.ParentChildLink(parent=parts[parent],
+                        child=parts[child], quantity=quantity, order=order))
+                    lines.append(line)
+            models.ParentChildClosure.lock_parts(set(l.parent_id for l in links),
+                    set(l.child_id for l in links))
+            errors = PartController.check_add_children(links, self.user)
+            for i, msgs in errors.items():
+                self.store_errors(lines[i], *msgs)
+            if self._errors:
+                raise CSVImportError(self._errors)
+            PartController.add_children_in_bulk(links, self.user, check=False)
+        controllers = {}
+        self.objects = []
+        for link in links:
+            for part in (link.parent, link.child):
+                if part.id not in controllers:
+                    controllers[part.id] = get_controller(part.type)(part, self.user)
+                    controllers[part.id].block_mails()
+                    self.objects.append(controllers[part.id])
+        self.tear_down()
+        return self.objects
+
+    def get_parts(self, references):
+        """
+        Returns a dictionary ((type, reference, revision) -> :class:`.Part`)
+        of the parts whose reference is in *references*, a dictionary
+        (type -> set of references).
+        """
+        classes = models.get_all_parts()
+        parts = {}
+        for type_, refs in references.items():
+            if type_ in classes:
+                for part in classes[type_].objects.filter(type=type_, reference__in=refs):
+                    parts[(part.type, part.reference, part.revision)] = part
+        return parts
+
+    def parse_row(self, line, row):
+        """
+        Method called by :meth:`import_csv` for each row.
+
+        Returns a tuple (parent key, child key, quantity, order) where
+        a key is a tuple (type, reference, revision).
+        """
+        parent = tuple(self.get_values(row,
+                *["parent-" + h for h in ("type", "reference", "revision")]))
+        child = tuple(self.get_values(row,
+                *["child-" + h for h in ("type", "reference", "revision")]))
+        qty = self.get_value(row, "quantity").replace(",", ".").replace(" ", "")
+        quantity = float(qty)
+        order = int(self.get_value(row, "order").replace(" ", ""))
+        return parent, child, quantity, order
+
+
 class UsersImporter(CSVImporter):
     """
     A :class:`CSVImporter` that sponsors users from a CSV file.
@@ -417,6 +682,6 @@ class UsersImporter(CSVImporter):
 
 
 #: Dictionary (name -> CSVImporter's subclass) of known :class:`CSVImporter`
-IMPORTERS = {"csv" : PLMObjectsImporter, "bom" : BOMImporter,
-        "users" : UsersImporter}
+IMPORTERS = {"csv" : PLMObjectsImporter, "bulkcsv" : BulkPLMObjectsImporter,
+        "bom" : BOMImporter, "bulkbom" : BulkBOMImporter, "users" : UsersImporter}
 
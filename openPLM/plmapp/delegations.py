@@ -0,0 +1,172 @@
+############################################################################
+# openPLM - open source PLM
+# Copyright 2010 Philippe Joulaud, Pierre Cosquer
+#
+# This file is part of openPLM.
+#
+#    openPLM is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    openPLM is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with openPLM.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Contact :
+#    Philippe Joulaud : ninoo.fr@gmail.com
+#    Pierre Cosquer : pcosquer@linobject.com
+################################################################################
+
+"""
+.. versionadded:: 2.0
+
+This module provides a process-wide index of delegations
+(:class:`.DelegationLink`).
+
+For each role, the transitive closure of the delegation graph is built once
+(one query for all roles) and kept until a delegation link is saved or
+ended. Then :func:`get_delegators` (who a user represents) and
+:func:`get_delegatees` (who represents a user) are dictionary lookups.
+
+A version is stored in the database (see :class:`.CacheVersion`) and
+replaced in the transaction which saves or ends a delegation so that
+all processes rebuild their index once the change is committed. This
+version (:const:`VERSION_NAME`) is also replaced when the groups of a user
+change (see :mod:`.permissions`).
+"""
+
+import threading
+from collections import defaultdict
+
+import networkx as nx
+from django.db.models.signals import post_save
+
+from openPLM.plmapp import models
+
+#: name of the :class:`.CacheVersion` of the index
+VERSION_NAME = "permissions"
+_EMPTY = frozenset()
+
+_lock = threading.Lock()
+_index = None
+
+
+class DelegationIndex(object):
+    """
+    Transitive closures of the delegation graphs of all roles.
+
+    .. attribute:: delegators
+
+        dictionary {role: {user id: frozenset of ids of the users
+        represented by the user}}
+
+    .. attribute:: delegatees
+
+        dictionary {role: {user id: frozenset of ids of the users
+        who represent the user}}
+    """
+
+    def __init__(self, version, links):
+        self.version = version
+        graphs = defaultdict(nx.DiGraph)
+        for role, delegatee, delegator in links:
+            graphs[role].add_edge(delegatee, delegator)
+        self.delegators = {}
+        self.delegatees = {}
+        for role, graph in graphs.items():
+            closure = nx.transitive_closure(graph, reflexive=False)
+            self.delegators[role] = dict((n, frozenset(closure.successors(n)))
+                    for n in closure)
+            self.delegatees[role] = dict((n, frozenset(closure.predecessors(n)))
+                    for n in closure)
+
+    def get_delegators(self, user_id, role):
+        """
+        Returns the frozenset of ids of the users represented by *user_id*
+        for *role*.
+        """
+        return self.delegators.get(role, {}).get(user_id, _EMPTY)
+
+    def get_all_delegators(self, user_id):
+        """
+        Returns the set of ids of the users represented by *user_id* for
+        any role.
+        """
+        users = set()
+        for delegators in self.delegators.values():
+            users.update(delegators.get(user_id, ()))
+        return users
+
+def get_index(version=None):
+    """
+    Returns the current :class:`DelegationIndex`. It is rebuilt if
+    a delegation has changed since it has been built.
+
+    *version* is the current version if it has already been read.
+    """
+    global _index
+    # the version must be read before the links: an index built from
+    # newer links than its version is only rebuilt once more
+    if version is None:
+        version = models.CacheVersion.get(VERSION_NAME)
+    index = _index
+    if index is None or index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                links = models.DelegationLink.current_objects.order_by()\
+                        .values_list("role", "delegatee", "delegator")
+                _index = DelegationIndex(version, list(links))
+            index = _index
+    return index
+
+def get_delegators(user_id, role):
+    """
+    Returns the frozenset of ids of the users represented by *user_id*
+    for *role* (see :meth:`.DelegationLink.get_delegators`).
+    """
+    return get_index().get_delegators(user_id, role)
+
+def get_delegators_in_bulk(user_ids, role):
+    """
+    Returns a dictionary {user id: frozenset of ids of the represented users}
+    for each user of *user_ids*.
+    """
+    delegators = get_index().delegators.get(role, {})
+    return dict((u, delegators.get(u, _EMPTY)) for u in user_ids)
+
+def get_all_delegators(user_id):
+    """
+    Returns the set of ids of the users represented by *user_id* for
+    any role.
+    """
+    return get_index().get_all_delegators(user_id)
+
+def get_delegatees(user_id, role):
+    """
+    Returns the frozenset of ids of the users who represent *user_id*
+    for *role*.
+    """
+    return get_index().delegatees.get(role, {}).get(user_id, _EMPTY)
+
+def get_delegatees_in_bulk(user_ids, role):
+    """
+    Returns a dictionary {user id: frozenset of ids of the users who
+    represent the user} for each user of *user_ids*.
+    """
+    delegatees = get_index().delegatees.get(role, {})
+    return dict((u, delegatees.get(u, _EMPTY)) for u in user_ids)
+
+def invalidate(**kwargs):
+    """
+    Invalidates the indexes of all processes. This function is called
+    when a :class:`.DelegationLink` is saved or ended.
+    """
+    models.CacheVersion.bump(VERSION_NAME)
+
+post_save.connect(invalidate, sender=models.DelegationLink)
+models.links_ended.connect(invalidate, sender=models.DelegationLink)
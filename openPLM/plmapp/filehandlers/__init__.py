@@ -51,12 +51,18 @@ For example, if you have a model called *PDFDocument* with an attribute called
                 # get an handler for a pdf files
                 handler_cls = HandlersManager.get_best_handler(".pdf")
                 # instanciate thi handler (it parses the file)
-                handler = handler_cls(doc_file.file.path, doc_file.filename)
+                handler = handler_cls(doc_file.file.path, doc_file.filename,
+                        doc_file.mapped_file)
                 if handler.is_valid():
                     # the handler has successfully parsed the file, so we can
                     # set the attribute *nb_page*
                     self.nb_pages = handler.nb_pages
                     self.save()
+
+.. versionchanged:: 2.0
+    All handlers accept a *mapped_file* argument, the memory map of the file
+    shared by all handlers (see :class:`.FileHandler`). A handler may ignore
+    it and parse the file from its path, like :class:`.ODFHandler`.
 """
 
 from .base import FileHandler, HandlersManager
@@ -22,6 +22,8 @@
 #    Pierre Cosquer : pcosquer@linobject.com
 ################################################################################
 
+from openPLM.plmapp.files.content import map_file
+
 class HandlersManager(object):
     """
     The HandlersManager has methods to register a :class:`FileHandler` with a
@@ -71,6 +73,12 @@ class FileHandler(object):
 
     :param path: path of the file that should be parsed
     :param filename: original filename of the file (with its extension).
+    :param mapped_file: read-only memory map of the file (see :func:`.map_file`)
+                        or None, shared by all handlers of a file
+
+    .. versionchanged:: 2.0
+        Added the *mapped_file* parameter and the :meth:`get_mapped_file`
+        and :meth:`close` methods.
 
     .. admonition:: Tips for developpers
 
@@ -92,11 +100,38 @@ class FileHandler(object):
             .. automethod:: _set_invalid
     """
 
-    def __init__(self, path, filename):
+    def __init__(self, path, filename, mapped_file=None):
         self._path = path
         self._filename = filename
+        self._mapped_file = mapped_file
+        self._own_map = False
         self._is_valid = False
 
+    def get_mapped_file(self):
+        """
+        Returns a read-only memory map of the file, positioned at its start.
+        The file is mapped if no *mapped_file* was given to the constructor.
+
+        :raises: :exc:`ValueError` if the file is empty
+        """
+        if self._mapped_file is None:
+            self._mapped_file = map_file(self._path)
+            if self._mapped_file is None:
+                raise ValueError("empty file")
+            self._own_map = True
+        self._mapped_file.seek(0)
+        return self._mapped_file
+
+    def close(self):
+        """
+        Closes the memory map created by :meth:`get_mapped_file`.
+        A map given to the constructor is left open.
+        """
+        if self._own_map:
+            self._mapped_file.close()
+            self._mapped_file = None
+            self._own_map = False
+
     def _set_valid(self):
         """ Sets the file as valid """
         self._is_valid = True
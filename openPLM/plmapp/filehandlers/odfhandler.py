@@ -43,10 +43,15 @@ class ODFHandler(FileHandler):
         .. attribute:: format
 
             format of the file (``"A0"`` to ``"A4"`` or ``"Other"``)
+
+    .. versionchanged:: 2.0
+        Accepts the *mapped_file* argument. The file is still parsed from
+        its path since :mod:`zipfile` can not read a memory map before
+        Python 3.13.
     """
 
-    def __init__(self, path, filename):
-        super(ODFHandler, self).__init__(path, filename)
+    def __init__(self, path, filename, mapped_file=None):
+        super(ODFHandler, self).__init__(path, filename, mapped_file)
         try:
             doc = load(path)
             stat = doc.getElementsByType(DocumentStatistic)[0]
@@ -42,11 +42,11 @@ class PDFHandler(FileHandler):
             number of pages of the file
     """
 
-    def __init__(self, path, filename):
-        super(PDFHandler, self).__init__(path, filename)
+    def __init__(self, path, filename, mapped_file=None):
+        super(PDFHandler, self).__init__(path, filename, mapped_file)
         warnings.simplefilter('ignore', DeprecationWarning)
         try:
-            pdf = PdfFileReader(file(path, "rb"))
+            pdf = PdfFileReader(self.get_mapped_file())
             info = pdf.getDocumentInfo()
             if info.title:
                 self.title = info.title
@@ -60,6 +60,8 @@ class PDFHandler(FileHandler):
         except Exception as e:
             # load may raise several exceptions...
             self._set_invalid()
+        finally:
+            self.close()
         warnings.simplefilter('default', DeprecationWarning)
     
     @property
@@ -3,19 +3,64 @@
 # Contact : zahariri.ali@gmail.com
 ######################################
 
-from django.conf import settings
+import hashlib
+
 from django.core.files import temp as tempfile
 from django.core.files.uploadhandler import FileUploadHandler
 from django.core.files.uploadedfile import UploadedFile
 
+from openPLM.plmapp.models import docfs
+from openPLM.plmapp.files.content import HEADER_SIZE
+
 def get_upload_suffix(progress_id):
     return ".%d_openplm_upload" % hash(progress_id)
 
-class ProgressBarUploadHandler(FileUploadHandler):
+class VaultUploadHandler(FileUploadHandler):
+    """
+    .. versionadded:: 2.0
+
+    Upload handler which streams uploaded files into the temporary
+    directory of :obj:`.docfs` while computing their SHA-256 digest
+    and keeping their first bytes (see :class:`VaultUploadedFile`).
+
+    :meth:`.DocumentStorage.save` then moves the file to its final path,
+    so an uploaded file is written only once.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super(VaultUploadHandler, self).new_file(*args, **kwargs)
+        self.file = self.create_file()
+
+    def create_file(self):
+        """
+        Returns the :class:`VaultUploadedFile` of the current file.
+        """
+        return VaultUploadedFile(self.file_name, self.content_type, 0,
+                self.charset)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write_chunk(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.complete(file_size)
+        return self.file
+
+    def upload_complete(self):
+        pass
+
+    def get_file_path(self):
+        return self.file.temporary_file_path()
+
+
+class ProgressBarUploadHandler(VaultUploadHandler):
     """
     Handle and tracks progress for multiple file uploads.
     The http post request must contain a query parameter for each file field,
     which should contain a unique string to identify the temporary file uploaded to be tracked.
+
+    .. versionchanged:: 2.0
+        Files are uploaded to the temporary directory of :obj:`.docfs`
+        (see :class:`VaultUploadHandler`).
     """
 
     def __init__(self, *args, **kwargs):
@@ -29,36 +74,51 @@ class ProgressBarUploadHandler(FileUploadHandler):
         """
         self.progress_id[file_name] = self.request.GET[file_name]
         super(ProgressBarUploadHandler, self).new_file(file_name, *args, **kwargs)
-        self.file = ProgressUploadedFile(self.progress_id[file_name], self.file_name,
+
+    def create_file(self):
+        return ProgressUploadedFile(self.progress_id[self.field_name], self.file_name,
                 self.content_type, 0, self.charset)
 
-    def receive_data_chunk(self, raw_data, start):
-        self.file.write(raw_data)
 
-    def file_complete(self, file_size):
-        self.file.seek(0)
-        self.file.size = file_size
-        return self.file
+class VaultUploadedFile(UploadedFile):
+    """
+    .. versionadded:: 2.0
 
-    def upload_complete(self):
-        pass
+    A file uploaded to the temporary directory of :obj:`.docfs`.
 
-    def get_file_path(self):
-        return self.file.temporary_file_path()
+    .. attribute:: sha256
 
+        SHA-256 hex digest of the content, set once the upload is complete
+    .. attribute:: header
 
-class ProgressUploadedFile(UploadedFile):
-    """
-    A file uploaded to a temporary location with a specified suffix (i.e. stream-to-disk).
+        first :const:`.HEADER_SIZE` bytes of the content
     """
-    def __init__(self, progress_id, name, content_type, size, charset):
-        suffix = get_upload_suffix(progress_id)
-        if settings.FILE_UPLOAD_TEMP_DIR:
-            file = tempfile.NamedTemporaryFile(suffix=suffix,
-                                               dir=settings.FILE_UPLOAD_TEMP_DIR)
-        else:
-            file = tempfile.NamedTemporaryFile(suffix=suffix)
-        super(ProgressUploadedFile, self).__init__(file, name, content_type, size, charset)
+
+    def __init__(self, name, content_type, size, charset, suffix=""):
+        file = tempfile.NamedTemporaryFile(suffix=suffix,
+                dir=docfs.get_temporary_dir())
+        super(VaultUploadedFile, self).__init__(file, name, content_type, size, charset)
+        self._sha = hashlib.sha256()
+        self.sha256 = None
+        self.header = b""
+
+    def write_chunk(self, data):
+        """
+        Writes *data* and updates the digest.
+        """
+        self._sha.update(data)
+        if len(self.header) < HEADER_SIZE:
+            self.header += data[:HEADER_SIZE - len(self.header)]
+        self.file.write(data)
+
+    def complete(self, size):
+        """
+        Method called once all the content has been written.
+        """
+        self.file.flush()
+        self.file.seek(0)
+        self.size = size
+        self.sha256 = self._sha.hexdigest()
 
     def temporary_file_path(self):
         """
@@ -76,3 +136,12 @@ class ProgressUploadedFile(UploadedFile):
                 # calls self.file.file.close() before the exception
                 raise
 
+
+class ProgressUploadedFile(VaultUploadedFile):
+    """
+    A file uploaded to a temporary location with a specified suffix (i.e. stream-to-disk).
+    """
+    def __init__(self, progress_id, name, content_type, size, charset):
+        suffix = get_upload_suffix(progress_id)
+        super(ProgressUploadedFile, self).__init__(name, content_type, size,
+                charset, suffix)
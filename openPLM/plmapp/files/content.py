@@ -0,0 +1,76 @@
+"""
+.. versionadded:: 2.0
+
+Utilities to inspect the content of a stored file without reading it
+more than needed:
+
+    * :func:`sniff_type` guesses the MIME type of a file from its first
+      :const:`HEADER_SIZE` bytes,
+    * :func:`map_file` returns a read-only memory map of a file which
+      can be shared by all :class:`.FileHandler` parsing it.
+"""
+
+import mmap
+import zipfile
+from mimetypes import guess_type
+
+#: number of bytes read by :func:`read_header` and kept by upload handlers
+HEADER_SIZE = 512
+
+#: list of (signature, MIME type) tested by :func:`sniff_type`
+SIGNATURES = (
+    (b"%PDF-", "application/pdf"),
+    (b"ISO-10303-21;", "application/step"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"BZh", "application/x-bzip2"),
+    (b"\xfd7zXZ\x00", "application/x-xz"),
+)
+
+def sniff_type(header, filename):
+    """
+    Returns the MIME type of a file named *filename* whose content starts
+    with *header*.
+
+    The type is guessed from well-known signatures. An OpenDocument
+    archive stores its type in an uncompressed ``mimetype`` entry at the
+    start of the file. If no signature matches, the type is guessed from
+    *filename* and defaults to ``application/octet-stream``.
+    """
+    header = header or b""
+    for signature, mimetype in SIGNATURES:
+        if header.startswith(signature):
+            return mimetype
+    if header.startswith(zipfile.stringFileHeader):
+        # local file header (30 bytes) followed by the name of the entry
+        if header[30:38] == b"mimetype":
+            mimetype = header[38:].split(b"PK", 1)[0].strip()
+            if mimetype:
+                return mimetype.decode("ascii", "ignore")
+        return guess_type(filename, False)[0] or "application/zip"
+    return guess_type(filename, False)[0] or "application/octet-stream"
+
+def read_header(path):
+    """
+    Returns the first :const:`HEADER_SIZE` bytes of the file stored
+    at *path*.
+    """
+    with open(path, "rb") as f:
+        return f.read(HEADER_SIZE)
+
+def map_file(path):
+    """
+    Returns a read-only memory map of the file stored at *path* or None
+    if the file is empty (an empty file cannot be mapped).
+
+    The caller must close the returned map.
+    """
+    with open(path, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
@@ -24,13 +24,27 @@ These constants are lists of tuples (*test*, *selector*) where:
 
 They can be given to :func:`get_deletable_files` to retrieve the list of
 :class:`.DocumentFile` to delete.
+
+.. versionchanged:: 2.0
+
+    Stored files are shared by all :class:`.DocumentFile` with the same
+    content (see :class:`.DocumentStorage`). Selected files are marked as
+    deleted and :func:`remove_unreferenced_files` only removes the stored
+    files which are no longer referenced.
 """
 
+import os
+import stat
+import time
 import fnmatch
+import datetime
 
 from django.conf import settings
+from django.utils import timezone
 from django.db.models import Q, Sum
 
+from openPLM.plmapp.models import DocumentFile, PrivateFile, docfs
+
 class Selector(object):
 
     def get_deletable_files(self, doc_file):
@@ -211,6 +225,55 @@ def get_deletable_files(doc_file, selectors):
             return selector.get_deletable_files(doc_file)
     return []
 
+def remove_unreferenced_files(names):
+    """
+    .. versionadded:: 2.0
+
+    Physically removes the stored files *names* (names of files stored in
+    :obj:`.docfs`) which are not referenced by an undeleted
+    :class:`.DocumentFile` or by a :class:`.PrivateFile`.
+
+    A file is removed while its content is locked (see
+    :meth:`.DocumentStorage.lock`), after its references have been checked
+    again. A file reused by a concurrent save whose reference is not
+    visible yet (see :meth:`.DocumentStorage.get_claim_time`) is kept.
+
+    Returns the list of removed names.
+    """
+    names = set(names)
+    if not names:
+        return []
+    # old private files were attached to documents with their absolute path
+    paths = dict((docfs.path(name), name) for name in names)
+    referenced = _get_referenced(list(names) + list(paths))
+    removed = []
+    for path, name in paths.items():
+        if name in referenced or path in referenced:
+            continue
+        with docfs.lock(name):
+            claim_time = docfs.get_claim_time(name)
+            if claim_time is not None and not _is_saved_since([name, path], claim_time):
+                continue
+            if _get_referenced([name, path]):
+                continue
+            if os.path.exists(path):
+                os.chmod(path, stat.S_IRWXU)
+                os.remove(path)
+            docfs.unclaim(name)
+        removed.append(name)
+    return removed
+
+def _is_saved_since(candidates, timestamp):
+    date = timezone.now() - datetime.timedelta(seconds=time.time() - timestamp)
+    return (DocumentFile.objects.filter(file__in=candidates, ctime__gte=date).exists()
+        or PrivateFile.objects.filter(file__in=candidates, ctime__gte=date).exists())
+
+def _get_referenced(candidates):
+    referenced = set(DocumentFile.objects.filter(file__in=candidates,
+        deleted=False).values_list("file", flat=True))
+    referenced.update(PrivateFile.objects.filter(file__in=candidates).values_list("file", flat=True))
+    return referenced
+
 #: default selectors called after a checkin
 ON_CHECKIN_SELECTORS = [
     #(pattern("*.txt"), KeepAllFiles()),
@@ -304,6 +304,41 @@ def get_creation_form(user, cls=m.PLMObject, data=None, start=0, inbulk_cache=No
 
 get_creation_form.cache = {}
 
+
+class BulkCreationForm(forms.ModelForm):
+    """
+    .. versionadded:: 2.0
+
+    Form used by :class:`.BulkPLMObjectsImporter` to validate a row.
+
+    Unlike :class:`PLMObjectCreationForm`, it does not have *group*,
+    *lifecycle* and *auto* fields and it does not check if the reference
+    is already taken: the importer does it once for several rows.
+    """
+
+    clean_reference = _clean_reference
+    clean_revision = _clean_revision
+
+    def validate_unique(self):
+        pass
+
+
+def get_bulk_creation_form(cls, data):
+    """
+    .. versionadded:: 2.0
+
+    Returns a :class:`BulkCreationForm` bound to *data* suitable to
+    validate a row of type *cls*.
+    """
+    Form = get_bulk_creation_form.cache.get(cls)
+    if Form is None:
+        fields = [f for f in cls.get_creation_fields() if f not in ("type", "group", "lifecycle")]
+        Form = modelform_factory(cls, fields=fields, form=BulkCreationForm)
+        get_bulk_creation_form.cache[cls] = Form
+    return Form(data=data)
+
+get_bulk_creation_form.cache = {}
+
 def get_modification_form(cls=m.PLMObject, data=None, instance=None):
     Form = get_modification_form.cache.get(cls)
     if Form is None:
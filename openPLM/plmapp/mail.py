@@ -25,19 +25,30 @@
 """
 This module contains a function :func:`send_mail` which can be used to notify
 users about a changement in a :class:`.PLMObject`.
+
+.. versionchanged:: 2.0
+
+Notifications of histories (:func:`queue_histories`) are stored in a mail
+outbox (:class:`.PendingMail`) and sent by :func:`do_flush_outbox` which sends
+one digest per recipient through one SMTP connection.
+A flush is scheduled ``MAIL_DIGEST_DELAY`` seconds (0 by default) after
+a notification is queued if no flush is already scheduled
+(see :class:`.ScheduledTask`): one flush sends all histories recorded
+during this delay. A flush locks the pending mails it sends so that
+concurrent flushes never send the same mail twice. The ``flush_mail_outbox``
+command can be run periodically to send mails whose flush has been lost
+(a worker was stopped for example).
 """
 from collections.abc import Iterable, Mapping
 from collections import defaultdict
 
-from operator import itemgetter
-from itertools import groupby
-import networkx as nx 
 #import kjbuckets
 
 from django.conf import settings
 from django.utils import translation
 from django.utils.translation import gettext as _
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
 from django.db.models import Model, Q
 from django.template.loader import render_to_string
 from django.apps import apps
@@ -45,8 +56,17 @@ from django.apps import apps
 from django.contrib.sites.models import Site
 from djcelery_transactions import task
 
-from openPLM.plmapp.models import (User, UserProfile,
-        DelegationLink, ROLE_OWNER, ROLE_SIGN)
+from openPLM.plmapp import delegations
+from openPLM.plmapp.models import (User, UserProfile, History, UserHistory,
+        GroupHistory, PendingMail, PLMObjectUserLink, ScheduledTask,
+        ROLE_OWNER, ROLE_SIGN)
+
+#: delay (in seconds) during which pending histories are merged in one digest
+DIGEST_DELAY = getattr(settings, "MAIL_DIGEST_DELAY", 0)
+#: name of the :class:`.ScheduledTask` of :func:`do_flush_outbox`
+FLUSH_TASK_NAME = "mail_outbox"
+
+_HISTORY_MODELS = dict((m.__name__, m) for m in (History, UserHistory, GroupHistory))
 
 
 def get_recipients(obj, roles, users):
@@ -60,14 +80,10 @@ def get_recipients(obj, roles, users):
                 roles_filter |= Q(role__startswith=role)
             else:
                 roles_filter |= Q(role=role)
-        users = list(manager.filter(roles_filter).values_list("user", flat=True).distinct())
-        recipients.update(users)
-        links = tuple(DelegationLink.current_objects.filter(roles_filter).order_by("role")\
-                .values_list("role", "delegator", "delegatee"))
-        for role, group in groupby(links, itemgetter(0)):
-            gr = nx.DiGraph(tuple((x[1], x[2]) for x in group))
-            for u in users:
-                recipients.update(gr.reachable(u).items())
+        users = manager.filter(roles_filter).values_list("user", "role").distinct()
+        for user, role in users:
+            recipients.add(user)
+            recipients.update(delegations.get_delegatees(user, role))
     elif roles == [ROLE_OWNER]:
         if hasattr(obj, "owner"):
             recipients.add(obj.owner_id)
@@ -75,6 +91,30 @@ def get_recipients(obj, roles, users):
             recipients.add(obj.id)
     return recipients
 
+def get_recipients_in_bulk(plmobject_ids, roles):
+    """
+    .. versionadded:: 2.0
+
+    Returns a dictionary {plmobject id: set of user ids} of users who
+    have one of the roles *roles* (or who are delegated by such users)
+    on the objects *plmobject_ids*. It runs one query whatever the
+    number of objects.
+    """
+    roles_filter = Q()
+    for role in roles:
+        if role == ROLE_SIGN:
+            roles_filter |= Q(role__startswith=role)
+        else:
+            roles_filter |= Q(role=role)
+    recipients = defaultdict(set)
+    links = PLMObjectUserLink.current_objects.filter(roles_filter,
+            plmobject__in=plmobject_ids).order_by()
+    links = links.values_list("plmobject", "role", "user")
+    for plmobject, role, user in links:
+        recipients[plmobject].add(user)
+        recipients[plmobject].update(delegations.get_delegatees(user, role))
+    return recipients
+
 def convert_users(users):
     if users:
         r = iter(users).next()
@@ -137,35 +177,6 @@ def unserialize(obj):
         return [unserialize(o) for o in obj]
     return obj
 
-@task(name="openPLM.plmapp.mail.do_send_histories_mail",ignore_result=True)
-def do_send_histories_mail(plmobject, roles, last_action, histories, user, blacklist=(),
-              users=(), template="mails/history"):
-    """
-    Sends a mail to users who have role *role* for *plmobject*.
-
-    :param plmobject: object which was modified
-    :type plmobject: :class:`.PLMObject`
-    :param str roles: list of roles of the users who should be notified
-    :param str last_action: type of modification
-    :param str histories: list of :class:`.AbstractHistory`
-    :param user: user who made the modification
-    :type user: :class:`~django.contrib.auth.models.User`
-    :param blacklist: list of emails whose no mail should be sent (empty by default).
-
-    """
-    plmobject = unserialize(plmobject)
-    recipients = get_recipients(plmobject, roles, users)
-    if recipients:
-        user = unserialize(user)
-        subject = "[PLM] " + unicode(plmobject)
-        ctx = {
-                "last_action" : last_action,
-                "histories" : histories,
-                "plmobject" : plmobject,
-                "user" : user,
-            }
-        do_send_mail(subject, recipients, ctx, template, blacklist)
-
 @task(name="openPLM.plmapp.mail.do_send_mail", ignore_result=True)
 def do_send_mail(subject, recipients, ctx, template, blacklist=()):
     if recipients:
@@ -206,12 +217,117 @@ def send_mail(subject, recipients, ctx, template, blacklist=()):
     do_send_mail.delay(subject, convert_users(recipients),
             ctx, template, blacklist)
 
-def send_histories_mail(plmobject, roles, last_action, histories, user, blacklist=(),
-              users=(), template="mails/history"):
-    plmobject = CT.from_object(plmobject)
-    histories = serialize(histories)
-    user = CT.from_object(user)
-    do_send_histories_mail.delay(plmobject, roles, last_action, histories,
-            user, blacklist, convert_users(users), template)
+def queue_histories(histories, roles, blacklist=(), users=()):
+    """
+    .. versionadded:: 2.0
+
+    Adds *histories* to the mail outbox and schedules a flush of the outbox
+    (see :func:`do_flush_outbox`) if it is not already scheduled.
+
+    :param histories: list of :class:`.History`, :class:`.UserHistory`
+                      or :class:`.GroupHistory`
+    :param roles: list of roles of the users who should be notified
+    :param blacklist: list of emails whose no mail should be sent
+    :param users: other users (or user ids) who should be notified
+    """
+    roles = ",".join(roles)
+    users = ",".join(str(getattr(u, "id", u)) for u in users)
+    blacklist = ",".join(blacklist)
+    PendingMail.objects.bulk_create([PendingMail(history_type=type(h).__name__,
+        history_id=h.id, roles=roles, users=users, blacklist=blacklist)
+        for h in histories])
+    if ScheduledTask.schedule(FLUSH_TASK_NAME, DIGEST_DELAY):
+        do_flush_outbox.apply_async(countdown=DIGEST_DELAY)
+
+def _get_outbox_recipients(pendings, histories):
+    """
+    Returns a dictionary {user id: list of (history, blacklist)} built from
+    *pendings* (a list of :class:`.PendingMail`).
+    """
+    ids_by_roles = defaultdict(set)
+    for p in pendings:
+        h = histories.get((p.history_type, p.history_id))
+        if h is not None and p.history_type == "History":
+            ids_by_roles[p.roles].add(h.plmobject_id)
+    recipients_by_roles = {}
+    for roles, ids in ids_by_roles.items():
+        recipients_by_roles[roles] = get_recipients_in_bulk(ids, roles.split(","))
+    recipients = defaultdict(list)
+    for p in pendings:
+        h = histories.get((p.history_type, p.history_id))
+        if h is None:
+            # deleted object
+            continue
+        if p.history_type == "History":
+            users = set(recipients_by_roles[p.roles].get(h.plmobject_id, ()))
+        else:
+            users = get_recipients(h.target, p.roles.split(","), ())
+        users.update(int(u) for u in p.users.split(",") if u)
+        blacklist = frozenset(p.blacklist.split(","))
+        for user in users:
+            recipients[user].append((h, blacklist))
+    return recipients
+
+@task(name="openPLM.plmapp.mail.do_flush_outbox", ignore_result=True)
+def do_flush_outbox():
+    """
+    .. versionadded:: 2.0
+
+    Sends all pending mails (:class:`.PendingMail`): each recipient
+    receives one digest of the histories they are notified of.
+    All mails are sent through one connection.
 
+    Pending mails are locked until they are sent and deleted, pending
+    mails locked by a concurrent flush are skipped.
+
+    Returns the number of sent mails.
+    """
+    # mails queued from now schedule a new flush
+    ScheduledTask.start(FLUSH_TASK_NAME)
+    with transaction.atomic():
+        pendings = list(PendingMail.objects.select_for_update(skip_locked=True).order_by("id"))
+        if not pendings:
+            return 0
+        return _flush_pendings(pendings)
+
+def _flush_pendings(pendings):
+    history_ids = defaultdict(set)
+    for p in pendings:
+        history_ids[p.history_type].add(p.history_id)
+    histories = {}
+    for name, ids in history_ids.items():
+        qs = _HISTORY_MODELS[name].objects.filter(id__in=ids).select_related("plmobject", "user")
+        if name == "GroupHistory":
+            qs = qs.select_related("plmobject__groupinfo")
+        for h in qs:
+            h.target = h.plmobject.groupinfo if name == "GroupHistory" else h.plmobject
+            histories[(name, h.id)] = h
+    recipients = _get_outbox_recipients(pendings, histories)
+    users = User.objects.filter(id__in=recipients, is_active=True).exclude(email="")
+    site = Site.objects.get_current()
+    messages = []
+    for user in users.select_related("profile"):
+        hs = set(h for h, blacklist in recipients[user.id] if user.email not in blacklist)
+        if not hs:
+            continue
+        hs = sorted(hs, key=lambda h: h.date)
+        translation.activate(user.profile.language)
+        ctx = {"histories" : hs, "recipient" : user, "site" : site}
+        if len(hs) == 1:
+            subject = u"[PLM] %s" % hs[0].target
+        else:
+            subject = u"[PLM] " + _("%d new actions") % len(hs)
+        html_content = render_to_string("mails/digest.html", ctx)
+        message = render_to_string("mails/digest.txt", ctx)
+        msg = EmailMultiAlternatives(subject, message.strip(),
+            settings.EMAIL_OPENPLM, bcc=[user.email])
+        msg.attach_alternative(html_content, "text/html")
+        messages.append(msg)
+    if messages:
+        translation.deactivate()
+        connection = get_connection(fail_silently=getattr(settings,
+            "EMAIL_FAIL_SILENTLY", True))
+        connection.send_messages(messages)
+    PendingMail.objects.filter(id__in=[p.id for p in pendings]).delete()
+    return len(messages)
 
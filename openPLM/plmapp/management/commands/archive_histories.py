@@ -0,0 +1,35 @@
+"""
+Management utility to move old histories (:class:`.History`,
+:class:`.UserHistory`, :class:`.GroupHistory` and ended
+:class:`.StateHistory`) to the archive tables.
+
+Histories older than ``HISTORY_HOT_DAYS`` days (or ``--days``) are moved.
+Archived histories are still read by the history views and the timeline
+(see :meth:`.ArchivableQuerySet.with_archive`).
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from openPLM.plmapp import models
+
+class Command(BaseCommand):
+
+    help = "Moves old histories to the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, dest="days", default=models.HISTORY_HOT_DAYS,
+            help="age (in days) of the archived histories (default: HISTORY_HOT_DAYS)")
+        parser.add_argument("--batch-size", type=int, dest="batch_size", default=1000,
+            help="number of rows moved per transaction (default: 1000)")
+
+    def handle(self, *args, **options):
+        if options["days"] < 0:
+            raise CommandError("--days must be positive")
+        before = timezone.now() - datetime.timedelta(days=options["days"])
+        for model in (models.History, models.UserHistory, models.GroupHistory,
+                models.StateHistory):
+            count = models.archive_rows(model, before, options["batch_size"])
+            self.stdout.write("%s: %d rows archived.\n" % (model.__name__, count))
@@ -0,0 +1,16 @@
+"""
+Management utility to send pending notification mails
+(:class:`.PendingMail`).
+"""
+
+from django.core.management.base import BaseCommand
+
+from openPLM.plmapp.mail import do_flush_outbox
+
+class Command(BaseCommand):
+
+    help = 'Sends pending notification mails'
+
+    def handle(self, *args, **options):
+        count = do_flush_outbox()
+        self.stdout.write("%d mails sent.\n" % count)
@@ -0,0 +1,226 @@
+"""
+Management utility to rebuild the xapian search index with several
+processes.
+
+Each indexed queryset (:meth:`index_queryset`) is split in chunks of
+consecutive primary keys. Chunks are prepared (including the text
+extraction of document files) by a pool of processes, each chunk is
+written in its own xapian database (a shard). The command merges each
+completed shard in a new index and then records the chunk in a checkpoint
+file so that an interrupted reindexation can be resumed with ``--resume``
+(shards which have not been merged are discarded and indexed again).
+The new index replaces the current index at the end.
+
+Objects modified during the reindexation are indexed in the current
+index by the ``index`` queue. They may not be in the new index, so the
+``index`` workers should be stopped during a reindexation.
+"""
+
+import os
+import json
+import time
+import shutil
+from multiprocessing import Pool, cpu_count
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+CHECKPOINT = "checkpoint.json"
+MERGED = "merged"
+SHARD_PREFIX = "chunk-"
+
+_work_dir = None
+_backend = None
+
+def _init_worker(work_dir):
+    global _work_dir, _backend
+    from haystack import backend, site
+    # connections inherited from the parent process must not be shared
+    connections.close_all()
+    _work_dir = work_dir
+    _backend = backend.SearchBackend(site=site)
+
+def get_shard_path(work_dir, number):
+    """
+    Returns the path of the shard of the chunk *number*.
+    """
+    return os.path.join(work_dir, "%s%06d" % (SHARD_PREFIX, number))
+
+def _index_chunk(args):
+    from haystack import site
+    from openPLM.xapian_backend import IndexWriter
+    from openPLM.plmapp.tasks import _get_manager
+    number, (key, app_label, model_name, first, last) = args
+    path = get_shard_path(_work_dir, number)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    # the shard is committed once the chunk is indexed (see SearchBackend.update)
+    # and closed before it is merged
+    writer = IndexWriter(path, batch_size=float("inf"))
+    model_class = apps.get_model(app_label, model_name)
+    index = site.get_index(model_class)
+    objects = index.index_queryset().filter(pk__gte=first)
+    if last is not None:
+        objects = objects.filter(pk__lte=last)
+    objects = _get_manager(model_class, objects).order_by("pk")
+    count = objects.count()
+    _backend.update(index, objects.iterator(), writer=writer)
+    writer.close()
+    return key, count, path
+
+def get_chunks(chunk_size):
+    """
+    Returns a list of chunks (key, app_label, model_name, first pk, last pk).
+    The last pk of the last chunk of a model is None so that objects created
+    during the reindexation are indexed.
+    """
+    from haystack import site
+    chunks = []
+    for model_class in site.get_indexed_models():
+        index = site.get_index(model_class)
+        app_label = model_class._meta.app_label
+        model_name = model_class._meta.model_name
+        pks = index.index_queryset().order_by("pk").values_list("pk", flat=True)
+        bounds = []
+        for i, pk in enumerate(pks.iterator()):
+            if i % chunk_size == 0:
+                bounds.append([pk, pk])
+            else:
+                bounds[-1][1] = pk
+        if bounds:
+            bounds[-1][1] = None
+        for first, last in bounds:
+            key = "%s.%s:%s" % (app_label, model_name, first)
+            chunks.append((key, app_label, model_name, first, last))
+    return chunks
+
+def merge_shard(shard, database):
+    """
+    Adds the documents of the xapian database *shard* to *database*
+    (a :class:`xapian.WritableDatabase`) and commits it. A document already
+    in *database* (same id term) is replaced so that a shard can be
+    merged twice.
+    """
+    import xapian
+    from openPLM.xapian_backend import DOCUMENT_ID_TERM_PREFIX
+    prefix = DOCUMENT_ID_TERM_PREFIX.encode("ascii")
+    source = xapian.Database(shard)
+    for post in source.postlist(""):
+        document = source.get_document(post.docid)
+        terms = document.termlist()
+        terms.skip_to(prefix)
+        item = next(terms, None)
+        if item is not None and item.term.startswith(prefix):
+            database.replace_document(item.term, document)
+        else:
+            database.add_document(document)
+    database.commit()
+    source.close()
+
+def merge_shards(shards, destination):
+    """
+    Merges the xapian databases *shards* into a new database *destination*.
+    """
+    import xapian
+    if not shards:
+        xapian.WritableDatabase(destination, xapian.DB_CREATE_OR_OVERWRITE).close()
+        return
+    database = xapian.Database()
+    for shard in shards:
+        database.add_database(xapian.Database(shard))
+    if hasattr(database, "compact"):
+        database.compact(destination)
+    else:
+        # xapian < 1.3
+        output = xapian.WritableDatabase(destination, xapian.DB_CREATE_OR_OVERWRITE)
+        for post in database.postlist(""):
+            output.add_document(database.get_document(post.docid))
+        output.close()
+
+
+class Command(BaseCommand):
+
+    help = "Rebuilds the search index with several processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, dest="workers", default=cpu_count(),
+            help="number of processes (default: number of cpus)")
+        parser.add_argument("--chunk-size", type=int, dest="chunk_size", default=1000,
+            help="number of objects per chunk (default: 1000)")
+        parser.add_argument("--resume", action="store_true", dest="resume", default=False,
+            help="resumes an interrupted reindexation")
+
+    def handle(self, *args, **options):
+        import xapian
+        from openPLM.xapian_backend import MEMORY_DB_NAME
+        path = settings.HAYSTACK_XAPIAN_PATH.rstrip(os.path.sep)
+        if path == MEMORY_DB_NAME:
+            raise CommandError("an in-memory index can not be rebuilt")
+        work_dir = path + ".reindex"
+        checkpoint = os.path.join(work_dir, CHECKPOINT)
+        if options["resume"]:
+            if not os.path.exists(checkpoint):
+                raise CommandError("no reindexation to resume")
+            with open(checkpoint) as f:
+                state = json.load(f)
+            # shards of chunks which are not in the checkpoint may be
+            # incomplete or already merged, they are indexed again
+            for name in os.listdir(work_dir):
+                if name.startswith(SHARD_PREFIX):
+                    shutil.rmtree(os.path.join(work_dir, name))
+        else:
+            if os.path.exists(work_dir):
+                shutil.rmtree(work_dir)
+            os.makedirs(work_dir)
+            state = {"chunks" : get_chunks(options["chunk_size"]), "done" : []}
+            self.save_checkpoint(checkpoint, state)
+        done = set(state["done"])
+        chunks = [(i, tuple(c)) for i, c in enumerate(state["chunks"]) if c[0] not in done]
+        total = len(state["chunks"])
+        self.stdout.write("%d chunks to index (%d already indexed)\n" % (len(chunks), len(done)))
+
+        merged = xapian.WritableDatabase(os.path.join(work_dir, MERGED),
+                xapian.DB_CREATE_OR_OPEN)
+        # forked processes must not share the connections of this process
+        connections.close_all()
+        pool = Pool(options["workers"], _init_worker, (work_dir,))
+        start = time.time()
+        count = 0
+        try:
+            for key, nb, shard in pool.imap_unordered(_index_chunk, chunks):
+                merge_shard(shard, merged)
+                count += nb
+                state["done"].append(key)
+                self.save_checkpoint(checkpoint, state)
+                shutil.rmtree(shard)
+                self.stdout.write("%d/%d chunks, %d objects, %.1f objects/s\n" %
+                    (len(state["done"]), total, count, count / (time.time() - start)))
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            merged.close()
+
+        self.stdout.write("compacting the new index...\n")
+        new_path = path + ".new"
+        if os.path.exists(new_path):
+            shutil.rmtree(new_path)
+        merge_shards([os.path.join(work_dir, MERGED)], new_path)
+        old_path = path + ".old"
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(new_path, path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        shutil.rmtree(work_dir)
+        self.stdout.write("%d objects indexed.\n" % count)
+
+    def save_checkpoint(self, checkpoint, state):
+        tmp = checkpoint + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.rename(tmp, checkpoint)
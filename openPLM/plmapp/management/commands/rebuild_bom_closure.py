@@ -0,0 +1,16 @@
+"""
+Management utility to rebuild the BOM closure table
+(:class:`.ParentChildClosure`).
+"""
+
+from django.core.management.base import BaseCommand
+
+from openPLM.plmapp.models import ParentChildClosure
+
+class Command(BaseCommand):
+
+    help = 'Rebuilds the closure table of the current BOMs'
+
+    def handle(self, *args, **options):
+        count = ParentChildClosure.rebuild()
+        self.stdout.write("%d rows created.\n" % count)
@@ -0,0 +1,19 @@
+"""
+.. versionadded:: 2.0
+
+Management utility to recompute the BOM counters of parts
+(:attr:`.Part.children_count`, :attr:`.Part.parents_count` and
+:attr:`.Part.is_top_assembly`).
+"""
+
+from django.core.management.base import BaseCommand
+
+from openPLM.plmapp.models import Part, ParentChildLink, rebuild_bom_counters
+
+class Command(BaseCommand):
+
+    help = 'Recomputes the children and parents counters of all parts'
+
+    def handle(self, *args, **options):
+        count = rebuild_bom_counters(Part, ParentChildLink)
+        self.stdout.write("%d parts fixed.\n" % count)
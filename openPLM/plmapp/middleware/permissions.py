@@ -0,0 +1,29 @@
+"middleware which shares a permission context between all controllers of a request"
+
+from openPLM.plmapp import permissions
+
+
+class PermissionContextMiddleware(object):
+    """
+    .. versionadded:: 2.0
+
+    Attaches a :class:`.PermissionContext` to the authenticated user
+    during the request so that controllers do not query the user's groups,
+    delegations and roles again for each object.
+
+    It must be placed after
+    :class:`~django.contrib.auth.middleware.AuthenticationMiddleware`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            return self.get_response(request)
+        permissions.activate(user)
+        try:
+            return self.get_response(request)
+        finally:
+            permissions.deactivate(user)
@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_closure(apps, schema_editor):
+    from openPLM.plmapp.models.link import rebuild_closure_table
+    rebuild_closure_table(apps.get_model('plmapp', 'ParentChildClosure'),
+            apps.get_model('plmapp', 'ParentChildLink'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0002_alter_invitation_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParentChildClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('paths', models.PositiveIntegerField(default=1)),
+                ('quantity', models.FloatField(default=1)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='plmapp.part')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='plmapp.part')),
+            ],
+            options={
+                'unique_together': {('ancestor', 'descendant', 'depth')},
+                'indexes': [models.Index(fields=['descendant', 'ancestor'], name='plmapp_pare_descend_64022a_idx')],
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
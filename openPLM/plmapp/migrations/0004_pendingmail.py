@@ -0,0 +1,24 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0003_parentchildclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingMail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('history_type', models.CharField(max_length=20)),
+                ('history_id', models.PositiveIntegerField()),
+                ('roles', models.CharField(max_length=200)),
+                ('users', models.TextField(blank=True)),
+                ('blacklist', models.TextField(blank=True)),
+                ('ctime', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,49 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def denormalize_histories(apps, schema_editor):
+    History = apps.get_model("plmapp", "History")
+    PLMObject = apps.get_model("plmapp", "PLMObject")
+    group_ids = PLMObject.objects.order_by().values_list("group", flat=True).distinct()
+    for group_id in group_ids:
+        History.objects.filter(plmobject__group=group_id).update(group=group_id)
+    History.objects.filter(plmobject__owner__username=settings.COMPANY).update(public=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0004_pendingmail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='history',
+            name='group',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='plmapp.groupinfo'),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='public',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(denormalize_histories, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['public', '-date', '-id'], name='plmapp_hist_public_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['group', 'public', '-date', '-id'], name='plmapp_hist_group_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userhistory',
+            index=models.Index(fields=['-date', '-id'], name='plmapp_userhist_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grouphistory',
+            index=models.Index(fields=['-date', '-id'], name='plmapp_grouphist_date_idx'),
+        ),
+    ]
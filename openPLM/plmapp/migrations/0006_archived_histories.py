@@ -0,0 +1,77 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+ACTIONS = [('Create', 'Create'), ('Delete', 'Delete'), ('Modify', 'Modify'), ('Revise', 'Revise'), ('Promote', 'Promote'), ('Demote', 'Demote'), ('Cancel', 'Cancel'), ('Publish', 'Publish'), ('Unpublish', 'Unpublish')]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('plmapp', '0005_history_denormalized'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGroupHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=ACTIONS, max_length=50)),
+                ('details', models.TextField()),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('plmobject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auth.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-date', '-id'], name='plmapp_agrouphist_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=ACTIONS, max_length=50)),
+                ('details', models.TextField()),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('public', models.BooleanField(default=False)),
+                ('group', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='plmapp.groupinfo')),
+                ('plmobject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='plmapp.plmobject')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['-date', '-id'], name='plmapp_ahist_date_idx'),
+                    models.Index(fields=['public', '-date', '-id'], name='plmapp_ahist_public_date_idx'),
+                    models.Index(fields=['group', 'public', '-date', '-id'], name='plmapp_ahist_group_date_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedStateHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField(db_index=True, null=True)),
+                ('state_category', models.PositiveSmallIntegerField(choices=[(0, 'draft'), (1, 'proposed'), (2, 'official'), (3, 'deprecated'), (4, 'cancelled')])),
+                ('lifecycle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='plmapp.lifecycle')),
+                ('plmobject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='plmapp.plmobject')),
+                ('state', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='plmapp.state')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedUserHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=ACTIONS, max_length=50)),
+                ('details', models.TextField()),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('plmobject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-date', '-id'], name='plmapp_auserhist_date_idx')],
+            },
+        ),
+    ]
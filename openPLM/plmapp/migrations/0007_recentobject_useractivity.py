@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_activity(apps, schema_editor):
+    History = apps.get_model("plmapp", "History")
+    ArchivedHistory = apps.get_model("plmapp", "ArchivedHistory")
+    RecentObject = apps.get_model("plmapp", "RecentObject")
+    UserActivity = apps.get_model("plmapp", "UserActivity")
+    # counters of hot and archived histories
+    counts = {}
+    for model in (History, ArchivedHistory):
+        rows = model.objects.order_by().values_list("user", "action")\
+                .annotate(count=models.Count("id"))
+        for user, action, count in rows:
+            counts[(user, action)] = counts.get((user, action), 0) + count
+    UserActivity.objects.bulk_create([UserActivity(user_id=user, action=action, count=count)
+        for (user, action), count in counts.items()], batch_size=1000)
+    # last history of each (user, plmobject)
+    last_ids = History.objects.order_by().values("user", "plmobject")\
+            .annotate(last=models.Max("id")).values_list("last", flat=True)
+    last_ids = list(last_ids)
+    for i in range(0, len(last_ids), 1000):
+        histories = History.objects.filter(id__in=last_ids[i:i+1000])
+        RecentObject.objects.bulk_create([RecentObject(user_id=h.user_id,
+            plmobject_id=h.plmobject_id, date=h.date, action=h.action,
+            details=h.details) for h in histories])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0006_archived_histories'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecentObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('action', models.CharField(max_length=50)),
+                ('details', models.TextField()),
+                ('plmobject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='plmapp.plmobject')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-date'], name='plmapp_recent_user_date_idx')],
+                'unique_together': {('user', 'plmobject')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UserActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'action')},
+            },
+        ),
+        migrations.RunPython(fill_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations, models
+
+
+DRAFT, PROPOSED, OFFICIAL, DEPRECATED, CANCELLED = range(5)
+
+def fill_state_categories(apps, schema_editor):
+    Lifecycle = apps.get_model("plmapp", "Lifecycle")
+    LifecycleStates = apps.get_model("plmapp", "LifecycleStates")
+    PLMObject = apps.get_model("plmapp", "PLMObject")
+    for lifecycle in Lifecycle.objects.all():
+        states = list(LifecycleStates.objects.filter(lifecycle=lifecycle)
+                .order_by("rank").values_list("state", flat=True))
+        for state in states:
+            if state == "cancelled":
+                category = CANCELLED
+            elif state == lifecycle.official_state_id:
+                category = OFFICIAL
+            elif state == states[0]:
+                category = DRAFT
+            elif state == states[-1]:
+                category = DEPRECATED
+            else:
+                category = PROPOSED
+            PLMObject.objects.filter(lifecycle=lifecycle, state=state)\
+                    .update(state_category=category)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0007_recentobject_useractivity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plmobject',
+            name='state_category',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'draft'), (1, 'proposed'), (2, 'official'), (3, 'deprecated'), (4, 'cancelled')], default=0, editable=False),
+        ),
+        migrations.RunPython(fill_state_categories, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='plmobject',
+            index=models.Index(fields=['group', 'state_category'], name='plmapp_plmobj_group_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plmobject',
+            index=models.Index(fields=['type', 'state_category'], name='plmapp_plmobj_type_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plmobject',
+            index=models.Index(fields=['owner', 'state_category'], name='plmapp_plmobj_owner_cat_idx'),
+        ),
+    ]
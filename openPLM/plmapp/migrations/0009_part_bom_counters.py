@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+def build_counters(apps, schema_editor):
+    from openPLM.plmapp.models.link import rebuild_bom_counters
+    rebuild_bom_counters(apps.get_model('plmapp', 'Part'),
+            apps.get_model('plmapp', 'ParentChildLink'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0008_plmobject_state_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='children_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='part',
+            name='parents_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='part',
+            name='is_top_assembly',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(build_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='part',
+            index=models.Index(fields=['is_top_assembly', '-children_count'], name='plmapp_part_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='part',
+            index=models.Index(fields=['-children_count'], name='plmapp_part_children_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='part',
+            index=models.Index(fields=['-parents_count'], name='plmapp_part_parents_idx'),
+        ),
+    ]
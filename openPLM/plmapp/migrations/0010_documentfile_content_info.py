@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0009_part_bom_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentfile',
+            name='sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='documentfile',
+            name='mimetype',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
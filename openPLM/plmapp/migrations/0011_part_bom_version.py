@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+import openPLM.plmapp.models.part
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0010_documentfile_content_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='bom_version',
+            field=models.CharField(default=openPLM.plmapp.models.part.new_bom_version, editable=False, max_length=32),
+        ),
+    ]
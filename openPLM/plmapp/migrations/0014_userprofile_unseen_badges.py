@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0013_scheduledtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unseen_badges',
+            field=models.BooleanField(blank=True, default=False, editable=False),
+        ),
+    ]
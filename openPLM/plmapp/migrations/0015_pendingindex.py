@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plmapp', '0014_userprofile_unseen_badges'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identifier', models.CharField(max_length=255)),
+                ('remove', models.BooleanField(default=False)),
+                ('fast_reindex', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
@@ -32,7 +32,7 @@ Models for openPLM
 
 This module contains openPLM's main models.
 
-There are 5 kinds of models:
+There are 6 kinds of models:
     * User and group related:
         - :class:`.UserProfile`
         - :class:`.GroupInfo`
@@ -50,6 +50,7 @@ There are 5 kinds of models:
         - :class:`.UserHistory`
         - :class:`.GroupHistory`
         - :class:`.history.StateHistory`
+        - :class:`.PendingMail`
     * PLMObject models:
         - :class:`.PLMObject` is the base class
         - :class:`.Part`
@@ -60,15 +61,22 @@ There are 5 kinds of models:
         - functions:
             - :func:`.get_all_plmobjects`
             - :func:`.part.get_all_parts`
+            - :func:`.new_bom_version`
             - :func:`.get_all_documents`
             - :func:`.import_models`
     * :class:`.link.Link` models:
         - :class:`.RevisionLink`
         - :class:`.ParentChildLink`
+        - :class:`.ParentChildClosure`
         - :class:`.DocumentPartLink`
         - :class:`.DelegationLink`
         - :class:`.PLMObjectUserLink`
         - :class:`.AlternatePartSet`
+    * Cache related:
+        - :class:`.CacheVersion`
+    * Task related:
+        - :class:`.ScheduledTask`
+        - :class:`.PendingIndex`
 
 
 Inheritance diagrams
@@ -104,6 +112,12 @@ Links
 .. inheritance-diagram:: openPLM.plmapp.models.link
     :parts: 1
 
+Caches
+------
+
+.. inheritance-diagram:: openPLM.plmapp.models.version
+    :parts: 1
+
 Classes and functions
 ========================
 
@@ -123,6 +137,8 @@ from openPLM.plmapp.models.part import *
 from openPLM.plmapp.models.document import *
 from openPLM.plmapp.models.history import *
 from openPLM.plmapp.models.link import *
+from openPLM.plmapp.models.version import *
+from openPLM.plmapp.models.task import *
 
 # monkey patch Comment models to select related fields
 from django_comments.models import Comment
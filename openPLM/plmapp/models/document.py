@@ -1,11 +1,20 @@
 import os
+import time
 import string
 import random
 import hashlib
+import tempfile
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, stored files are not locked
+    fcntl = None
 from django.utils import timezone
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.files import File
 from django.core.files.storage import FileSystemStorage
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import gettext_noop
@@ -22,7 +31,197 @@ from .plmobject import (PLMObject, get_all_subclasses,
 class DocumentStorage(FileSystemStorage):
     """
     File system storage which stores files with a specific name
+
+    .. versionchanged:: 2.0
+        :meth:`save` stores files by content (see :meth:`get_content_name`):
+        a content is stored once and its file is shared by all
+        :class:`DocumentFile` and :class:`PrivateFile` which have the
+        same content. A stored file must be removed with
+        :func:`.deletable.remove_unreferenced_files`.
     """
+
+    #: size of the chunks read while hashing a file
+    CHUNK_SIZE = 64 * 1024
+
+    #: maximum number of seconds during which a stored file reused by
+    #: :meth:`save` is not removed, see :meth:`get_claim_time`
+    CLAIM_DELAY = 3600
+
+    def get_content_name(self, name, digest):
+        """
+        .. versionadded:: 2.0
+
+        Returns the path of a file *name* whose content has the SHA-256
+        hex digest *digest*.
+
+        The path is made of a directory which name is the last extension
+        of *name* (like :meth:`get_available_name`) and of the digest
+        followed by the extension. For example, a possible output for
+        :file:`.my_file.tar.gz` is:
+
+            :file:`gz/9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08.gz`
+        """
+        basename = os.path.basename(name)
+        ext = os.path.splitext(basename)[1]
+        ext2 = ext.lstrip(".").lower() or "no_ext"
+        return os.path.join(ext2, digest + ext)
+
+    def get_digest(self, name):
+        """
+        .. versionadded:: 2.0
+
+        Returns the SHA-256 hex digest of the content of the stored file *name*
+        or an empty string if *name* is not a content name (files stored
+        before 2.0).
+        """
+        digest = os.path.splitext(os.path.basename(name))[0]
+        if len(digest) == 64 and all(c in string.hexdigits for c in digest):
+            return digest
+        return ""
+
+    def get_temporary_dir(self):
+        """
+        .. versionadded:: 2.0
+
+        Returns the directory which stores files being written. It is on
+        the same file system as stored files so that a file can be
+        moved to its final path without being copied.
+        """
+        return self._get_dir(".tmp")
+
+    def _get_dir(self, name):
+        directory = self.path(name)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another process
+                pass
+        return directory
+
+    @contextmanager
+    def lock(self, name):
+        """
+        .. versionadded:: 2.0
+
+        Context manager which holds an exclusive lock (:func:`fcntl.flock`)
+        on the content of the stored file *name* so that :meth:`save` does
+        not reuse a file being removed by
+        :func:`.deletable.remove_unreferenced_files`.
+
+        Files stored before 2.0 (see :meth:`get_digest`) are not shared
+        and are not locked.
+        """
+        digest = self.get_digest(name)
+        if fcntl is None or not digest:
+            yield
+            return
+        # 256 lock files shared by all contents
+        lock_path = os.path.join(self._get_dir(".locks"), digest[:2])
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _get_claim_path(self, name):
+        return os.path.join(self.path(".claims"), self.get_digest(name))
+
+    def _claim(self, name):
+        self._get_dir(".claims")
+        with open(self._get_claim_path(name), "w") as f:
+            f.write(str(int(time.time())))
+
+    def get_claim_time(self, name):
+        """
+        .. versionadded:: 2.0
+
+        Returns the time (seconds since the epoch) at which the stored file
+        *name* has been reused by :meth:`save`, or None if it has not been
+        reused for :attr:`CLAIM_DELAY` seconds.
+
+        The reference to a reused file may not be committed yet, so the file
+        must be kept until a reference created after this time is
+        visible. The caller must hold :meth:`lock`.
+        """
+        if not self.get_digest(name):
+            return None
+        try:
+            with open(self._get_claim_path(name)) as f:
+                claim_time = int(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+        if time.time() - claim_time >= self.CLAIM_DELAY:
+            return None
+        return claim_time
+
+    def unclaim(self, name):
+        """
+        .. versionadded:: 2.0
+
+        Removes the claim on the stored file *name* (see :meth:`get_claim_time`).
+        The caller must hold :meth:`lock`.
+        """
+        if self.get_digest(name):
+            try:
+                os.remove(self._get_claim_path(name))
+            except OSError:
+                pass
+
+    def _move(self, tmp_path, path):
+        full_path = self.path(path)
+        with self.lock(path):
+            if os.path.exists(full_path):
+                os.remove(tmp_path)
+                # the file is shared: a concurrent remove_unreferenced_files
+                # must not remove it before the new reference is committed
+                self._claim(path)
+            else:
+                self._get_dir(os.path.dirname(path))
+                os.rename(tmp_path, full_path)
+                # a claim on a removed file is outdated
+                self.unclaim(path)
+
+    def save(self, name, content, max_length=None):
+        """
+        .. versionadded:: 2.0
+
+        Saves *content* and returns its path (see :meth:`get_content_name`).
+
+        The content is hashed while it is written to a temporary file which is
+        then moved to its final path or discarded if a file with the same
+        content is already stored, so *content* is read only once.
+
+        An uploaded file already written in :meth:`get_temporary_dir` with
+        a ``sha256`` attribute (see :class:`.VaultUploadHandler`) is moved
+        without being read.
+        """
+        digest = getattr(content, "sha256", None)
+        if digest and hasattr(content, "temporary_file_path"):
+            tmp_path = content.temporary_file_path()
+            if os.path.dirname(os.path.realpath(tmp_path)) == \
+                    os.path.realpath(self.get_temporary_dir()):
+                path = self.get_content_name(name, digest)
+                self._move(tmp_path, path)
+                return path
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        fd, tmp_path = tempfile.mkstemp(dir=self.get_temporary_dir())
+        sha = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in content.chunks(self.CHUNK_SIZE):
+                    sha.update(chunk)
+                    tmp.write(chunk)
+            path = self.get_content_name(name, sha.hexdigest())
+            self._move(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
     def get_available_name(self, name):
         """
         Returns a path for a file *name*, the path always refers to a file
@@ -120,6 +319,18 @@ class DocumentFile(models.Model):
         .. attribute:: deleted
 
             True if the file has been physically removed
+        .. attribute:: sha256
+
+            .. versionadded:: 2.0
+
+            SHA-256 hex digest of the content of the file (empty if the file
+            was stored before 2.0)
+        .. attribute:: mimetype
+
+            .. versionadded:: 2.0
+
+            MIME type sniffed from the content of the file
+            (see :func:`.sniff_type`)
 
     """
 
@@ -129,6 +340,8 @@ class DocumentFile(models.Model):
     filename = models.CharField(max_length=200)
     file = models.FileField(upload_to=".", storage=docfs)
     size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, default="", editable=False)
+    mimetype = models.CharField(max_length=100, blank=True, default="", editable=False)
     thumbnail = models.ImageField(upload_to=".", storage=thumbnailfs,
                                  blank=True, null=True)
     locked = models.BooleanField(default=False)
@@ -1,15 +1,18 @@
-from itertools import chain
 import datetime
+from collections import defaultdict
+
 from django.utils import timezone
 
 from django.conf import settings
-from django.db import models
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models.signals import post_save
 from django.db.models.query import QuerySet
 from django.contrib.auth.models import User, Group
 from django_comments.signals import comment_was_posted
 from django.utils.translation import gettext_lazy as _
 
-from .lifecycle import State, Lifecycle, get_cancelled_state
+from .lifecycle import State, Lifecycle, LifecycleInfo, get_lifecycle_registry
+from .group import GroupInfo
 from .plmobject import PLMObject
 from .part import get_all_parts
 from .document import get_all_documents
@@ -17,6 +20,75 @@ from .document import get_all_documents
 def _prefetch_related(qs, *extra):
     return qs.prefetch_related("plmobject", "user", "user__profile", *extra)
 
+#: number of days during which histories stay in the hot tables, older
+#: histories are moved to the archive tables by the ``archive_histories``
+#: command
+HISTORY_HOT_DAYS = getattr(settings, "HISTORY_HOT_DAYS", 365)
+
+
+class ArchivableQuerySet(QuerySet):
+    """
+    .. versionadded:: 2.0
+
+    QuerySet of a history model whose old rows are moved to an archive
+    table (see :data:`ARCHIVES` and :func:`archive_rows`).
+
+    The queryset only reads the hot table, :meth:`with_archive` returns a
+    queryset that also reads the archive table. Filters of the queryset
+    are recorded so that they can be applied to the archive table.
+    """
+
+    _archive_filters = ()
+
+    def _clone(self):
+        clone = super(ArchivableQuerySet, self)._clone()
+        clone._archive_filters = self._archive_filters
+        return clone
+
+    def _filter_or_exclude_inplace(self, negate, args, kwargs):
+        self._archive_filters += ((negate, args, kwargs),)
+        super(ArchivableQuerySet, self)._filter_or_exclude_inplace(negate, args, kwargs)
+
+    def archived(self):
+        """
+        Returns a queryset of the archived rows that match the filters
+        of this queryset.
+        """
+        qs = ARCHIVES[self.model].objects.all()
+        for negate, args, kwargs in self._archive_filters:
+            if negate:
+                qs = qs.exclude(*args, **kwargs)
+            else:
+                qs = qs.filter(*args, **kwargs)
+        return qs
+
+    def with_archive(self, since=None):
+        """
+        Returns a queryset of the hot and archived rows that match the
+        filters of this queryset. Archived rows are returned as instances
+        of the hot model.
+
+        If *since* is not None, the archive table is read only if it
+        contains rows newer than *since* (see :func:`is_archived`).
+
+        The returned queryset is a union: it can only be ordered, sliced,
+        counted or converted to values. Related objects must be
+        prefetched (:meth:`prefetch_related`) before calling this method.
+        """
+        if self.query.is_empty() or (since is not None and
+                not is_archived(self.model, since)):
+            return self
+        hot = self._chain()
+        hot.query.select_related = False
+        return hot.union(self.archived(), all=True)
+
+
+class ArchivableManager(models.Manager.from_queryset(ArchivableQuerySet)):
+    """ Manager of the history models, returns an :class:`ArchivableQuerySet`. """
+
+    use_for_related_fields = True
+
+
 # history stuff
 class AbstractHistory(models.Model):
     u"""
@@ -82,25 +154,71 @@ class AbstractHistory(models.Model):
 
 
 class History(AbstractHistory):
+    """
+    History of a :class:`.PLMObject`.
+
+    .. versionadded:: 2.0
+
+        :attr:`group` and :attr:`public` are copies of the group
+        and of the ownership of :attr:`plmobject`. They are set by
+        :meth:`denormalize` and let the timeline (see :mod:`.timeline`)
+        select readable histories without joining the plmobject table.
+
+    .. attribute:: group
+
+        group of :attr:`plmobject`
+
+    .. attribute:: public
+
+        True if :attr:`plmobject` is owned by the company
+    """
     class Meta:
         app_label = "plmapp"
+        indexes = [
+            models.Index(fields=["public", "-date", "-id"], name="plmapp_hist_public_date_idx"),
+            models.Index(fields=["group", "public", "-date", "-id"], name="plmapp_hist_group_date_idx"),
+        ]
+
     plmobject = models.ForeignKey(PLMObject,on_delete=models.CASCADE)
+    group = models.ForeignKey(GroupInfo, null=True, related_name="+", on_delete=models.CASCADE)
+    public = models.BooleanField(default=False)
+
+    objects = ArchivableManager()
 
     def get_redirect_url(self):
         return "/history_item/object/%d/" % self.id
 
+    def denormalize(self):
+        """
+        Sets :attr:`group` and :attr:`public` from :attr:`plmobject`.
+        It is called by :meth:`save` and must be called before a
+        :meth:`~django.db.models.query.QuerySet.bulk_create`.
+        """
+        self.group_id = self.plmobject.group_id
+        self.public = self.plmobject.owner.username == settings.COMPANY
+
+    def save(self, *args, **kwargs):
+        if self.group_id is None:
+            self.denormalize()
+        super(History, self).save(*args, **kwargs)
+
     @classmethod
     def timeline_items(cls, user):
-        q = models.Q(plmobject__owner__username=settings.COMPANY)
-        q |= models.Q(plmobject__group__in=user.groups.all())
-        histories = History.objects.filter(q).order_by('-date')
+        q = models.Q(public=True)
+        q |= models.Q(group__in=user.groups.all())
+        histories = History.objects.filter(q).order_by('-date', '-id')
         return _prefetch_related(histories)
 
 class UserHistory(AbstractHistory):
     class Meta:
         app_label = "plmapp"
+        indexes = [
+            models.Index(fields=["-date", "-id"], name="plmapp_userhist_date_idx"),
+        ]
     plmobject = models.ForeignKey(User,on_delete=models.CASCADE)
 
+    objects = ArchivableManager()
+
     def get_redirect_url(self):
         return "/history_item/user/%d/" % self.id
 
@@ -116,8 +234,13 @@ class UserHistory(AbstractHistory):
 class GroupHistory(AbstractHistory):
     class Meta:
         app_label = "plmapp"
+        indexes = [
+            models.Index(fields=["-date", "-id"], name="plmapp_grouphist_date_idx"),
+        ]
     plmobject = models.ForeignKey(Group,on_delete=models.CASCADE)
 
+    objects = ArchivableManager()
+
     def get_redirect_url(self):
         return "/history_item/group/%d/" % self.id
 
@@ -130,7 +253,7 @@ class GroupHistory(AbstractHistory):
         return self.plmobject.groupinfo.title
 
 
-class StateHistoryQuerySet(QuerySet):
+class StateHistoryQuerySet(ArchivableQuerySet):
     """ QuerySet with utility methods to filter :class:`StateHistory` alive at a given time."""
 
     def now(self):
@@ -234,14 +357,10 @@ class StateHistory(models.Model):
     class Meta:
         app_label = "plmapp"
 
-    DRAFT, PROPOSED, OFFICIAL, DEPRECATED, CANCELLED = range(5)
-    STATE_CATEGORIES = (
-        (DRAFT, "draft"),
-        (PROPOSED, "proposed"),
-        (OFFICIAL, "official"),
-        (DEPRECATED, "deprecated"),
-        (CANCELLED, "cancelled")
-    )
+    DRAFT, PROPOSED, OFFICIAL, DEPRECATED, CANCELLED = (LifecycleInfo.DRAFT,
+        LifecycleInfo.PROPOSED, LifecycleInfo.OFFICIAL, LifecycleInfo.DEPRECATED,
+        LifecycleInfo.CANCELLED)
+    STATE_CATEGORIES = LifecycleInfo.STATE_CATEGORIES
 
     plmobject = models.ForeignKey(PLMObject,on_delete=models.CASCADE)
     state = models.ForeignKey(State,on_delete=models.CASCADE)
@@ -253,64 +372,345 @@ class StateHistory(models.Model):
 
     objects = StateHistoryManager()
 
+    def get_state_category(self):
+        """
+        .. versionadded:: 2.0
+
+        Returns the category of :attr:`state`. This method is called by
+        :meth:`save`, it must be called to set :attr:`state_category`
+        before a :meth:`~django.db.models.query.QuerySet.bulk_create`.
+        The category is read from the :func:`lifecycle registry
+        <.get_lifecycle_registry>` without any query.
+        """
+        return get_lifecycle_registry().get_category(self.state_id, self.lifecycle_id)
+
     def save(self, *args, **kwargs):
-        if self.state == get_cancelled_state():
-            category = StateHistory.CANCELLED
-        elif self.state == self.lifecycle.official_state:
-            category = StateHistory.OFFICIAL
-        elif self.state == self.lifecycle.first_state:
-            category = StateHistory.DRAFT
-        elif self.state == self.lifecycle.last_state:
-            category = StateHistory.DEPRECATED
-        else:
-            category = StateHistory.PROPOSED
-        self.state_category = category
+        self.state_category = self.get_state_category()
         super(StateHistory, self).save(*args, **kwargs)
 
-def timeline_histories(self,user, date_begin=None, date_end=None, done_by=None, list_display=None):
-    if date_begin is None and date_end is None:
-        return History.timeline_items(user)
+class ArchivedHistory(AbstractHistory):
+    """
+    .. versionadded:: 2.0
+
+    Archived :class:`History`. Rows keep their id.
+    """
+    class Meta:
+        app_label = "plmapp"
+        indexes = [
+            models.Index(fields=["-date", "-id"], name="plmapp_ahist_date_idx"),
+            models.Index(fields=["public", "-date", "-id"], name="plmapp_ahist_public_date_idx"),
+            models.Index(fields=["group", "public", "-date", "-id"], name="plmapp_ahist_group_date_idx"),
+        ]
+
+    ARCHIVE_DATE = "date"
+
+    plmobject = models.ForeignKey(PLMObject, related_name="+", on_delete=models.CASCADE)
+    group = models.ForeignKey(GroupInfo, null=True, related_name="+", on_delete=models.CASCADE)
+    public = models.BooleanField(default=False)
+
+    def get_redirect_url(self):
+        return "/history_item/object/%d/" % self.id
+
+
+class ArchivedUserHistory(AbstractHistory):
+    """
+    .. versionadded:: 2.0
+
+    Archived :class:`UserHistory`. Rows keep their id.
+    """
+    class Meta:
+        app_label = "plmapp"
+        indexes = [
+            models.Index(fields=["-date", "-id"], name="plmapp_auserhist_date_idx"),
+        ]
+
+    ARCHIVE_DATE = "date"
+
+    plmobject = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+
+    def get_redirect_url(self):
+        return "/history_item/user/%d/" % self.id
+
+    @property
+    def title(self):
+        return self.plmobject.username
+
+
+class ArchivedGroupHistory(AbstractHistory):
+    """
+    .. versionadded:: 2.0
+
+    Archived :class:`GroupHistory`. Rows keep their id.
+    """
+    class Meta:
+        app_label = "plmapp"
+        indexes = [
+            models.Index(fields=["-date", "-id"], name="plmapp_agrouphist_date_idx"),
+        ]
+
+    ARCHIVE_DATE = "date"
+
+    plmobject = models.ForeignKey(Group, related_name="+", on_delete=models.CASCADE)
+
+    def get_redirect_url(self):
+        return "/history_item/group/%d/" % self.id
+
+    @property
+    def title(self):
+        return self.plmobject.groupinfo.title
+
+
+class ArchivedStateHistory(models.Model):
+    """
+    .. versionadded:: 2.0
+
+    Archived :class:`StateHistory` (only ended state histories are
+    archived). Rows keep their id.
+    """
+    class Meta:
+        app_label = "plmapp"
+
+    ARCHIVE_DATE = "end_time"
+
+    plmobject = models.ForeignKey(PLMObject, related_name="+", on_delete=models.CASCADE)
+    state = models.ForeignKey(State, related_name="+", on_delete=models.CASCADE)
+    lifecycle = models.ForeignKey(Lifecycle, related_name="+", on_delete=models.CASCADE)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField(null=True, db_index=True)
+    state_category = models.PositiveSmallIntegerField(choices=StateHistory.STATE_CATEGORIES)
+
+
+#: dictionary {hot model: archive model}, both models have the same columns
+ARCHIVES = {
+    History : ArchivedHistory,
+    UserHistory : ArchivedUserHistory,
+    GroupHistory : ArchivedGroupHistory,
+    StateHistory : ArchivedStateHistory,
+}
+
+def get_archive_date(model):
+    """
+    .. versionadded:: 2.0
+
+    Returns the date of the newest archived row of *model* (a hot model),
+    None if no row has been archived.
+
+    The date is read from the archive table (its date column is indexed)
+    so that all processes see the rows archived by :func:`archive_rows`.
+    """
+    archive = ARCHIVES[model]
+    return archive.objects.aggregate(date=models.Max(archive.ARCHIVE_DATE))["date"]
+
+def is_archived(model, since):
+    """
+    .. versionadded:: 2.0
+
+    Returns True if rows of *model* newer than *since* may have been archived.
+    """
+    date = get_archive_date(model)
+    return date is not None and date >= since
+
+def archive_rows(model, before, batch_size=1000):
+    """
+    .. versionadded:: 2.0
+
+    Moves the rows of *model* (a hot model) older than *before* to its
+    archive table, by batches of *batch_size* rows. Each batch is moved
+    in a transaction.
+
+    :returns: the number of archived rows
+    """
+    archive = ARCHIVES[model]
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(f.column) for f in model._meta.concrete_fields)
+    old = model._default_manager.filter(**{archive.ARCHIVE_DATE + "__lt" : before})
+    old = old.order_by("id").values_list("id", flat=True)
+    count = 0
+    while True:
+        ids = list(old[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute("INSERT INTO %s (%s) SELECT %s FROM %s WHERE id IN (%s)" % (
+                qn(archive._meta.db_table), columns, columns,
+                qn(model._meta.db_table), ", ".join(["%s"] * len(ids))), ids)
+            model._default_manager.filter(id__in=ids).delete()
+        count += len(ids)
+    return count
+
+
+class PendingMail(models.Model):
+    """
+    .. versionadded:: 2.0
+
+    Mail outbox: a history line whose notification has not been sent yet.
+
+    Pending mails are sent by :func:`.mail.do_flush_outbox` which merges
+    all pending histories of a recipient in one digest.
+
+    :model attributes:
+        .. attribute:: history_type
+
+            name of the history model (``"History"``, ``"UserHistory"``
+            or ``"GroupHistory"``)
+        .. attribute:: history_id
+
+            id of the history line
+        .. attribute:: roles
+
+            comma separated list of roles of the users who should be notified
+        .. attribute:: users
+
+            comma separated list of ids of other users who should be notified
+        .. attribute:: blacklist
+
+            comma separated list of emails whose no mail should be sent
+        .. attribute:: ctime
+
+            date of creation
+    """
+
+    class Meta:
+        app_label = "plmapp"
+
+    history_type = models.CharField(max_length=20)
+    history_id = models.PositiveIntegerField()
+    roles = models.CharField(max_length=200)
+    users = models.TextField(blank=True)
+    blacklist = models.TextField(blank=True)
+    ctime = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __unicode__(self):
+        return u"PendingMail<%s, %d>" % (self.history_type, self.history_id)
+
+
+class RecentObject(models.Model):
+    """
+    .. versionadded:: 2.0
+
+    Last history recorded by a user on a plmobject: there is one row
+    per (user, plmobject) updated by :func:`record_histories` each time
+    a :class:`History` is created.
+
+    It has the same attributes as :class:`History`, so that the last
+    edited objects of a user are read with one indexed query
+    (see :meth:`get_last_edited`).
+    """
+    class Meta:
+        app_label = "plmapp"
+        unique_together = (("user", "plmobject"),)
+        indexes = [
+            models.Index(fields=["user", "-date"], name="plmapp_recent_user_date_idx"),
+        ]
+
+    user = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    plmobject = models.ForeignKey(PLMObject, related_name="+", on_delete=models.CASCADE)
+    date = models.DateTimeField()
+    action = models.CharField(max_length=50)
+    details = models.TextField()
+
+    @classmethod
+    def get_last_edited(cls, user, count=5):
+        """
+        Returns the *count* last objects edited by *user* (a list of
+        :class:`RecentObject`, most recent first).
+        """
+        return list(cls.objects.filter(user=user).order_by("-date", "-id")\
+                .select_related("plmobject")[:count])
+
+
+class UserActivity(models.Model):
+    """
+    .. versionadded:: 2.0
+
+    Number of histories (:class:`History`) recorded by a user per
+    action. Counters are updated by :func:`record_histories` and are
+    not decremented when histories are archived.
+    """
+    class Meta:
+        app_label = "plmapp"
+        unique_together = (("user", "action"),)
+
+    user = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    action = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def get_count(cls, user, *actions):
+        """
+        Returns the number of histories recorded by *user* with one
+        of the given actions.
+        """
+        counts = cls.objects.filter(user=user, action__in=actions)
+        return counts.aggregate(total=models.Sum("count"))["total"] or 0
+
+    @classmethod
+    def get_counts(cls, user):
+        """
+        Returns a dictionary {action: number of histories} of *user*.
+        """
+        return dict(cls.objects.filter(user=user).values_list("action", "count"))
+
+
+def record_histories(histories):
+    """
+    .. versionadded:: 2.0
+
+    Updates the :class:`RecentObject` and :class:`UserActivity` tables
+    with *histories* (a list of saved :class:`History`).
+
+    It is called when a history is saved and must be called after a
+    :meth:`~django.db.models.query.QuerySet.bulk_create` of histories.
+    """
+    recents = {}
+    counts = defaultdict(int)
+    for h in histories:
+        key = (h.user_id, h.plmobject_id)
+        if key not in recents or recents[key].date <= h.date:
+            recents[key] = RecentObject(user_id=h.user_id, plmobject_id=h.plmobject_id,
+                date=h.date, action=h.action, details=h.details)
+        counts[(h.user_id, h.action)] += 1
+    if not recents:
+        return
+    RecentObject.objects.bulk_create(recents.values(), update_conflicts=True,
+        unique_fields=["user", "plmobject"], update_fields=["date", "action", "details"])
+    for (user_id, action), count in counts.items():
+        activity = UserActivity.objects.filter(user=user_id, action=action)
+        if not activity.update(count=models.F("count") + count):
+            try:
+                with transaction.atomic():
+                    UserActivity.objects.create(user_id=user_id, action=action, count=count)
+            except IntegrityError:
+                # created by a concurrent request
+                activity.update(count=models.F("count") + count)
+
+def _record_history(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_histories([instance])
+
+post_save.connect(_record_history, sender=History)
+
+
+def timeline_histories(user, date_begin=None, date_end=None, done_by=None,
+        list_display=None, limit=None, cursor=None):
+    """
+    Returns the list of histories of the timeline of *user*, newest first.
+
+    .. versionchanged:: 2.0
+        Histories are read by the keyset paginated engine of
+        :mod:`.timeline`: if *limit* is set, at most *limit* histories
+        following *cursor* are returned.
+
+    See :func:`.timeline.get_sources` for the other parameters.
+    """
+    from openPLM.plmapp import timeline
+    sources = timeline.get_sources(user, date_begin, date_end, done_by, list_display)
+    if limit is not None:
+        histories = timeline.get_page(sources, limit, cursor)[0]
     else:
-        history = None
-        history_plmobject = None
-        history_group = None
-
-        if list_display["display_document"] or list_display["display_part"]:
-            history_plmobject = History.timeline_items(user)
-            if list_display["display_document"] and not list_display["display_part"]:
-                documents = get_all_documents().keys()
-                history_plmobject = history_plmobject.filter(plmobject__type__in = documents)
-            elif not list_display["display_document"]:
-                parts = get_all_parts().keys()
-                history_plmobject = history_plmobject.filter(plmobject__type__in = parts)
-            history_plmobject = history_plmobject.filter(date__gte = date_end, date__lt = date_begin)
-
-            if done_by:
-                if User.objects.filter(username=done_by).exists():
-                    history_plmobject = history_plmobject.filter(user__username = done_by)
-                else:
-                    history_plmobject = history_plmobject.none()
-
-        if list_display["display_group"]:
-            history_group = GroupHistory.timeline_items(user)
-            history_group = history_group.filter(date__gte = date_end, date__lt = date_begin)
-
-            if done_by != "":
-                if User.objects.filter(username= done_by).exists():
-                    history_group = history_group.filter(user__username = done_by)
-                else:
-                    history_group = history_group.none()
-            for h in history_group:
-                h.plmobject.plmobject_url = h.plmobject.groupinfo.plmobject_url
-
-        if (list_display["display_document"] or list_display["display_part"]) and list_display["display_group"]:
-            history = sorted(chain(history_group, history_plmobject), key=self.date, reverse=True)
-        elif list_display["display_group"]:
-            history = history_group
-        elif list_display["display_document"] or list_display["display_part"]:
-            history = history_plmobject
-
-        return history
+        histories = [h for c, h in timeline.iter_timeline(sources, cursor)]
+    return histories
 
 
 def _save_comment_history(sender, comment, request, **kwargs):
@@ -1,9 +1,16 @@
 
 #! -*- coding:utf-8 -*-
-from django.db import models
+import threading
+from collections import defaultdict
+
+from django.core.signals import request_started
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
 from openPLM.plmapp.lifecycle import LifecycleList
 from openPLM.plmapp.utils import memoize_noarg
 
+from .version import CacheVersion
+
 # lifecycle stuff
 class State(models.Model):
     """
@@ -56,45 +63,40 @@ class Lifecycle(models.Model):
     official_state = models.ForeignKey(State,on_delete=models.CASCADE)
     type = models.PositiveSmallIntegerField(default=STANDARD, choices=TYPES)
 
-    def __init__(self, *args, **kwargs):
-        super(Lifecycle, self).__init__(*args, **kwargs)
-        # keep a cache of some values: Lifecycle are most of the time
-        # read-only objects, and there are no valid reasons to modify a
-        # lifecycle in a production environment
-        self._first_state = None
-        self._last_state = None
-        self._states_list = None
-
     def __unicode__(self):
         return u'Lifecycle<%s>' % self.name
 
+    @property
+    def info(self):
+        """
+        .. versionadded:: 2.0
+
+        :class:`LifecycleInfo` of the lifecycle, read from the
+        :func:`lifecycle registry <get_lifecycle_registry>`.
+        """
+        return get_lifecycle_info(self.name)
+
     def to_states_list(self):
         u"""
         Converts a Lifecycle to a :class:`.LifecycleList` (a list of strings)
+
+        .. versionchanged:: 2.0
+            Does not run any query.
         """
-        if self._states_list is None:
-            lcs = self.lifecyclestates_set.order_by("rank")
-            self._states_list = LifecycleList(self.name, self.official_state.name,
-                    *lcs.values_list("state__name", flat=True))
-        return LifecycleList(self.name, self.official_state, *self._states_list)
+        info = self.info
+        return LifecycleList(self.name, info.official_state, *info.states)
 
     @property
     def first_state(self):
-        if self._first_state is None:
-            self._first_state = self.lifecyclestates_set.order_by('rank')[0].state
-        return self._first_state
+        return State(name=self.info.first_state)
 
     @property
     def last_state(self):
-        if self._last_state is None:
-            self._last_state = self.lifecyclestates_set.order_by('-rank')[0].state
-        return self._last_state
+        return State(name=self.info.last_state)
 
     @property
     def nb_states(self):
-        if self._states_list is not None:
-            return len(self._states_list)
-        return self.lifecyclestates_set.count()
+        return len(self.info.states)
 
     def __iter__(self):
         return iter(self.to_states_list())
@@ -187,3 +189,269 @@ def get_default_state(lifecycle=None):
         return None  # Replace this line with your desired logic
 
 
+class LifecycleInfo(object):
+    """
+    .. versionadded:: 2.0
+
+    Immutable description of a :class:`.Lifecycle`: all lookups are made
+    without any query. States are identified by their names (which are
+    also their primary keys).
+
+    .. attribute:: name
+
+        name of the lifecycle
+    .. attribute:: official_state
+
+        name of the official state
+    .. attribute:: type
+
+        :attr:`.Lifecycle.type` of the lifecycle
+    .. attribute:: states
+
+        tuple of the names of the states, sorted by rank
+    .. attribute:: first_state
+
+        name of the first state
+    .. attribute:: last_state
+
+        name of the last state
+
+    State's categories (also used by :attr:`.StateHistory.state_category`) are:
+
+        .. attribute:: DRAFT
+        .. attribute:: PROPOSED
+        .. attribute:: OFFICIAL
+        .. attribute:: DEPRECATED
+        .. attribute:: CANCELLED
+    """
+
+    DRAFT, PROPOSED, OFFICIAL, DEPRECATED, CANCELLED = range(5)
+    STATE_CATEGORIES = (
+        (DRAFT, "draft"),
+        (PROPOSED, "proposed"),
+        (OFFICIAL, "official"),
+        (DEPRECATED, "deprecated"),
+        (CANCELLED, "cancelled")
+    )
+
+    #: name of the cancelled state and lifecycle
+    CANCELLED_NAME = "cancelled"
+
+    def __init__(self, name, official_state, type, states):
+        self.name = name
+        self.official_state = official_state
+        self.type = type
+        self.states = tuple(states)
+        self.first_state = self.states[0] if self.states else None
+        self.last_state = self.states[-1] if self.states else None
+        self._ranks = dict((state, rank) for rank, state in enumerate(self.states))
+        self._categories = dict((state, self._compute_category(state))
+                for state in self.states)
+
+    def _compute_category(self, state):
+        if state == self.CANCELLED_NAME:
+            return self.CANCELLED
+        elif state == self.official_state:
+            return self.OFFICIAL
+        elif state == self.first_state:
+            return self.DRAFT
+        elif state == self.last_state:
+            return self.DEPRECATED
+        return self.PROPOSED
+
+    @property
+    def is_cancelled(self):
+        """ True if it is the cancelled lifecycle. """
+        return self.name == self.CANCELLED_NAME
+
+    @property
+    def official_rank(self):
+        """ Rank of the official state. """
+        return self._ranks[self.official_state]
+
+    def __contains__(self, state):
+        return state in self._ranks
+
+    def rank(self, state):
+        """
+        Returns the rank of *state*.
+        Raises :exc:`KeyError` if *state* is not in the lifecycle.
+        """
+        return self._ranks[state]
+
+    def next_state(self, state):
+        """
+        Returns the name of the state following *state*
+        (None if *state* is the last state).
+        """
+        rank = self._ranks[state] + 1
+        return self.states[rank] if rank < len(self.states) else None
+
+    def previous_state(self, state):
+        """
+        Returns the name of the state preceding *state*
+        (None if *state* is the first state).
+        """
+        rank = self._ranks[state] - 1
+        return self.states[rank] if rank >= 0 else None
+
+    def get_category(self, state):
+        """
+        Returns the category of *state* (see :attr:`.StateHistory.state_category`).
+        """
+        category = self._categories.get(state)
+        if category is None:
+            category = self._compute_category(state)
+        return category
+
+
+class LifecycleRegistry(object):
+    """
+    .. versionadded:: 2.0
+
+    Process-wide registry of all lifecycles, built with two queries.
+
+    .. attribute:: version
+
+        version of the registry (see :func:`get_lifecycle_registry`)
+    .. attribute:: lifecycles
+
+        dictionary {lifecycle's name: :class:`LifecycleInfo`}
+    .. attribute:: states
+
+        frozenset of the names of all states
+    """
+
+    def __init__(self, version, lifecycles, states):
+        self.version = version
+        self.lifecycles = lifecycles
+        self.states = frozenset(states)
+
+    @classmethod
+    def load(cls, version):
+        states = defaultdict(list)
+        for lifecycle, state in LifecycleStates.objects.order_by("lifecycle", "rank")\
+                .values_list("lifecycle", "state"):
+            states[lifecycle].append(state)
+        lifecycles = {}
+        for name, official_state, type in Lifecycle.objects.values_list(
+                "name", "official_state", "type"):
+            lifecycles[name] = LifecycleInfo(name, official_state, type, states[name])
+        return cls(version, lifecycles, State.objects.values_list("name", flat=True))
+
+    def rank(self, state_id, lifecycle_id):
+        return self.lifecycles[lifecycle_id].rank(state_id)
+
+    def next_state(self, state_id, lifecycle_id):
+        return self.lifecycles[lifecycle_id].next_state(state_id)
+
+    def previous_state(self, state_id, lifecycle_id):
+        return self.lifecycles[lifecycle_id].previous_state(state_id)
+
+    def get_category(self, state_id, lifecycle_id):
+        return self.lifecycles[lifecycle_id].get_category(state_id)
+
+
+#: name of the :class:`.CacheVersion` of the registry
+REGISTRY_VERSION_NAME = "lifecycles"
+_registry_lock = threading.Lock()
+_registry = None
+# False if the version must be read again before using the registry
+_registry_checked = False
+
+def get_lifecycle_registry():
+    """
+    .. versionadded:: 2.0
+
+    Returns the current :class:`LifecycleRegistry`. It is rebuilt if
+    a lifecycle or a state has changed since it has been built. A version
+    is stored in the database (see :class:`.CacheVersion`) so that all
+    processes rebuild their registry once the change is committed.
+
+    The version is read once per request (or task), see
+    :func:`check_lifecycle_registry`.
+    """
+    global _registry, _registry_checked
+    registry = _registry
+    if registry is not None and _registry_checked:
+        return registry
+    version = CacheVersion.get(REGISTRY_VERSION_NAME)
+    if registry is None or registry.version != version:
+        with _registry_lock:
+            if _registry is None or _registry.version != version:
+                _registry = LifecycleRegistry.load(version)
+            registry = _registry
+    _registry_checked = True
+    return registry
+
+def check_lifecycle_registry(**kwargs):
+    """
+    .. versionadded:: 2.0
+
+    Makes the next call to :func:`get_lifecycle_registry` read the version
+    of the registry. This function is called when a request or a task starts
+    and once a transaction which invalidates the registry is committed.
+    """
+    global _registry_checked
+    _registry_checked = False
+
+def _reload_lifecycle_registry():
+    """
+    Rebuilds the registry of this process without changing its version,
+    the registries of the other processes are kept.
+    """
+    global _registry
+    version = CacheVersion.get(REGISTRY_VERSION_NAME)
+    with _registry_lock:
+        _registry = LifecycleRegistry.load(version)
+        return _registry
+
+def get_lifecycle_info(lifecycle_id):
+    """
+    .. versionadded:: 2.0
+
+    Returns the :class:`LifecycleInfo` of the lifecycle named *lifecycle_id*.
+    The registry of this process is reloaded if the lifecycle is unknown
+    (it may have been committed by another process after the registry
+    was built). The registries of the other processes are not invalidated.
+
+    Raises :exc:`Lifecycle.DoesNotExist` if the lifecycle does not exist.
+    """
+    try:
+        return get_lifecycle_registry().lifecycles[lifecycle_id]
+    except KeyError:
+        try:
+            return _reload_lifecycle_registry().lifecycles[lifecycle_id]
+        except KeyError:
+            raise Lifecycle.DoesNotExist(lifecycle_id)
+
+def get_state(name):
+    """
+    .. versionadded:: 2.0
+
+    Returns the :class:`State` named *name*. The state is created if
+    it does not exist, like ``State.objects.get_or_create(name=name)[0]``
+    but without any query if the state is known by the registry.
+    """
+    if name in get_lifecycle_registry().states:
+        return State(name=name)
+    return State.objects.get_or_create(name=name)[0]
+
+def invalidate_lifecycle_registry(**kwargs):
+    """
+    .. versionadded:: 2.0
+
+    Invalidates the registries of all processes. This function is called
+    when a :class:`State`, a :class:`Lifecycle` or a :class:`LifecycleStates`
+    is saved or deleted.
+    """
+    global _registry
+    _registry = None
+    CacheVersion.bump(REGISTRY_VERSION_NAME)
+    # a registry built by another thread before the commit is outdated
+    transaction.on_commit(check_lifecycle_registry)
+
+request_started.connect(check_lifecycle_registry)
+for _sender in (State, Lifecycle, LifecycleStates):
+    post_save.connect(invalidate_lifecycle_registry, sender=_sender)
+    post_delete.connect(invalidate_lifecycle_registry, sender=_sender)
@@ -1,10 +1,13 @@
+from collections import defaultdict
+
 from django.utils import timezone
 #import kjbuckets
 
-import networkx as nx
 from django.core.exceptions import ValidationError
-from django.db import models, IntegrityError
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Case, When, Count
 from django.db.models.query import QuerySet
+from django.dispatch import Signal
 from django.contrib.auth.models import User
 
 from openPLM.plmapp.utils.units import UNITS, DEFAULT_UNIT
@@ -15,6 +18,13 @@ from .plmobject import PLMObject
 from .part import Part
 from .document import Document
 
+#: .. versionadded:: 2.0
+#:
+#: signal sent by :meth:`LinkQuerySet.end` (links are updated without
+#: sending a :data:`~django.db.models.signals.post_save` signal),
+#: the sender is the link model
+links_ended = Signal()
+
 class LinkQuerySet(QuerySet):
     """ QuerySet with utility methods to filter links alive at a given time."""
 
@@ -40,7 +50,9 @@ class LinkQuerySet(QuerySet):
         Ends all alive links: sets theur :attr:`end_time` to the current time and saves them
         if there :attr:`end_time` are not already set.
         """
-        return self.now().update(end_time=timezone.now())
+        count = self.now().update(end_time=timezone.now())
+        links_ended.send(sender=self.model)
+        return count
 
 
 class LinkManager(models.Manager):
@@ -424,6 +436,335 @@ def get_PCLEs(parent):
     return [PCLE for PCLE in registered_PCLEs if PCLE.apply_to(parent)]
 
 
+class ParentChildClosure(models.Model):
+    """
+    .. versionadded:: 2.0
+
+    Transitive closure of the current (alive) :class:`.ParentChildLink`.
+
+    There is one row per (ancestor, descendant, depth) so that the table
+    can be updated incrementally when a link is added or ended
+    (see :meth:`add_link` and :meth:`remove_link`). A part is not
+    stored as its own ancestor.
+
+    :model attributes:
+        .. attribute:: ancestor
+
+            a :class:`.Part`
+        .. attribute:: descendant
+
+            a :class:`.Part`
+        .. attribute:: depth
+
+            length of the paths from *ancestor* to *descendant* (1 for
+            a direct child)
+        .. attribute:: paths
+
+            number of paths of length *depth* from *ancestor* to *descendant*
+        .. attribute:: quantity
+
+            sum of the products of the quantities along these paths
+            (units are not converted)
+    """
+
+    ancestor = models.ForeignKey(Part, related_name="+", on_delete=models.CASCADE)
+    descendant = models.ForeignKey(Part, related_name="+", on_delete=models.CASCADE)
+    depth = models.PositiveIntegerField()
+    paths = models.PositiveIntegerField(default=1)
+    quantity = models.FloatField(default=1)
+
+    class Meta:
+        app_label = "plmapp"
+        unique_together = ("ancestor", "descendant", "depth")
+        indexes = [models.Index(fields=["descendant", "ancestor"])]
+
+    def __unicode__(self):
+        return u"ParentChildClosure<%d, %d, %d>" % (self.ancestor_id,
+                self.descendant_id, self.depth)
+
+    @classmethod
+    def get_related_ids(cls, ids, direction):
+        """
+        Returns the set of ids of all descendants (if *direction* is
+        ``"child"``) or ancestors (if *direction* is ``"parent"``) of
+        the parts *ids*.
+        """
+        if not ids:
+            return set()
+        if direction == "child":
+            qs = cls.objects.filter(ancestor__in=ids).values_list("descendant", flat=True)
+        else:
+            qs = cls.objects.filter(descendant__in=ids).values_list("ancestor", flat=True)
+        return set(qs.distinct())
+
+    @classmethod
+    def is_ancestor(cls, ancestor, descendant):
+        """
+        Returns True if *ancestor* is currently an ancestor of *descendant*.
+        """
+        return cls.objects.filter(ancestor=ancestor, descendant=descendant).exists()
+
+    @classmethod
+    def lock_parts(cls, parent_ids, child_ids):
+        """
+        Locks the :class:`.Part` rows whose closure rows may be changed by
+        adding or removing links from *parent_ids* to *child_ids*: the parents,
+        their ancestors, the children and their descendants.
+
+        Rows are locked in id order so that concurrent transactions wait
+        for each other instead of deadlocking. It must be called inside
+        a transaction, before reading the closure.
+
+        Returns the set of locked ids.
+        """
+        ids = set(parent_ids) | set(child_ids)
+        ids.update(cls.get_related_ids(parent_ids, "parent"))
+        ids.update(cls.get_related_ids(child_ids, "child"))
+        list(Part.objects.select_for_update().filter(id__in=ids).order_by("id")
+                .values_list("id", flat=True))
+        return ids
+
+    @classmethod
+    def _update(cls, link, sign):
+        """
+        Adds (*sign* == 1) or removes (*sign* == -1) all paths going through
+        *link*.
+        """
+        cls.lock_parts([link.parent_id], [link.child_id])
+        # (part, depth, paths, quantity) of ancestors of the parent
+        # and descendants of the child, including themselves
+        ancestors = [(link.parent_id, 0, 1, 1.0)]
+        ancestors.extend(cls.objects.filter(descendant=link.parent_id)
+                .values_list("ancestor", "depth", "paths", "quantity"))
+        descendants = [(link.child_id, 0, 1, 1.0)]
+        descendants.extend(cls.objects.filter(ancestor=link.child_id)
+                .values_list("descendant", "depth", "paths", "quantity"))
+        delta = {}
+        for a, d1, n1, q1 in ancestors:
+            for d, d2, n2, q2 in descendants:
+                key = (a, d, d1 + d2 + 1)
+                paths, qty = delta.get(key, (0, 0.0))
+                delta[key] = (paths + n1 * n2, qty + q1 * link.quantity * q2)
+        existing = cls.objects.filter(ancestor__in=set(a[0] for a in ancestors),
+                descendant__in=set(d[0] for d in descendants))
+        updated, deleted = [], []
+        for row in existing:
+            key = (row.ancestor_id, row.descendant_id, row.depth)
+            if key in delta:
+                paths, qty = delta.pop(key)
+                row.paths += sign * paths
+                row.quantity += sign * qty
+                if row.paths > 0:
+                    updated.append(row)
+                else:
+                    deleted.append(row.id)
+        if updated:
+            cls.objects.bulk_update(updated, ["paths", "quantity"])
+        if deleted:
+            cls.objects.filter(id__in=deleted).delete()
+        if sign > 0 and delta:
+            cls.objects.bulk_create(cls(ancestor_id=a, descendant_id=d, depth=depth,
+                paths=paths, quantity=qty)
+                for (a, d, depth), (paths, qty) in delta.items())
+
+    @classmethod
+    def add_link(cls, link):
+        """
+        Updates the closure table and the counters of :class:`.Part`
+        after the creation of *link*, an alive :class:`.ParentChildLink`.
+        """
+        with transaction.atomic():
+            cls._update(link, 1)
+            update_bom_counters(Part, link.parent_id, link.child_id, 1)
+
+    @classmethod
+    def add_links(cls, links):
+        """
+        .. versionadded:: 2.0
+
+        Like :meth:`add_link` for several new alive links but the number
+        of queries does not depend on the number of links: rows of the
+        table related to the links are loaded once, updated in memory
+        and saved in bulk.
+        """
+        if not links:
+            return
+        with transaction.atomic():
+            parts = set()
+            for link in links:
+                parts.update((link.parent_id, link.child_id))
+            # ancestors and descendants of all parts
+            region = cls.lock_parts(parts, parts)
+            rows = {}
+            by_ancestor = defaultdict(list)
+            by_descendant = defaultdict(list)
+            def add_row(row):
+                rows[(row.ancestor_id, row.descendant_id, row.depth)] = row
+                by_ancestor[row.ancestor_id].append(row)
+                by_descendant[row.descendant_id].append(row)
+            for row in cls.objects.filter(ancestor__in=region, descendant__in=region):
+                add_row(row)
+            changed = set()
+            for link in links:
+                # same computation as _update but on rows kept in memory
+                ancestors = [(link.parent_id, 0, 1, 1.0)]
+                ancestors.extend((r.ancestor_id, r.depth, r.paths, r.quantity)
+                        for r in by_descendant[link.parent_id])
+                descendants = [(link.child_id, 0, 1, 1.0)]
+                descendants.extend((r.descendant_id, r.depth, r.paths, r.quantity)
+                        for r in by_ancestor[link.child_id])
+                for a, d1, n1, q1 in ancestors:
+                    for d, d2, n2, q2 in descendants:
+                        key = (a, d, d1 + d2 + 1)
+                        row = rows.get(key)
+                        if row is None:
+                            row = cls(ancestor_id=a, descendant_id=d, depth=key[2],
+                                    paths=0, quantity=0.0)
+                            add_row(row)
+                        row.paths += n1 * n2
+                        row.quantity += q1 * link.quantity * q2
+                        changed.add(key)
+            changed = [rows[key] for key in changed]
+            cls.objects.bulk_update([r for r in changed if r.pk is not None],
+                    ["paths", "quantity"], batch_size=500)
+            cls.objects.bulk_create([r for r in changed if r.pk is None], batch_size=500)
+            update_bom_counters_in_bulk(Part, links)
+
+    @classmethod
+    def remove_link(cls, link):
+        """
+        Updates the closure table and the counters of :class:`.Part`
+        after the end of *link*, a :class:`.ParentChildLink`.
+        """
+        with transaction.atomic():
+            cls._update(link, -1)
+            update_bom_counters(Part, link.parent_id, link.child_id, -1)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Rebuilds the whole table from the alive :class:`.ParentChildLink`.
+
+        Returns the number of created rows.
+        """
+        return rebuild_closure_table(cls, ParentChildLink)
+
+
+def rebuild_closure_table(closure_model, link_model):
+    """
+    .. versionadded:: 2.0
+
+    Rebuilds the table of *closure_model* (:class:`.ParentChildClosure`)
+    from the alive links of *link_model* (:class:`.ParentChildLink`).
+    Both models are given so that this function can be called by a
+    data migration.
+
+    Returns the number of created rows.
+    """
+    links = link_model.objects.filter(end_time__isnull=True)
+    adjacency = defaultdict(list)
+    for parent, child, quantity in links.values_list("parent", "child", "quantity"):
+        adjacency[parent].append((child, quantity))
+    # part -> {(descendant, depth) : [paths, quantity]}
+    closures = {}
+    def closure(part):
+        if part not in closures:
+            rows = defaultdict(lambda: [0, 0.0])
+            for child, qty in adjacency.get(part, ()):
+                row = rows[(child, 1)]
+                row[0] += 1
+                row[1] += qty
+                for (d, depth), (n, q) in closure(child).items():
+                    row = rows[(d, depth + 1)]
+                    row[0] += n
+                    row[1] += qty * q
+            closures[part] = rows
+        return closures[part]
+    count = 0
+    with transaction.atomic():
+        closure_model.objects.all().delete()
+        for part in list(adjacency):
+            rows = [closure_model(ancestor_id=part, descendant_id=d, depth=depth,
+                paths=n, quantity=q) for (d, depth), (n, q) in closure(part).items()]
+            closure_model.objects.bulk_create(rows, batch_size=500)
+            count += len(rows)
+    return count
+
+
+_IS_TOP_ASSEMBLY = Case(When(children_count__gt=0, parents_count=0, then=True),
+        default=False, output_field=models.BooleanField())
+
+def update_bom_counters(part_model, parent_id, child_id, sign):
+    """
+    .. versionadded:: 2.0
+
+    Adds *sign* (1 or -1) to the children count of *parent_id* and
+    to the parents count of *child_id* and updates their
+    :attr:`.Part.is_top_assembly` flag.
+    """
+    part_model.objects.filter(id=parent_id).update(
+            children_count=F("children_count") + sign)
+    part_model.objects.filter(id=child_id).update(
+            parents_count=F("parents_count") + sign)
+    # the flag is updated by another query: some databases (MySQL) do not
+    # evaluate all expressions of an UPDATE with the old values
+    part_model.objects.filter(id__in=(parent_id, child_id)).update(
+            is_top_assembly=_IS_TOP_ASSEMBLY)
+
+def update_bom_counters_in_bulk(part_model, links):
+    """
+    .. versionadded:: 2.0
+
+    Like :func:`update_bom_counters` for several new alive *links*
+    (:class:`.ParentChildLink`).
+    """
+    children = defaultdict(int)
+    parents = defaultdict(int)
+    for link in links:
+        children[link.parent_id] += 1
+        parents[link.child_id] += 1
+    fixed = []
+    values = part_model.objects.select_for_update().filter(pk__in=set(children) | set(parents))
+    for part_id, children_count, parents_count in values.values_list("pk",
+            "children_count", "parents_count"):
+        c = children_count + children.get(part_id, 0)
+        p = parents_count + parents.get(part_id, 0)
+        fixed.append(part_model(pk=part_id, children_count=c,
+            parents_count=p, is_top_assembly=c > 0 and p == 0))
+    part_model.objects.bulk_update(fixed,
+            ["children_count", "parents_count", "is_top_assembly"], batch_size=500)
+
+def rebuild_bom_counters(part_model, link_model):
+    """
+    .. versionadded:: 2.0
+
+    Recomputes :attr:`.Part.children_count`, :attr:`.Part.parents_count`
+    and :attr:`.Part.is_top_assembly` of *part_model* (:class:`.Part`)
+    from the alive links of *link_model* (:class:`.ParentChildLink`).
+    Both models are given so that this function can be called by a
+    data migration.
+
+    Returns the number of fixed parts.
+    """
+    links = link_model.objects.filter(end_time__isnull=True).order_by()
+    children = dict(links.values_list("parent").annotate(c=Count("id")))
+    parents = dict(links.values_list("child").annotate(c=Count("id")))
+    fixed = []
+    with transaction.atomic():
+        values = part_model.objects.order_by().values_list("pk", "children_count",
+                "parents_count", "is_top_assembly")
+        for part_id, children_count, parents_count, is_top_assembly in values.iterator():
+            c = children.get(part_id, 0)
+            p = parents.get(part_id, 0)
+            top = c > 0 and p == 0
+            if (children_count, parents_count, is_top_assembly) != (c, p, top):
+                fixed.append(part_model(pk=part_id, children_count=c,
+                    parents_count=p, is_top_assembly=top))
+        part_model.objects.bulk_update(fixed,
+                ["children_count", "parents_count", "is_top_assembly"], batch_size=500)
+    return len(fixed)
+
+
 class RevisionLink(Link):
     """
     Link between two revisions of a :class:`.PLMObject`
@@ -523,30 +864,12 @@ class DelegationLink(Link):
     def get_delegators(cls, user, role):
         """
         Returns the list of user's id of the delegators of *user* for the role *role*.
-        """
-        # Get the links (delegatee, delegator) for the specified role
-        links = cls.current_objects.filter(role=role).values_list("delegatee", "delegator")
-
-        # Create a directed graph
-        gr = nx.DiGraph()
 
-        # Add edges to the graph
-        gr.add_edges_from(links)
-
-        # Find reachable nodes from the user's ID
-        reachable_nodes = nx.descendants(gr, user.id)
-
-        # Return the list of reachable nodes (delegators)
-        return list(reachable_nodes)
-
-        """   def get_delegators(cls, user, role):
-    
-        Returns the list of user's id of the delegators of *user* for the role
-        *role*.
-        
-        links = cls.current_objects.filter(role=role).values_list("delegatee", "delegator")
-        gr = kjbuckets.kjGraph(tuple(links))
-        return gr.reachable(user.id).items()"""
+        .. versionchanged:: 2.0
+            uses the cached index of :mod:`.delegations`
+        """
+        from openPLM.plmapp import delegations
+        return list(delegations.get_delegators(user.id, role))
 
 
 class PLMObjectUserLink(Link):
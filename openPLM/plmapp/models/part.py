@@ -1,14 +1,25 @@
+import uuid
+
 from django.db import models
 from django.db.models import F
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import gettext_noop
 from openPLM.plmapp.utils import memoize_noarg
+from .lifecycle import get_lifecycle_info
 
 from .plmobject import (PLMObject, get_all_subclasses,
         get_all_subclasses_with_level, PLMObjectQuerySet, PLMObjectManager)
 
 # parts stuff
 
+def new_bom_version():
+    """
+    .. versionadded:: 2.0
+
+    Returns a new random value of :attr:`Part.bom_version`.
+    """
+    return uuid.uuid4().hex
+
 class PartQuerySet(PLMObjectQuerySet):
     """
     A :class:`.PLMObjectQuerySet` with extra methods to annotate results
@@ -18,24 +29,20 @@ class PartQuerySet(PLMObjectQuerySet):
     def with_children_counts(self):
         """
         Annotates results with the number of children (field ``num_children``).
+
+        .. versionchanged:: 2.0
+            Reads :attr:`Part.children_count` instead of counting links.
         """
-        return self.extra(select={"num_children" :
-"""
-SELECT COUNT(plmapp_parentchildlink.id) from plmapp_parentchildlink
-    WHERE plmapp_parentchildlink.end_time IS NULL AND
-    plmapp_parentchildlink.parent_id = plmapp_part.plmobject_ptr_id
-"""})
+        return self.annotate(num_children=F("children_count"))
 
     def with_parents_counts(self):
         """
         Annotates results with the number of parents (field ``num_parents``).
+
+        .. versionchanged:: 2.0
+            Reads :attr:`Part.parents_count` instead of counting links.
         """
-        return self.extra(select={"num_parents" :
-"""
-SELECT COUNT(plmapp_parentchildlink.id) from plmapp_parentchildlink
-    WHERE plmapp_parentchildlink.end_time IS NULL AND
-    plmapp_parentchildlink.child_id = plmapp_part.plmobject_ptr_id
-"""})
+        return self.annotate(num_parents=F("parents_count"))
 
 
 class PartManager(PLMObjectManager):
@@ -67,14 +74,14 @@ class TopAssemblyManager(PartManager):
     """
     A :class:`PartManager` that returns only top assemblies.
     A top assemblies is a part with at least one child and no parents.
+
+    .. versionchanged:: 2.0
+        Filters on :attr:`Part.is_top_assembly`.
     """
 
     def get_query_set(self):
-        from openPLM.plmapp.models.link import ParentChildLink
-        current_pcl = ParentChildLink.current_objects
         return super(TopAssemblyManager, self).get_query_set().\
-                exclude(id__in=current_pcl.values_list("child")).\
-                filter(id__in=current_pcl.values_list("parent"))
+                filter(is_top_assembly=True)
 
 
 class AbstractPart(models.Model):
@@ -100,10 +107,66 @@ class AbstractPart(models.Model):
 class Part(AbstractPart, PLMObject):
     """
     Model for parts
+
+    :model attributes:
+        .. attribute:: children_count
+
+            .. versionadded:: 2.0
+
+            number of alive :class:`.ParentChildLink` whose parent is the part
+        .. attribute:: parents_count
+
+            .. versionadded:: 2.0
+
+            number of alive :class:`.ParentChildLink` whose child is the part
+        .. attribute:: is_top_assembly
+
+            .. versionadded:: 2.0
+
+            True if the part has at least one child and no parents
+
+    These fields are updated by :meth:`.ParentChildClosure.add_link` and
+    :meth:`.ParentChildClosure.remove_link` and can be rebuilt with
+    the ``reconcile_bom_counters`` command.
+
+        .. attribute:: bom_version
+
+            .. versionadded:: 2.0
+
+            random version of the current BOM, it is changed by
+            :func:`.bom_cache.invalidate` (see :func:`new_bom_version`)
+
+    :meth:`save` never writes these fields once the part is created so
+    that a stale instance does not overwrite them.
     """
 
     class Meta:
         app_label = "plmapp"
+        indexes = [
+            models.Index(fields=["is_top_assembly", "-children_count"], name="plmapp_part_top_idx"),
+            models.Index(fields=["-children_count"], name="plmapp_part_children_idx"),
+            models.Index(fields=["-parents_count"], name="plmapp_part_parents_idx"),
+        ]
+
+    children_count = models.PositiveIntegerField(default=0, editable=False)
+    parents_count = models.PositiveIntegerField(default=0, editable=False)
+    is_top_assembly = models.BooleanField(default=False, editable=False)
+    bom_version = models.CharField(max_length=32, default=new_bom_version,
+            editable=False)
+
+    #: fields only updated by queries, see :func:`.update_bom_counters`
+    #: and :func:`.bom_cache.invalidate`
+    COMPUTED_FIELDS = ("children_count", "parents_count", "is_top_assembly",
+            "bom_version")
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args and not kwargs.get("force_insert")
+                and kwargs.get("update_fields") is None):
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [f.name for f in self._meta.concrete_fields
+                    if not f.primary_key and f.attname not in deferred
+                    and f.name not in self.COMPUTED_FIELDS]
+        super(Part, self).save(*args, **kwargs)
 
     @property
     def menu_items(self):
@@ -140,11 +203,10 @@ class Part(AbstractPart, PLMObject):
             return True
         from .link import AlternatePartSet
         # check children
-        lcs = self.lifecycle.to_states_list()
-        rank = lcs.index(self.state.name)
-        invalid_states = lcs[:rank + 1]
+        info = get_lifecycle_info(self.lifecycle_id)
+        invalid_states = info.states[:info.rank(self.state_id) + 1]
         invalid_children = list(self.parentchildlink_parent.now().\
-                filter(child__lifecycle=self.lifecycle, child__state__in=invalid_states).\
+                filter(child__lifecycle=self.lifecycle_id, child__state__in=invalid_states).\
                 values_list("child", flat=True))
         if invalid_children:
             # one of their alternate parts may be at the right state
@@ -153,7 +215,7 @@ class Part(AbstractPart, PLMObject):
                     extra(select={"psid":"alternatepartset_id"}).values_list("id", "psid"))
             if alt:
                 valid_alternates = Part.objects.filter(id__in=alt.keys(),
-                        lifecycle=self.lifecycle).exclude(state__in=invalid_states)
+                        lifecycle=self.lifecycle_id).exclude(state__in=invalid_states)
                 valid_alternates = set(valid_alternates.values_list("id", flat=True))
                 valid_partsets = set(s for p, s in alt.iteritems() if p in valid_alternates)
                 valid = all(alt.get(child) in valid_partsets for child in invalid_children)
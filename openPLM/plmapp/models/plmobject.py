@@ -1,8 +1,7 @@
 
 from functools import wraps
 
-from django.db import models
-from django.db.models import F
+from django.db import models, connection
 from django.db.models.query import QuerySet
 from django.forms.utils import ErrorList
 from django.contrib.auth.models import User
@@ -15,7 +14,8 @@ from django.utils.translation import gettext_noop, gettext_lazy as _
 from openPLM.plmapp.utils import level_to_sign_str, memoize_noarg
 from .iobject import IObject
 from .lifecycle import (State, Lifecycle, LifecycleStates,
-        get_default_lifecycle, get_default_state, get_cancelled_lifecycle)
+        LifecycleInfo, get_default_lifecycle, get_default_state,
+        get_lifecycle_registry, get_lifecycle_info)
 from .group import GroupInfo
 
 
@@ -31,9 +31,17 @@ def cache_lifecycle_stuff(func):
     The maximum cache size will be the number of
     :class:`.LifecycleStates`. Each key of the cache is
     a tuple (state's name, lifecycle's name).
+
+    .. versionchanged:: 2.0
+        The cache is cleared when the :func:`lifecycle registry
+        <.get_lifecycle_registry>` changes.
     """
     @wraps(func)
     def wrapper(plmobject):
+        version = get_lifecycle_registry().version
+        if func.version != version:
+            func.cache = {}
+            func.version = version
         key = (plmobject.state_id, plmobject.lifecycle_id)
         if key in func.cache:
             return func.cache[key]
@@ -42,6 +50,7 @@ def cache_lifecycle_stuff(func):
             func.cache[key] = value
             return value
     func.cache = {}
+    func.version = None
     wrapper.__doc__ += """
 
         .. note::
@@ -57,12 +66,20 @@ class PLMObjectQuerySet(QuerySet):
     """
 
     def officials(self):
-        """ Retrieves only official :class:`PLMObject`. """
-        return self.filter(state=F("lifecycle__official_state"))
+        """ Retrieves only official :class:`PLMObject`.
+
+        .. versionchanged:: 2.0
+            Filters on :attr:`PLMObject.state_category`.
+        """
+        return self.filter(state_category=LifecycleInfo.OFFICIAL)
 
     def exclude_cancelled(self):
-        """ Excludes cancelled :class:`PLMObject`. """
-        return self.exclude(lifecycle=get_cancelled_lifecycle())
+        """ Excludes cancelled :class:`PLMObject`.
+
+        .. versionchanged:: 2.0
+            Filters on :attr:`PLMObject.state_category`.
+        """
+        return self.exclude(state_category=LifecycleInfo.CANCELLED)
 
 
 class PLMObjectManager(models.Manager):
@@ -136,6 +153,14 @@ class PLMObject(AbstractPLMObject):
         .. attribute:: state
 
             Current :class:`.State` of the object
+        .. attribute:: state_category
+
+            .. versionadded:: 2.0
+
+            category of :attr:`state` (see :attr:`.StateHistory.state_category`).
+            This field is redundant with the tuple (state, lifecycle) but
+            it allows fast queries. It is automatically set when the
+            object is saved.
         .. attribute:: group
 
             :class:`.GroupInfo` that owns the object
@@ -199,6 +224,9 @@ class PLMObject(AbstractPLMObject):
                               related_name="+",
                               default=get_default_state,on_delete=models.CASCADE)
 
+    state_category = models.PositiveSmallIntegerField(default=LifecycleInfo.DRAFT,
+            choices=LifecycleInfo.STATE_CATEGORIES, editable=False)
+
     published = models.BooleanField(verbose_name=_("published"), default=False)
 
     class Meta:
@@ -206,6 +234,11 @@ class PLMObject(AbstractPLMObject):
         app_label = "plmapp"
         unique_together = (('reference', 'type', 'revision'),)
         ordering = ["type", "reference", "revision"]
+        indexes = [
+            models.Index(fields=["group", "state_category"], name="plmapp_plmobj_group_cat_idx"),
+            models.Index(fields=["type", "state_category"], name="plmapp_plmobj_type_cat_idx"),
+            models.Index(fields=["owner", "state_category"], name="plmapp_plmobj_owner_cat_idx"),
+        ]
 
     def __init__(self, *args, **kwargs):
         # little hack:
@@ -221,6 +254,22 @@ class PLMObject(AbstractPLMObject):
         return u"%s<%s/%s/%s>" % (type(self).__name__, self.reference, self.type,
                                   self.revision)
 
+    def get_state_category(self):
+        """
+        .. versionadded:: 2.0
+
+        Returns the category of the object's state (see
+        :attr:`.StateHistory.state_category`). This method is called by
+        :meth:`save` to set :attr:`state_category`, it must be called
+        before a :meth:`~django.db.models.query.QuerySet.update` that
+        changes the state or the lifecycle.
+        """
+        return get_lifecycle_registry().get_category(self.state_id, self.lifecycle_id)
+
+    def save(self, *args, **kwargs):
+        self.state_category = self.get_state_category()
+        super(PLMObject, self).save(*args, **kwargs)
+
     @property
     def title(self):
         if self._title is None:
@@ -234,7 +283,7 @@ class PLMObject(AbstractPLMObject):
         Returns True if the object's state is the last state of its lifecycle.
         """
         self._promotion_errors = ErrorList()
-        if self.lifecycle.last_state == self.state:
+        if get_lifecycle_info(self.lifecycle_id).last_state == self.state_id:
             self._promotion_errors.append(_(u"The object is at its last state."))
             return False
         return True
@@ -285,34 +334,35 @@ class PLMObject(AbstractPLMObject):
         """
         if self.is_cancelled or self.is_draft:
             return False
-        lcs = self.lifecycle.lifecyclestates_set.only("rank")
-        current_rank = lcs.get(state=self.state).rank
-        official_rank = lcs.get(state=self.lifecycle.official_state).rank
-        return current_rank < official_rank
+        info = get_lifecycle_info(self.lifecycle_id)
+        return info.rank(self.state_id) < info.official_rank
 
     @property
     @cache_lifecycle_stuff
     def is_cancelled(self):
         """ True if the object is cancelled. """
-        return self.lifecycle == get_cancelled_lifecycle()
+        return get_lifecycle_info(self.lifecycle_id).is_cancelled
 
     @property
     @cache_lifecycle_stuff
     def is_deprecated(self):
         """ True if the object is deprecated. """
-        return not self.is_cancelled and self.state == self.lifecycle.last_state
+        info = get_lifecycle_info(self.lifecycle_id)
+        return not info.is_cancelled and self.state_id == info.last_state
 
     @property
     @cache_lifecycle_stuff
     def is_official(self):
         u"Returns True if object is official."""
-        return not self.is_cancelled and self.state == self.lifecycle.official_state
+        info = get_lifecycle_info(self.lifecycle_id)
+        return not info.is_cancelled and self.state_id == info.official_state
 
     @property
     @cache_lifecycle_stuff
     def is_draft(self):
         u""" Returns True if the object is a draft. """
-        return not self.is_cancelled and self.state == self.lifecycle.first_state
+        info = get_lifecycle_info(self.lifecycle_id)
+        return not info.is_cancelled and self.state_id == info.first_state
 
     @cache_lifecycle_stuff
     def get_current_sign_level(self):
@@ -320,8 +370,7 @@ class PLMObject(AbstractPLMObject):
         Returns the current sign level that a user must have to promote this
         object.
         """
-        rank = LifecycleStates.objects.get(state=self.state,
-                            lifecycle=self.lifecycle).rank
+        rank = get_lifecycle_registry().rank(self.state_id, self.lifecycle_id)
         return level_to_sign_str(rank)
 
     @cache_lifecycle_stuff
@@ -330,8 +379,7 @@ class PLMObject(AbstractPLMObject):
         Returns the current sign level that a user must have to demote this
         object.
         """
-        rank = LifecycleStates.objects.get(state=self.state,
-                            lifecycle=self.lifecycle).rank
+        rank = get_lifecycle_registry().rank(self.state_id, self.lifecycle_id)
         return level_to_sign_str(rank - 1)
 
     @property
@@ -426,8 +474,7 @@ class PLMObject(AbstractPLMObject):
         return get_all_plmobjects()[self.type].objects.get(id=self.id)
 
     def get_current_signer_role(self):
-        lcl = self.lifecycle.to_states_list()
-        return level_to_sign_str(lcl.index(self.state.name))
+        return level_to_sign_str(get_lifecycle_info(self.lifecycle_id).rank(self.state_id))
 
     def get_current_signers(self):
         role = self.get_current_signer_role()
@@ -436,13 +483,81 @@ class PLMObject(AbstractPLMObject):
     def get_approvers(self):
         if self.is_deprecated or self.is_cancelled:
             return self.approvals.none()
-        lcl = self.lifecycle.to_states_list()
-        next_state = lcl.next_state(self.state.name)
-        approvers = self.approvals.now().filter(current_state=self.state,
+        next_state = get_lifecycle_info(self.lifecycle_id).next_state(self.state_id)
+        approvers = self.approvals.now().filter(current_state=self.state_id,
                 next_state=next_state).values_list("user", flat=True)
         return approvers
 
 
+def bulk_create_plmobjects(objects):
+    """
+    .. versionadded:: 2.0
+
+    Saves *objects*, a list of new instances of :class:`PLMObject`
+    subclasses, with :func:`bulk_create_multi_table`.
+
+    :attr:`~PLMObject.state_category` is set like in :meth:`PLMObject.save`
+    but no signals are sent (objects are not indexed).
+
+    Returns *objects* with their primary keys set.
+    """
+    for obj in objects:
+        obj.state_category = obj.get_state_category()
+    def get_ids(objects):
+        references = set(obj.reference for obj in objects)
+        ids = dict(((t, r, v), i) for i, t, r, v in PLMObject.objects.filter(
+            reference__in=references).values_list("id", "type", "reference", "revision"))
+        return [ids[(obj.type, obj.reference, obj.revision)] for obj in objects]
+    return bulk_create_multi_table(PLMObject, objects, get_ids)
+
+
+def bulk_create_multi_table(base, objects, get_ids):
+    """
+    .. versionadded:: 2.0
+
+    Saves *objects*, a list of new instances of subclasses of *base*
+    (a concrete model), with one INSERT per table instead of one INSERT
+    per table and per object
+    (:meth:`~django.db.models.query.QuerySet.bulk_create` does not support
+    multi-table inheritance).
+
+    *get_ids* is a function called with the list of objects if the database
+    does not return primary keys of bulk created rows, it must return their
+    primary keys.
+
+    No signals are sent. Returns *objects* with their primary keys set.
+    """
+    if not objects:
+        return objects
+    base.objects.bulk_create(objects)
+    if objects[0].pk is None:
+        # the database does not return primary keys of bulk created rows
+        for obj, pk in zip(objects, get_ids(objects)):
+            obj.pk = pk
+    # then fills the tables of subclasses, parents first
+    by_model = {}
+    for obj in objects:
+        for model in type(obj)._meta.get_parent_list() + [type(obj)]:
+            if model is not base and issubclass(model, base):
+                by_model.setdefault(model, []).append(obj)
+    cursor = connection.cursor()
+    qn = connection.ops.quote_name
+    for model in sorted(by_model, key=lambda m: len(m._meta.get_parent_list())):
+        objs = by_model[model]
+        for parent, field in model._meta.parents.items():
+            for obj in objs:
+                setattr(obj, field.attname, getattr(obj, parent._meta.pk.attname))
+        fields = model._meta.local_concrete_fields
+        sql = "INSERT INTO %s (%s) VALUES (%s)" % (qn(model._meta.db_table),
+                ", ".join(qn(f.column) for f in fields), ", ".join(["%s"] * len(fields)))
+        cursor.executemany(sql, [[f.get_db_prep_save(f.pre_save(obj, True), connection)
+            for f in fields] for obj in objs])
+    for obj in objects:
+        obj._state.adding = False
+        obj._state.db = connection.alias
+    return objects
+
+
 def get_all_subclasses(base, d):
     if base.__name__ not in d and not getattr(base, "_deferred", False):
         d[base.__name__] = base
@@ -0,0 +1,114 @@
+import datetime
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+#: delay (in seconds) after which a scheduled task which has not started
+#: is considered as lost (a worker was stopped for example)
+LOST_TASK_DELAY = getattr(settings, "LOST_TASK_DELAY", 60 * 10)
+
+
+class ScheduledTask(models.Model):
+    """
+    .. versionadded:: 2.0
+
+    A task which drains a queue stored in the database (for example the
+    mail outbox, see :class:`.PendingMail`) and which is scheduled once
+    for all items queued until it starts.
+
+    A producer adds its items to the queue and calls :meth:`schedule`,
+    the task is sent only if :meth:`schedule` returns True. The task
+    calls :meth:`start` before reading the queue so that items queued
+    after this call schedule a new task.
+
+    A task which must not run concurrently (see :class:`PendingIndex`)
+    calls :meth:`start` once its queue is empty, reads the queue once
+    more and calls :meth:`refresh` while it runs.
+
+    :model attributes:
+        .. attribute:: name
+
+            name of the task
+        .. attribute:: ctime
+
+            date of the scheduling
+    """
+
+    class Meta:
+        app_label = "plmapp"
+
+    name = models.CharField(max_length=50, primary_key=True)
+    ctime = models.DateTimeField(default=timezone.now)
+
+    def __unicode__(self):
+        return u"ScheduledTask<%s>" % self.name
+
+    @classmethod
+    def schedule(cls, name, countdown=0):
+        """
+        Marks the task *name* as scheduled. Returns True if it was not
+        already scheduled: the caller must then send the task.
+
+        *countdown* is the delay (in seconds) before the task starts.
+        A task which has not started :const:`LOST_TASK_DELAY` seconds after
+        this delay is scheduled again.
+        """
+        task, created = cls.objects.get_or_create(name=name)
+        if created:
+            return True
+        limit = timezone.now() - datetime.timedelta(seconds=countdown + LOST_TASK_DELAY)
+        if task.ctime < limit:
+            # the task has been lost, only one producer sends a new one
+            return cls.objects.filter(name=name, ctime=task.ctime)\
+                    .update(ctime=timezone.now()) == 1
+        return False
+
+    @classmethod
+    def start(cls, name):
+        """
+        Marks the task *name* as started. It must be called by the task
+        before it reads its queue.
+        """
+        cls.objects.filter(name=name).delete()
+
+    @classmethod
+    def refresh(cls, name):
+        """
+        Marks the task *name* as still running so that it is not
+        considered as lost by :meth:`schedule`.
+        """
+        cls.objects.filter(name=name).update(ctime=timezone.now())
+
+
+class PendingIndex(models.Model):
+    """
+    .. versionadded:: 2.0
+
+    Index operation which has not been written yet.
+
+    Pending index operations are written by batches by the
+    :func:`.tasks.flush_index` task through the index writer
+    of its worker.
+
+    :model attributes:
+        .. attribute:: identifier
+
+            identifier of the indexed object (``app_label.model_name.pk``)
+        .. attribute:: remove
+
+            True if the object must be removed from the index
+        .. attribute:: fast_reindex
+
+            True if the files of a document must not be indexed again
+    """
+
+    class Meta:
+        app_label = "plmapp"
+
+    identifier = models.CharField(max_length=255)
+    remove = models.BooleanField(default=False)
+    fast_reindex = models.BooleanField(default=False)
+
+    def __unicode__(self):
+        return u"PendingIndex<%s>" % self.identifier
@@ -43,6 +43,9 @@ class UserProfile(models.Model):
     can_publish = models.BooleanField(default=False, blank=True)
     #: .. versionadded:: 1.1 True if user has a restricted account
     restricted = models.BooleanField(default=False, blank=True)
+    #: .. versionadded:: 2.0 True if user has won badges which have not been
+    #: shown yet (see :mod:`openPLM.apps.badges`)
+    unseen_badges = models.BooleanField(default=False, blank=True, editable=False)
 
     #: language
     language = models.CharField(max_length=10, default="en",
@@ -0,0 +1,53 @@
+import uuid
+
+from django.db import models
+
+
+class CacheVersion(models.Model):
+    """
+    .. versionadded:: 2.0
+
+    Version of some data cached by each process.
+
+    The version is stored in the database so that all processes see
+    a new version as soon as the transaction which changed the cached
+    data is committed, whatever the cache backend is.
+
+    :model attributes:
+        .. attribute:: name
+
+            name of the cached data (for example ``"delegations"``)
+        .. attribute:: version
+
+            random version, replaced by :meth:`bump`
+    """
+
+    class Meta:
+        app_label = "plmapp"
+
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.CharField(max_length=32)
+
+    def __unicode__(self):
+        return u"CacheVersion<%s, %s>" % (self.name, self.version)
+
+    @classmethod
+    def get(cls, name):
+        """
+        Returns the current version of *name*.
+        """
+        version = cls.objects.filter(name=name).values_list("version", flat=True).first()
+        if version is None:
+            version = cls.objects.get_or_create(name=name,
+                    defaults={"version": uuid.uuid4().hex})[0].version
+        return version
+
+    @classmethod
+    def bump(cls, name):
+        """
+        Gives a new version to *name* and returns it. It must be called in
+        the transaction which modifies the cached data.
+        """
+        version = uuid.uuid4().hex
+        cls.objects.update_or_create(name=name, defaults={"version": version})
+        return version
@@ -25,16 +25,26 @@
 """
 This module provides :class:`NavigationGraph` which is used to generate
 the navigation's graph in :func:`~plmapp.views.navigate`.
+
+.. versionchanged:: 2.0
+
+    The layout computed by Graphviz is cached, the timeout (in seconds)
+    can be set with the ``NAVIGATE_CACHE_TIMEOUT`` setting (one day by
+    default).
 """
 
 import re
 import datetime
+import hashlib
+import subprocess
 import warnings
 #import cStringIO as StringIO
 import xml.etree.cElementTree as ET
 from collections import defaultdict
 import io
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
 from django.contrib.auth.models import User
 from django.template.loader import render_to_string
 from django.utils.html import linebreaks
@@ -56,6 +66,9 @@ OSR = "only_search_results"
 
 TIME_FORMAT = "%Y-%m-%d:%H:%M:%S/"
 
+#: timeout of cached layouts (in seconds)
+TIMEOUT = getattr(settings, "NAVIGATE_CACHE_TIMEOUT", 60 * 60 * 24)
+
 def get_id_card_data(doc_ids, date=None):
     """
     Get informations to display in the id-cards of all Document which id is in doc_ids
@@ -72,13 +85,13 @@ def get_id_card_data(doc_ids, date=None):
     """
     ctx = { "thumbnails" : {}, "num_files" : {} }
     if doc_ids:
-        thumbnails = models.DocumentFile.objects.filter(deprecated=False,
-            document__in=doc_ids, thumbnail__isnull=False).exclude(thumbnail="")
+        files = models.DocumentFile.objects.filter(deprecated=False,
+            document__in=doc_ids).order_by()
+        thumbnails = files.filter(thumbnail__isnull=False).exclude(thumbnail="")
         ctx["thumbnails"].update(thumbnails.values_list("document", "thumbnail"))
         num_files = dict.fromkeys(doc_ids, 0)
-        for doc_id in models.DocumentFile.objects.filter(deprecated=False,
-            document__in=doc_ids).values_list("document", flat=True):
-                num_files[doc_id] += 1
+        # files are counted by the database (COUNT ... GROUP BY)
+        num_files.update(files.values_list("document").annotate(Count("id")))
         ctx["num_files"] = num_files
     return ctx
 
@@ -332,11 +345,28 @@ class NavigationGraph(object):
                 self._set_node_attributes(link.plmobject)
         else:
             # obj is the part id
-            links = models.DocumentPartLink.objects.at(self.time).filter(part__id=obj).select_related("document")
-            if self.options[OSR]:
-                links = links.filter(document__in=self.plmobject_results)
-            for link in links.only(*_documents_attrs)[:OBJECTS_LIMIT]:
-                self.edges.add((obj_id or obj, link.document_id, " "))
+            self._create_doc_edges_in_bulk({obj : [obj_id or obj]})
+
+    def _create_doc_edges_in_bulk(self, part_nodes):
+        """
+        .. versionadded:: 2.0
+
+        Adds the documents attached to several parts with one query.
+
+        :param part_nodes: dictionary (part id -> list of nodes of the part)
+        """
+        if not part_nodes or (self.options[OSR] and not self.plmobject_results):
+            return
+        links = models.DocumentPartLink.objects.at(self.time).\
+                filter(part__in=part_nodes.keys()).select_related("document")
+        if self.options[OSR]:
+            links = links.filter(document__in=self.plmobject_results)
+        counts = defaultdict(int)
+        for link in links.only("part", *_documents_attrs):
+            if counts[link.part_id] < OBJECTS_LIMIT:
+                counts[link.part_id] += 1
+                for node in part_nodes[link.part_id]:
+                    self.edges.add((node, link.document_id, " "))
                 self._set_node_attributes(link.document)
 
     def _create_user_edges(self, obj, role):
@@ -378,27 +408,32 @@ class NavigationGraph(object):
             if self.options[OSR]:
                 qs = qs.filter(id__in=self.plmobject_results)
             links = qs.values("id", "type", "reference", "revision", "name").order_by()
+            # documents are added after all parts (one query)
+            doc_parts = defaultdict(list)
             for plmobject in links[:OBJECTS_LIMIT]:
                 part_doc_id = role + str(plmobject["id"])
                 self.edges.add((node, part_doc_id, role))
                 if is_part(plmobject):
                     if plmobject["id"] in self.options["doc_parts"]:
-                        self._create_doc_edges(plmobject["id"], part_doc_id)
+                        doc_parts[plmobject["id"]].append(part_doc_id)
                 self._set_node_attributes(plmobject, part_doc_id, type_="plmobject")
+            self._create_doc_edges_in_bulk(doc_parts)
 
         else:
             # signer roles
             qs = obj.plmobjectuserlink_user.at(self.time).filter(role__istartswith=role)
             if self.options[OSR]:
                 qs = qs.filter(plmobject__in=self.plmobject_results)
+            doc_parts = defaultdict(list)
             for link in qs.select_related("plmobject").only("role", *_plmobjects_attrs)[:OBJECTS_LIMIT]:
                 part_doc_id = link.role + str(link.plmobject_id)
                 self.edges.add((node, part_doc_id, link.role.replace("_", "\\n")))
                 part_doc = link.plmobject
                 if part_doc.is_part:
                     if part_doc.id in self.options["doc_parts"]:
-                        self._create_doc_edges(part_doc.id, part_doc_id)
+                        doc_parts[part_doc.id].append(part_doc_id)
                 self._set_node_attributes(part_doc, part_doc_id)
+            self._create_doc_edges_in_bulk(doc_parts)
 
     def create_edges(self):
         """
@@ -551,14 +586,16 @@ class NavigationGraph(object):
         self._title_to_node[id_] = data
 
     def _convert_map(self, map_string):
-        elements = []
+        nodes = []
         ajax_navigate = "/ajax/navigate/" + get_path(self.object)
         time_str = "" if not self.time else self.time.strftime(TIME_FORMAT)
         card_data = get_id_card_data(self._doc_ids)
         ids = self._doc_ids + self._part_to_node.keys()
         if ids:
-            states = dict(models.StateHistory.objects.at(self.time).filter(
-            plmobject__in=ids).values_list("plmobject", "state"))
+            states = models.StateHistory.objects.at(self.time).filter(plmobject__in=ids)
+            if self.time is not None:
+                states = states.with_archive(self.time)
+            states = dict(states.values_list("plmobject", "state"))
         else:
             states = {}
 
@@ -567,46 +604,41 @@ class NavigationGraph(object):
                 if area.get("shape") == "rect":
                     title = area.get("title")
                     if title:
-                        id_ =  area.get("id")
                         left, top = map(int, area.get("coords").split(",")[:2])
-                        s = "top:%dpx;left:%dpx;" % (top, left)
-                        title = linebreaks(title.replace("\\n", "\n"))
-                        div = "<div id='%s' class='edge' style='%s'>%s</div>" % (id_, s, title)
-                        elements.append(div)
+                        nodes.append({"edge" : True, "id" : area.get("id"),
+                            "style" : "top:%dpx;left:%dpx;" % (top, left),
+                            "title" : linebreaks(title.replace("\\n", "\n"))})
                 continue
 
-            data = self._title_to_node.get(area.get("id"), {})
+            ctx = self._title_to_node.get(area.get("id"), {}).copy()
 
             # compute css position of the div
             left, top = map(int, area.get("coords").split(",")[:2])
-            style = "top:%dpx;left:%dpx;" % (top, left)
-
-            # render the div
-            id_ = "Nav-%s" % area.get("id")
-            ctx = data.copy()
-            ctx.update(card_data)
+            ctx["style"] = "top:%dpx;left:%dpx;" % (top, left)
             if ctx["type"] in ("part", "document"):
                 ctx["object"]["state_id"] = states.get(ctx["object"]["id"])
-            ctx["style"] = style
-            ctx["id"] = id_
-            main = self.main_node == area.get("id")
-            ctx["main"] = main
+            ctx["id"] = "Nav-%s" % area.get("id")
+            ctx["main"] = main = self.main_node == area.get("id")
             ctx["href"] = area.get("href")
-            ctx["documents_url"] = ajax_navigate
-            ctx["time"] = time_str
-            ctx["MEDIA_URL"] = settings.MEDIA_URL
-            ctx["STATIC_URL"] = settings.STATIC_URL
-            div = render_to_string("navigate/node.html", ctx)
             if main:
                 # the main node must be the first item, since it is
                 # used to center the graph
-                elements.insert(0, div)
+                nodes.insert(0, ctx)
             else:
-                elements.append(div)
-        return u"\n".join(elements)
+                nodes.append(ctx)
+        # all divs are rendered at once
+        ctx = {
+            "nodes" : nodes,
+            "documents_url" : ajax_navigate,
+            "time" : time_str,
+            "MEDIA_URL" : settings.MEDIA_URL,
+            "STATIC_URL" : settings.STATIC_URL,
+        }
+        ctx.update(card_data)
+        return render_to_string("navigate/nodes.html", ctx)
 
     def _parse_svg(self, svg):
-        # TODO: optimize this function
+        # this function is called only if the layout is not cached
         edges = []
         root = ET.fromstring(svg)
         graph = root.getchildren()[0]
@@ -644,6 +676,10 @@ class NavigationGraph(object):
         """
         Renders an image of the graph.
 
+        .. versionchanged:: 2.0
+            Graphviz is run once and its results are cached
+            (see :meth:`layout`).
+
         :returns: a tuple (html content, javascript content)
         """
         warnings.simplefilter('ignore', RuntimeWarning)
@@ -654,18 +690,34 @@ class NavigationGraph(object):
         s = s[:s.rfind("}")]
         s += "\n".join(u'%s -> %s [label="%s", href="."];' % edge for edge in sorted(self.edges)) + "}\n"
         self.graph.close()
-        self.graph = FrozenAGraph(s)
-
-        prog = self.options.get("prog", "dot")
-        self.graph.layout(prog=prog)
-        s = io.StringIO()
-        svg = io.StringIO()
-        self.graph.draw(svg, format='svg', prog=prog)
-        svg.seek(0)
-        self.graph.draw(s, format='cmapx', prog=prog)
-        s.seek(0)
-        map_string = s.read()
-        self.graph.clear()
         warnings.simplefilter('default', RuntimeWarning)
-        return self._convert_map(map_string), self._parse_svg(svg.read())
+        map_string, edges = self.layout(s, self.options.get("prog", "dot"))
+        return self._convert_map(map_string), edges
 
+    def layout(self, source, prog):
+        """
+        .. versionadded:: 2.0
+
+        Computes the layout of *source* (a graph in dot format) with *prog*
+        and returns a tuple (image map, edges data).
+
+        The layout engine is run once to output both the image map (cmapx
+        format) and the svg image parsed by :meth:`_parse_svg`.
+        Results are cached with a key computed from *source* and *prog*:
+        *source* contains all nodes, edges and options (the time of the
+        graph can not change the layout of a given source).
+        """
+        key = "navigate:%s" % hashlib.md5((u"%s:%s" % (prog, source)).encode("utf-8")).hexdigest()
+        result = cache.get(key)
+        if result is None:
+            process = subprocess.Popen([prog, "-Tsvg", "-Tcmapx"], stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            output, errors = process.communicate(source.encode("utf-8"))
+            if process.returncode != 0:
+                raise RuntimeError("%s failed: %s" % (prog, errors))
+            output = output.decode("utf-8")
+            # outputs are written one after the other
+            end = output.rindex("</svg>") + len("</svg>")
+            result = output[end:].strip(), self._parse_svg(output[:end].encode("utf-8"))
+            cache.set(key, result, TIMEOUT)
+        return result
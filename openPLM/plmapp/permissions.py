@@ -0,0 +1,299 @@
+############################################################################
+# openPLM - open source PLM
+# Copyright 2010 Philippe Joulaud, Pierre Cosquer
+#
+# This file is part of openPLM.
+#
+#    openPLM is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    openPLM is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with openPLM.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Contact :
+#    Philippe Joulaud : ninoo.fr@gmail.com
+#    Pierre Cosquer : pcosquer@linobject.com
+################################################################################
+
+"""
+.. versionadded:: 2.0
+
+This module provides a permission context shared by all controllers
+of a same user during a request and functions which check the
+readability of many objects at once (:func:`annotate_readable` and
+:func:`filter_readable`).
+
+A :class:`PermissionContext` is attached to a user by :func:`activate`
+(see :class:`.PermissionContextMiddleware`). Then controllers
+(see :meth:`.PLMObjectController.has_permission`,
+:meth:`.PLMObjectController.check_permission` and
+:meth:`.PLMObjectController.check_readable`) use it instead of running
+queries for each object:
+
+    * the user's group ids are loaded in one query,
+    * delegations are read from the index of :mod:`.delegations`,
+    * roles (:class:`.PLMObjectUserLink`) of the user and of its delegators
+      are loaded per object or in bulk with :meth:`PermissionContext.prefetch`.
+
+A context reads the version of the shared permission data (delegations
+and groups, see :const:`.delegations.VERSION_NAME`) when it is created.
+This version is stored in the database and replaced in the transaction
+which changes a delegation or the groups of a user, so all processes
+see the change. Group ids can be cached across requests for
+``PERMISSION_CACHE_TIMEOUT`` seconds (0, the default, disables this cache):
+they are cached with this version.
+
+Roles are never kept across requests. Saving or ending
+a :class:`.PLMObjectUserLink` or a :class:`.DelegationLink` or changing
+the groups of a user resets the contexts of the current process. Links
+created by :meth:`~django.db.models.query.QuerySet.bulk_create` do not
+send signals, callers must call :func:`reset_contexts` themselves.
+"""
+
+import itertools
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, m2m_changed
+
+from openPLM.plmapp import models, delegations
+
+#: timeout (in seconds) of the per-user cache of group ids
+TIMEOUT = getattr(settings, "PERMISSION_CACHE_TIMEOUT", 0)
+
+_generations = itertools.count()
+_generation = next(_generations)
+
+
+class PermissionContext(object):
+    """
+    Permissions of *user*.
+
+    .. attribute:: group_ids
+
+        set of ids of the groups of the user
+
+    .. attribute:: version
+
+        version of the delegations and groups read by the context
+        (see :class:`.CacheVersion`)
+
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._delegators = {}
+        self._roles = {}
+        self._load()
+
+    def _load(self):
+        self._generation = _generation
+        self.version = models.CacheVersion.get(delegations.VERSION_NAME)
+        self._index = None
+        self.group_ids = self._load_group_ids()
+
+    def _load_group_ids(self):
+        key = "permissions_groups:%d:%s" % (self.user.id, self.version)
+        group_ids = cache.get(key) if TIMEOUT else None
+        if group_ids is None:
+            group_ids = frozenset(self.user.groups.values_list("id", flat=True))
+            if TIMEOUT:
+                cache.set(key, group_ids, TIMEOUT)
+        return group_ids
+
+    def check_generation(self):
+        """
+        Resets the context if a permission has changed since it has been
+        created.
+        """
+        if self._generation != _generation:
+            self._delegators.clear()
+            self._roles.clear()
+            self._load()
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = delegations.get_index(self.version)
+        return self._index
+
+    def get_delegators(self, role):
+        """
+        Returns the set of ids of the delegators of the user for *role*
+        (see :meth:`.DelegationLink.get_delegators`).
+        """
+        self.check_generation()
+        try:
+            return self._delegators[role]
+        except KeyError:
+            delegators = self._get_index().get_delegators(self.user.id, role)
+            self._delegators[role] = delegators
+            return delegators
+
+    def prefetch(self, plmobject_ids):
+        """
+        Loads in one query the roles of the user and of its delegators
+        on the objects *plmobject_ids*.
+        """
+        self.check_generation()
+        ids = [i for i in plmobject_ids if i not in self._roles]
+        if not ids:
+            return
+        users = self._get_index().get_all_delegators(self.user.id)
+        users.add(self.user.id)
+        for i in ids:
+            self._roles[i] = defaultdict(set)
+        links = models.PLMObjectUserLink.current_objects.filter(plmobject__in=ids,
+                user__in=users).order_by().values_list("plmobject", "user", "role")
+        for plmobject, user, role in links:
+            self._roles[plmobject][role].add(user)
+
+    def has_role(self, plmobject_id, role):
+        """
+        Returns True if the user or one of its delegators for *role*
+        has the role *role* on the object *plmobject_id*.
+        """
+        self.prefetch((plmobject_id,))
+        users = self._roles[plmobject_id].get(role)
+        if not users:
+            return False
+        return self.user.id in users or not users.isdisjoint(self.get_delegators(role))
+
+
+#: state categories of objects readable by any user
+ALWAYS_READABLE = frozenset((models.LifecycleInfo.OFFICIAL,
+    models.LifecycleInfo.DEPRECATED, models.LifecycleInfo.CANCELLED))
+
+def _get_plmobject_id(obj):
+    """
+    Returns the id of the :class:`.PLMObject` which controls the
+    readability of *obj* or None if *obj* is always readable.
+    """
+    if isinstance(obj, models.PLMObject):
+        return obj.id
+    if isinstance(obj, models.DocumentFile):
+        return obj.document_id
+    # imported here so that controllers do not depend on haystack
+    from haystack.models import SearchResult
+    if isinstance(obj, SearchResult):
+        if issubclass(obj.model, models.PLMObject):
+            return int(obj.pk)
+        if issubclass(obj.model, models.DocumentFile):
+            document_id = getattr(obj, "document_id", None)
+            if document_id is None and obj.object is not None:
+                document_id = obj.object.document_id
+            return document_id or -1
+    return None
+
+def annotate_readable(user, objects):
+    """
+    Sets a boolean ``readable`` attribute on each object of *objects* and
+    returns *objects* as a list.
+
+    *objects* may contain :class:`.PLMObject`, :class:`.DocumentFile`,
+    search results or any other object (users, groups...) which is
+    always readable. A document file is readable if its document is readable.
+
+    The rules are the same as :meth:`.PLMObjectController.check_readable`
+    (or :meth:`.PLMObjectController.check_restricted_readable` for
+    a restricted account) but it runs at most three queries
+    whatever the number of objects:
+
+        * the user's groups (none if a :class:`PermissionContext` is active),
+        * the owner, group and state category of objects which are not
+          :class:`.PLMObject` instances,
+        * the reader links of a restricted account.
+    """
+    objects = list(objects)
+    ids = [_get_plmobject_id(obj) for obj in objects]
+    wanted = set(i for i in ids if i is not None)
+    if not wanted or user.username == settings.COMPANY:
+        for obj in objects:
+            obj.readable = True
+        return objects
+    # (owner, group, published, state category) of each object
+    infos = {}
+    for obj, i in zip(objects, ids):
+        if isinstance(obj, models.PLMObject):
+            infos[i] = (obj.owner_id, obj.group_id, obj.published,
+                    obj.get_state_category())
+    missing = wanted.difference(infos)
+    if missing:
+        values = models.PLMObject.objects.filter(id__in=missing).values_list("id",
+                "owner", "group", "published", "state_category")
+        for value in values:
+            infos[value[0]] = value[1:]
+    readable_ids = set()
+    if user.profile.restricted:
+        links = models.PLMObjectUserLink.current_objects.filter(user=user,
+                role=models.ROLE_READER, plmobject__in=wanted)
+        readable_ids.update(links.values_list("plmobject", flat=True))
+        readable_ids.update(i for i, info in infos.items() if info[2])
+    else:
+        context = get_context(user)
+        if context is not None:
+            group_ids = context.group_ids
+        else:
+            group_ids = set(user.groups.values_list("id", flat=True))
+        for i, (owner, group, published, category) in infos.items():
+            if (owner == user.id or group in group_ids or
+                    category in ALWAYS_READABLE):
+                readable_ids.add(i)
+    for obj, i in zip(objects, ids):
+        # deleted objects (not yet unindexed) are not readable
+        obj.readable = i is None or (user.is_active and i in readable_ids)
+    return objects
+
+def filter_readable(user, objects):
+    """
+    Returns the list of objects of *objects* that *user* can read.
+    See :func:`annotate_readable`.
+    """
+    return [obj for obj in annotate_readable(user, objects) if obj.readable]
+
+
+def activate(user):
+    """
+    Attaches a new :class:`PermissionContext` to *user* and returns it.
+    """
+    user.permission_context = PermissionContext(user)
+    return user.permission_context
+
+def deactivate(user):
+    """ Removes the :class:`PermissionContext` attached to *user*. """
+    if get_context(user) is not None:
+        del user.permission_context
+
+def get_context(user):
+    """
+    Returns the :class:`PermissionContext` attached to *user* or None.
+    """
+    return getattr(user, "permission_context", None)
+
+def reset_contexts():
+    """
+    Resets all contexts: they reload the permissions of their user
+    the next time they are used.
+    """
+    global _generation
+    _generation = next(_generations)
+
+def _reset_contexts(sender, **kwargs):
+    reset_contexts()
+
+def _groups_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        models.CacheVersion.bump(delegations.VERSION_NAME)
+        reset_contexts()
+
+for model in (models.PLMObjectUserLink, models.DelegationLink):
+    post_save.connect(_reset_contexts, sender=model)
+    models.links_ended.connect(_reset_contexts, sender=model)
+m2m_changed.connect(_groups_changed, sender=models.User.groups.through)
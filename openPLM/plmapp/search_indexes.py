@@ -115,18 +115,10 @@ set_template_name(GroupIndex)
 
 #indexed= [index.model for index in indexes.Index.get_indexes()]
 
+_STATE_CLASSES = dict(models.LifecycleInfo.STATE_CATEGORIES)
+
 def get_state_class(obj):
-    if obj.is_cancelled:
-        cls = "cancelled"
-    elif obj.is_official:
-        cls = "official"
-    elif obj.is_draft:
-        cls = "draft"
-    elif obj.is_deprecated:
-        cls = "deprecated"
-    else:
-        cls = "proposed"
-    return "state-" + cls
+    return "state-" + _STATE_CLASSES[obj.state_category]
 
 for key, model in models.get_all_plmobjects().items():
 
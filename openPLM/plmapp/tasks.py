@@ -1,7 +1,9 @@
 ###########################
 # adapted from https://github.com/mixcloud/django-celery-haystack-SearchIndex/
 # by sdcooke
+from collections import defaultdict
 from functools import wraps
+from contextlib import contextmanager
 #from django.db.models.loading import get_model
 from django.apps import apps
 #apps.get_model('app_name', 'ModelName')
@@ -10,7 +12,15 @@ import openPLM.plmapp.thumbnailers
 import django 
 from functools import wraps
 from django.apps import apps
+from django.conf import settings
+from django.db import transaction
 from djcelery_transactions import task
+from celery.signals import task_prerun
+
+from openPLM.plmapp.models import check_lifecycle_registry
+
+# like a request, a task reads the version of the lifecycle registry
+task_prerun.connect(check_lifecycle_registry)
 
 
 def synchronized(cls=None, lock=None):
@@ -57,9 +67,9 @@ _deffered_user_fields = [
  'creator__last_name', 'creator__email', 'creator__is_staff', 'creator__is_active',
  'creator__date_joined']
 
-def _get_manager(model_class):
+def _get_manager(model_class, queryset=None):
     from openPLM.plmapp import models
-    manager = model_class.objects
+    manager = model_class.objects if queryset is None else queryset
     if issubclass(model_class, models.PLMObject):
         return manager.select_related(*_plmobject_fields).defer(*_deffered_user_fields)
     elif issubclass(model_class, models.GroupInfo):
@@ -68,49 +78,137 @@ def _get_manager(model_class):
         return manager.select_related(*_documentfile_fields)
     return manager
 
-@synchronized
+#: name of the :func:`flush_index` task (see :class:`.ScheduledTask`)
+INDEX_TASK_NAME = "index"
+#: number of pending index operations written by each commit of
+#: :func:`flush_index`
+INDEX_BATCH_SIZE = getattr(settings, "HAYSTACK_XAPIAN_BATCH_SIZE", 1000)
+
+def queue_index(pendings):
+    """
+    .. versionadded:: 2.0
+
+    Adds *pendings* (a list of :class:`.PendingIndex`) to the index queue
+    and schedules :func:`flush_index` if it is not already scheduled.
+    """
+    from openPLM.plmapp.models import PendingIndex, ScheduledTask
+    PendingIndex.objects.bulk_create(pendings)
+    if ScheduledTask.schedule(INDEX_TASK_NAME):
+        flush_index.delay()
+
+def _get_identifier(app_name, model_name, pk):
+    return u"%s.%s.%s" % (app_name, model_name, pk)
+
 @task(name="openPLM.plmapp.tasks.update_index",
       default_retry_delay=60, max_retries=10)
 def update_index(app_name, model_name, pk, fast_reindex=False, **kwargs):
-    from haystack import site
-    import openPLM.plmapp.search_indexes
-
-    model_class = apps.get_model(app_name, model_name)
-    manager = _get_manager(model_class)
-    instance = manager.get(pk=pk)
-    if fast_reindex:
-        instance.fast_reindex = True
-    search_index = site.get_index(model_class)
-    search_index.update_object(instance)
+    from openPLM.plmapp.models import PendingIndex
+    queue_index([PendingIndex(identifier=_get_identifier(app_name, model_name, pk),
+        fast_reindex=fast_reindex)])
 
 
 @task(name="openPLM.plmapp.tasks.update_indexes",
       default_retry_delay=60, max_retries=10)
 def update_indexes(instances, fast_reindex=False):
-    from haystack import site
-    import openPLM.plmapp.search_indexes
-    for app_name, model_name, pk in instances:
-        model_class = apps.get_model(app_name, model_name)
-        manager = _get_manager(model_class)
-        instance = manager.get(pk=pk)
-        if fast_reindex:
-            instance.fast_reindex = True
-        search_index = site.get_index(model_class)
-        search_index.update_object(instance)
-
-update_indexes = synchronized(update_indexes, update_index.lock)
+    from openPLM.plmapp.models import PendingIndex
+    queue_index([PendingIndex(identifier=_get_identifier(*instance),
+        fast_reindex=fast_reindex) for instance in instances])
 
 
 @task(name="openPLM.plmapp.tasks.remove_index",
       default_retry_delay=60, max_retries=10)
 def remove_index(app_name, model_name, identifier):
+    from openPLM.plmapp.models import PendingIndex
+    queue_index([PendingIndex(identifier=identifier, remove=True)])
+
+
+@contextmanager
+def _index_writer():
+    """
+    Yields the index writer of the process (see :class:`.IndexWriter`)
+    and closes it on exit so that the database is not locked between two
+    flushes. Yields None if the search backend has no writer.
+    """
+    from haystack import backend
+    get_writer = getattr(backend, "get_writer", None)
+    if get_writer is None:
+        yield None
+    else:
+        writer = get_writer()
+        try:
+            yield writer
+        finally:
+            writer.close()
+
+def _write_pendings(pendings):
+    """
+    Writes *pendings* (a list of :class:`.PendingIndex`): the last operation
+    on an object is written, objects are loaded with one query per model.
+    """
     from haystack import site
     import openPLM.plmapp.search_indexes
 
-    model_class = apps.get_model(app_name, model_name)
-    search_index = site.get_index(model_class)
-    search_index.remove_object(identifier)
-remove_index = synchronized(remove_index, update_index.lock)
+    operations = {}
+    for pending in pendings:
+        previous = operations.get(pending.identifier)
+        if previous is not None and not (previous.remove or pending.remove):
+            # an object is reindexed quickly only if all updates were fast
+            pending.fast_reindex = pending.fast_reindex and previous.fast_reindex
+        operations[pending.identifier] = pending
+    pks = defaultdict(dict)
+    for identifier, pending in operations.items():
+        app_name, model_name, pk = identifier.split(".", 2)
+        model_class = apps.get_model(app_name, model_name)
+        if pending.remove:
+            site.get_index(model_class).remove_object(identifier)
+        else:
+            pks[model_class][pk] = pending.fast_reindex
+    for model_class, fast_reindex in pks.items():
+        search_index = site.get_index(model_class)
+        # deleted objects are removed by a later operation
+        for pk, instance in _get_manager(model_class).in_bulk(list(fast_reindex)).items():
+            if fast_reindex[str(pk)]:
+                instance.fast_reindex = True
+            search_index.update_object(instance)
+
+@task(name="openPLM.plmapp.tasks.flush_index", ignore_result=True)
+def flush_index(batch_size=INDEX_BATCH_SIZE):
+    """
+    .. versionadded:: 2.0
+
+    Writes the pending index operations (:class:`.PendingIndex`) by
+    batches of *batch_size* operations. Each batch is written in one
+    commit of the index and deleted in the same transaction: the
+    operations of a failed batch are written by the next flush.
+
+    Only one flush runs at a time so the index has only one writer:
+    the task is marked as started (see :class:`.ScheduledTask`) once the
+    queue is empty.
+
+    Returns the number of written operations.
+    """
+    from openPLM.plmapp.models import PendingIndex, ScheduledTask
+    count = 0
+    with _index_writer() as writer:
+        while True:
+            with transaction.atomic():
+                pendings = list(PendingIndex.objects.order_by("id")[:batch_size])
+                if not pendings:
+                    break
+                if writer is None:
+                    _write_pendings(pendings)
+                else:
+                    with writer.batch():
+                        _write_pendings(pendings)
+                PendingIndex.objects.filter(id__in=[p.id for p in pendings]).delete()
+            count += len(pendings)
+            ScheduledTask.refresh(INDEX_TASK_NAME)
+    # operations queued from now schedule a new flush, the ones queued
+    # before are flushed by a new task
+    ScheduledTask.start(INDEX_TASK_NAME)
+    if PendingIndex.objects.exists() and ScheduledTask.schedule(INDEX_TASK_NAME):
+        flush_index.delay()
+    return count
 
 
 @task
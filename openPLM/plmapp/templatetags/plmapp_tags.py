@@ -9,6 +9,8 @@ from haystack.models import SearchResult
 
 from openPLM.plmapp.controllers import (DocumentController, PartController,UserController, GroupController)
 from openPLM.plmapp import models
+from openPLM.plmapp.controllers.base import Controller
+from openPLM.plmapp.permissions import annotate_readable
 from openPLM.plmapp.filters import richtext, plaintext
 from openPLM.plmapp.utils import get_pages_num
 register = template.Library()
@@ -151,17 +153,11 @@ def get_state_class(plmobject):
     Returns the state class ("cancelled", "draft", "proposed", "official",
     or "deprecated") of *plmobject*.
     """
-    state, lifecycle = (plmobject.state_id, plmobject.lifecycle_id)
-    if lifecycle == models.get_cancelled_lifecycle().name:
+    info = models.get_lifecycle_info(plmobject.lifecycle_id)
+    if info.is_cancelled:
         return "cancelled"
-    lc = models.Lifecycle.objects.get(name=lifecycle)
-    if state == lc.official_state_id:
-        return "official"
-    if state == lc.first_state.name:
-        return "draft"
-    if state == lc.last_state.name:
-        return "deprecated"
-    return "proposed"
+    category = info.get_category(plmobject.state_id)
+    return dict(models.StateHistory.STATE_CATEGORIES)[category]
 
 @register.filter
 def result_class(result):
@@ -312,60 +308,18 @@ register.tag('is_object_readable', do_is_object_readable)
 
 @register.filter
 def is_readable(obj, user):
-    from django.conf import settings
-    if user.username == settings.COMPANY:
-        return True
-    # plmobjects are readable if:
-    #  * they are official, deprecated or cancelled
-    #  * user is their owner
-    #  * user is in their group
-    if isinstance(obj, models.PLMObject):
-        if obj.is_official or obj.is_deprecated or obj.is_cancelled:
-            return True
-        if obj.owner_id == user.id:
-            return True
-        if not hasattr(user, "group_ids"):
-            # cache group ids as it may be used to test another object
-            # in the page
-            user.group_ids = set(user.groups.all().values_list("id", flat=True))
-        return obj.group_id in user.group_ids
-    elif isinstance(obj, SearchResult):
-        if is_plmobject(obj) or is_documentfile(obj):
-            if not hasattr(user, "group_names"):
-                user.group_names = set(user.groups.all().values_list("name", flat=True))
-        if is_plmobject(obj):
-            state_class = result_class(obj)
-            if state_class in ("state-official", "state-deprecated", "state-cancelled"):
-                return True
-            if obj.owner == user.username:
-                return True
-            if obj.group is None:
-                try:
-                    gr = models.PLMObject.objects.filter(id=obj.pk).values_list("group__name", flat=True)[0]
-                except IndexError: # deleted object, not yet unindexed
-                    return False
-                return gr in user.group_names
-            return obj.group in user.group_names
-        elif is_documentfile(obj):
-            if obj.group:
-                if obj.group in user.group_names:
-                    return True
-                else:
-                    # the document may be official, deprecated...
-                    s, l = (models.PLMObject.objects.filter(id=obj.document_id)
-                            .values_list("state", "lifecycle"))[0]
-                    obj.state_id = s
-                    obj.lifecycle_id = l
-                    return get_state_class(obj) in ("official", "deprecated",
-                            "cancelled")
-            # document file indexed before the revision [1848]
-            if obj.object is None: # deleted object
-                return False
-            doc = obj.object.document
-            return is_readable(doc, user)
+    """
+    Returns True if *user* can read *obj* (see :func:`.annotate_readable`).
 
-    # other objects: readable
-    return True
+    Views should call :func:`.annotate_readable` on lists of objects
+    so that this filter does not run queries for each object.
+    """
+    if isinstance(obj, Controller):
+        obj = obj.object
+    readable = getattr(obj, "readable", None)
+    if readable is None:
+        readable = annotate_readable(user, [obj])[0].readable
+    return readable
 
 
 @register.filter
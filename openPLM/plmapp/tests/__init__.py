@@ -44,6 +44,7 @@ from openPLM.plmapp.tests.navigate import *
 from openPLM.plmapp.tests.reference import *
 from openPLM.plmapp.tests.restricted import *
 from openPLM.plmapp.tests.filters import *
+from openPLM.plmapp.tests.xapian_writer import *
 
 import openPLM.plmapp.models
 from openPLM.plmapp.lifecycle import LifecycleList
@@ -1,5 +1,7 @@
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.core import mail
+from django.db import connection
 
 from openPLM.plmapp.controllers import PartController
 from openPLM.plmapp import models
@@ -488,6 +490,32 @@ class AssemblyTestCase(BaseTestCase, TransactionTestCase):
             ]),
         )
 
+    def test_histories(self):
+        ctrl, ctrls = self.build_assembly("P1", D, {}, [
+                ("P2", D, {}, []),
+                ("P3", D, {}, []),
+            ])
+        ctrl.promote_assembly()
+        for c in ctrls:
+            sh = models.StateHistory.objects.now().get(plmobject=c.id)
+            self.assertEqual(O, sh.state_id)
+            self.assertEqual(models.StateHistory.OFFICIAL, sh.state_category)
+            self.assertTrue(models.History.objects.filter(plmobject=c.id,
+                action="promoted").exists())
+            self.assertEqual(self.cie, models.Part.objects.get(id=c.id).owner)
+        self.assertFalse(models.PromotionApproval.objects.now().exists())
+
+    def test_queries(self):
+        """ Tests that the number of signer and promotion queries does
+        not depend on the size of the assembly."""
+        def count_queries(nb_children):
+            children = [("P%d_%d" % (nb_children, i), P, {}, [])
+                    for i in range(nb_children)]
+            ctrl = self.build_assembly("A%d" % nb_children, P, {}, children)[0]
+            with CaptureQueriesContext(connection) as ctx:
+                ctrl.promote_assembly()
+            return len(ctx)
+        self.assertEqual(count_queries(2), count_queries(8))
 
     # TODO:
     #  * alternates
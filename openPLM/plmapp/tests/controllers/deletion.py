@@ -30,9 +30,9 @@ class DeletionTestCase(BaseTestCase):
         dlt.ON_DELETE_SELECTORS[:] = on_delete
         dlt.ON_CANCEL_SELECTORS[:] = on_cancel
         dlt.ON_DEPRECATE_SELECTORS[:] = on_deprecate
-        for f in list(self.controller.files.all()) + self.old_files:
-            os.chmod(f.file.path, 0700)
-            os.remove(f.file.path)
+        for path in set(f.file.path for f in list(self.controller.files.all()) + self.old_files):
+            os.chmod(path, 0700)
+            os.remove(path)
 
     def assertDeleted(self, doc_file):
         self.assertTrue(doc_file.deleted)
@@ -132,10 +132,10 @@ class DeletionTestCase(BaseTestCase):
         # max: 2 per day
         dlt.ON_CHECKIN_SELECTORS[:] = [(dlt.yes, dlt.MaxPerDate("day", 2))]
         d = self.controller.add_file(self.get_file(data="d"))
-        self.controller.checkin(d, self.get_file(data="p" *18))
+        self.controller.checkin(d, self.get_file(data="a" * 18))
         d, = self.controller.files.all()
         self.assertNotDeleted(d.previous_revision)
-        self.controller.checkin(d, self.get_file(data="p" *18))
+        self.controller.checkin(d, self.get_file(data="b" * 18))
         d, = self.controller.files.all()
         # 1st revision: kept
         # 2nd revision: deleted
@@ -143,12 +143,12 @@ class DeletionTestCase(BaseTestCase):
         self.assertNotDeleted(d.previous_revision.previous_revision)
         # max: 3 per day
         dlt.ON_CHECKIN_SELECTORS[:] = [(dlt.yes, dlt.MaxPerDate("day", 3))]
-        self.controller.checkin(d, self.get_file(data="p" *18))
+        self.controller.checkin(d, self.get_file(data="c" * 18))
         d, = self.controller.files.all()
         self.assertNotDeleted(d.previous_revision)
         self.assertEqual(2, d.older_files.filter(deleted=False).count())
         # add another one
-        self.controller.checkin(d, self.get_file(data="p" *18))
+        self.controller.checkin(d, self.get_file(data="e" * 18))
         d, = self.controller.files.all()
         # 1st revision: kept
         # 2nd revision: deleted
@@ -174,7 +174,7 @@ class DeletionTestCase(BaseTestCase):
         dlt.ON_CHECKIN_SELECTORS[:] = [(dlt.pattern("*.txt"), dlt.KeepAllFiles()),
                 (dlt.yes, dlt.DeleteAllFiles())]
         d = self.controller.add_file(self.get_file("x.test"))
-        self.controller.checkin(d, self.get_file("x.test"))
+        self.controller.checkin(d, self.get_file("x.test", "new data"))
         d = self.controller.files.get(id=d.id)
         self.assertDeleted(d.previous_revision)
         # txt file
@@ -227,4 +227,38 @@ class DeletionTestCase(BaseTestCase):
         self.assertDeleted(d)
         self.assertDeleted(d.previous_revision)
 
+    def test_checkin_same_content(self):
+        dlt.ON_CHECKIN_SELECTORS[:] = [(dlt.yes, dlt.DeleteAllFiles())]
+        d = self.controller.add_file(self.get_file(data="d0"))
+        self.controller.checkin(d, self.get_file(data="d0"))
+        d, = self.controller.files.all()
+        # the previous revision is deleted but its content is still used
+        self.assertTrue(d.previous_revision.deleted)
+        self.assertEqual(d.file.name, d.previous_revision.file.name)
+        self.assertEqual("d0", d.file.read())
 
+    def test_delete_shared_file(self):
+        d = self.controller.add_file(self.get_file(data="shared"))
+        rev = self.controller.revise("b")
+        d2, = rev.files.all()
+        self.assertEqual(d.file.path, d2.file.path)
+        rev.delete_file(d2)
+        # still used by the first revision
+        self.assertTrue(os.path.exists(d.file.path))
+        self.assertEqual("shared", d.file.read())
+        self.controller.delete_file(d)
+        self.assertFalse(os.path.exists(d.file.path))
+
+    def test_delete_claimed_file(self):
+        d = self.controller.add_file(self.get_file(data="claimed"))
+        # the same content is saved by a concurrent request whose
+        # reference is not committed yet
+        name = models.docfs.save("other.test", self.get_file(data="claimed"))
+        self.assertEqual(d.file.name, name)
+        self.controller.delete_file(d)
+        self.assertTrue(os.path.exists(d.file.path))
+        # the reference is committed and then deleted
+        models.DocumentFile.objects.create(filename="other.test", file=name,
+                size=d.size, document=self.controller.object, deleted=True)
+        self.assertEqual([name], dlt.remove_unreferenced_files([name]))
+        self.assertFalse(os.path.exists(d.file.path))
@@ -27,6 +27,7 @@ This module contains some tests for openPLM.
 """
 
 import os
+import hashlib
 from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth.models import User
@@ -55,9 +56,10 @@ class DocumentControllerTest(ControllerTest):
                 self.DATA, True, True)
 
     def tearDown(self):
-        for f in list(self.controller.files.all()) + self.old_files:
-            os.chmod(f.file.path, 0700)
-            os.remove(f.file.path)
+        # stored files may be shared
+        for path in set(f.file.path for f in list(self.controller.files.all()) + self.old_files):
+            os.chmod(path, 0700)
+            os.remove(path)
 
     def test_initial_lock(self):
         d = self.controller.add_file(self.get_file())
@@ -170,6 +172,13 @@ class DocumentControllerTest(ControllerTest):
         self.assertTrue(not os.access(f2.file.path, os.W_OK))
         self.assertTrue(not os.access(f2.file.path, os.X_OK))
 
+    def test_add_file_content_info(self):
+        data = "%PDF-1.4 data"
+        df = self.controller.add_file(self.get_file("a.pdf", data))
+        self.assertEqual(hashlib.sha256(data).hexdigest(), df.sha256)
+        self.assertEqual("application/pdf", df.mimetype)
+        self.assertEqual("pdf/%s.pdf" % df.sha256, df.file.name)
+
     def test_add_several_files(self):
         nb = 5
         for i in xrange(nb):
@@ -268,8 +277,8 @@ class DocumentControllerTest(ControllerTest):
         self.assertEqual(f1.filename, f2.filename)
         self.assertEqual(f1.size, f2.size)
         self.assertEqual(f1.file.read(), f2.file.read())
-        self.assertFalse(f1.file.path == f2.file.path)
-        self.old_files.append(f2)
+        # the stored file is shared
+        self.assertEqual(f1.file.path, f2.file.path)
 
     def test_checkin(self):
         d = self.controller.add_file(self.get_file())
@@ -415,7 +424,6 @@ class DocumentControllerTest(ControllerTest):
             files_cloned = files_cloned and bool(new_f)
             files_cloned = files_cloned and new_f.locker == None and not new_f.locked
             files_cloned = files_cloned and new_f.file.read() == f.file.read()
-            files_cloned = files_cloned and new_f.file.path != f.file.path
         self.assertTrue(files_cloned)
 
         # check that all attached parts are attached to the original document
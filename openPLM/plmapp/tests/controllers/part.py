@@ -26,11 +26,14 @@
 This module contains some tests for openPLM.
 """
 
+from django.db import connection
 from django.utils import timezone
 import itertools
 
 from openPLM.plmapp.controllers import PLMObjectController, PartController, \
         DocumentController
+from openPLM.plmapp.controllers.part import RECURSIVE_CTE_VENDORS
+from openPLM.plmapp import bom_cache
 import openPLM.plmapp.exceptions as exc
 import openPLM.plmapp.models as models
 from openPLM.plmapp.lifecycle import LifecycleList
@@ -410,6 +413,216 @@ class PartControllerTest(ControllerTest):
                 self.controller.get_children(-1, only_official=True)]
         self.assertEqual(children, wanted)
 
+    def test_get_children_shared_subassembly(self):
+        """ Tests that a sub-assembly is expanded under each of its parents
+        and that an unlimited BOM is retrieved in a constant number of queries."""
+        controller4 = self.create("aPart4")
+        controller5 = self.create("aPart5")
+        self.controller.add_child(self.controller2, 10, 15)
+        self.controller.add_child(controller4, 10, 5)
+        self.controller2.add_child(controller5, 10, 15)
+        controller4.add_child(controller5, 10, 15)
+        controller5.add_child(self.controller3, 10, 15)
+        wanted = [(1, controller4.object.pk),
+                  (2, controller5.object.pk),
+                  (3, self.controller3.object.pk),
+                  (1, self.controller2.object.pk),
+                  (2, controller5.object.pk),
+                  # openPLM < 2.0 did not list controller3 a second time
+                  (3, self.controller3.object.pk),
+                  ]
+        if connection.vendor in RECURSIVE_CTE_VENDORS:
+            with self.assertNumQueries(1):
+                children = self.controller.get_children(-1)
+        else:
+            children = self.controller.get_children(-1)
+        self.assertEqual(wanted, [(lvl, lk.child_id) for lvl, lk in children])
+        # max_level
+        children = self.controller.get_children(2)
+        self.assertEqual([w for w in wanted if w[0] <= 2],
+                [(lvl, lk.child_id) for lvl, lk in children])
+        # parents
+        wanted = [(1, self.controller2.object.pk),
+                  (2, self.controller.object.pk),
+                  (1, controller4.object.pk),
+                  (2, self.controller.object.pk),
+                  ]
+        parents = controller5.get_parents(-1)
+        self.assertEqual(sorted(wanted), sorted((lvl, lk.parent_id)
+            for lvl, lk in parents))
+
+    def test_closure(self):
+        """ Tests that the closure table is updated by add_child,
+        modify_child and delete_child and that it matches a rebuild."""
+        controller4 = self.create("aPart4")
+        closure = models.ParentChildClosure
+        def rows():
+            return sorted(closure.objects.values_list("ancestor", "descendant",
+                "depth", "paths", "quantity"))
+        self.controller.add_child(self.controller2, 2, 15)
+        self.controller.add_child(controller4, 3, 15)
+        self.controller2.add_child(self.controller3, 5, 15)
+        controller4.add_child(self.controller3, 7, 15)
+        self.assertTrue(self.controller3.is_ancestor(self.controller.object))
+        self.assertFalse(self.controller.is_ancestor(self.controller3.object))
+        row = closure.objects.get(ancestor=self.controller.object,
+                descendant=self.controller3.object)
+        self.assertEqual((2, 2, 2 * 5 + 3 * 7), (row.depth, row.paths, row.quantity))
+        # parts locked before updating the closure
+        self.assertEqual(set([self.controller.id, controller4.id, self.controller3.id]),
+                closure.lock_parts([controller4.id], [self.controller3.id]))
+        controller4.modify_child(self.controller3, 1, 15, "-")
+        row = closure.objects.get(ancestor=self.controller.object,
+                descendant=self.controller3.object)
+        self.assertEqual(2 * 5 + 3 * 1, row.quantity)
+        self.controller2.delete_child(self.controller3)
+        row = closure.objects.get(ancestor=self.controller.object,
+                descendant=self.controller3.object)
+        self.assertEqual((1, 3), (row.paths, row.quantity))
+        wanted = rows()
+        closure.rebuild()
+        self.assertEqual(wanted, rows())
+
+    def test_bom_counters(self):
+        """ Tests that the children/parents counters and the top assembly
+        flag are updated by add_child, modify_child and delete_child."""
+        def counters(ctrl):
+            part = models.Part.objects.get(id=ctrl.id)
+            return part.children_count, part.parents_count, part.is_top_assembly
+        self.controller.add_child(self.controller2, 2, 15)
+        self.controller2.add_child(self.controller3, 5, 15)
+        self.assertEqual((1, 0, True), counters(self.controller))
+        self.assertEqual((1, 1, False), counters(self.controller2))
+        self.assertEqual((0, 1, False), counters(self.controller3))
+        self.controller2.modify_child(self.controller3, 1, 15, "-")
+        self.assertEqual((1, 1, False), counters(self.controller2))
+        self.controller.delete_child(self.controller2)
+        self.assertEqual((0, 0, False), counters(self.controller))
+        self.assertEqual((1, 0, True), counters(self.controller2))
+        top = models.Part.top_assemblies.values_list("id", flat=True)
+        self.assertEqual([self.controller2.id], list(top))
+        self.assertEqual(0, models.rebuild_bom_counters(models.Part, models.ParentChildLink))
+        models.Part.objects.update(children_count=0, is_top_assembly=False)
+        self.assertEqual(1, models.rebuild_bom_counters(models.Part, models.ParentChildLink))
+        self.assertEqual((1, 0, True), counters(self.controller2))
+
+    def test_bom_counters_not_overwritten(self):
+        """ Tests that saving a part does not overwrite the counters
+        updated after it was loaded."""
+        other = PartController(models.Part.objects.get(id=self.controller.id),
+                self.user)
+        self.controller.add_child(self.controller2, 2, 15)
+        other.object.name = "renamed"
+        other.save()
+        self.controller.object.description = "modified"
+        self.controller.save()
+        part = models.Part.objects.get(id=self.controller.id)
+        self.assertEqual((1, 0, True), (part.children_count,
+            part.parents_count, part.is_top_assembly))
+        self.assertEqual("modified", part.description)
+
+    def test_add_children_in_bulk(self):
+        """ Tests that add_children_in_bulk creates links like add_child
+        and that check_add_children detects cycles and duplicates."""
+        controller4 = self.create("aPart4")
+        L = models.ParentChildLink
+        links = [L(parent=self.controller.object, child=self.controller2.object,
+                    quantity=2, order=1),
+                 L(parent=self.controller2.object, child=self.controller3.object,
+                    quantity=5, order=1)]
+        PartController.add_children_in_bulk(links, self.user)
+        children = self.controller.get_children(-1)
+        self.assertEqual([self.controller2.id, self.controller3.id],
+                [c.link.child_id for c in children])
+        self.assertTrue(self.controller.is_ancestor(self.controller3))
+        part = models.Part.objects.get(id=self.controller.id)
+        self.assertEqual((1, 0, True), (part.children_count,
+            part.parents_count, part.is_top_assembly))
+        self.assertEqual(1, self.controller.history.filter(action=L.ACTION_NAME).count())
+        invalid = [L(parent=self.controller3.object, child=controller4.object,
+                    quantity=1, order=1),
+                   L(parent=controller4.object, child=self.controller.object,
+                    quantity=1, order=1),
+                   L(parent=self.controller.object, child=self.controller2.object,
+                    quantity=1, order=1),
+                   L(parent=self.controller.object, child=controller4.object,
+                    quantity=1, order=2)]
+        errors = PartController.check_add_children(invalid, self.user)
+        # 0 and 1 make a cycle, 2 is a duplicate
+        self.assertEqual([0, 1, 2], sorted(errors))
+        self.assertRaises(ValueError, PartController.add_children_in_bulk,
+                invalid, self.user)
+        self.assertFalse(self.controller.is_ancestor(controller4))
+
+    def test_get_bom_cached(self):
+        """ Tests that get_bom results are cached and invalidated when
+        a descendant changes."""
+        self.add_child()
+        bom = self.controller.get_bom(None, "all")
+        self.assertEqual(1, len(bom["children"]))
+        # only the version of the part and the parts are read
+        with self.assertNumQueries(2):
+            bom2 = self.controller.get_bom(None, "all")
+        self.assertEqual(bom["children"], bom2["children"])
+        self.assertEqual(self.controller, bom2["obj"])
+        # parts are not cached
+        self.controller2.name = "new name"
+        self.controller2.save()
+        bom2 = self.controller.get_bom(None, "all")
+        self.assertEqual("new name", bom2["children"][0].link.child.name)
+        date = timezone.now()
+        self.controller2.add_child(self.controller3, 10, 15)
+        bom = self.controller.get_bom(None, "all")
+        self.assertEqual(2, len(bom["children"]))
+        # the version is shared by all processes
+        version = models.Part.objects.get(id=self.controller.id).bom_version
+        self.assertNotEqual(self.controller.object.bom_version, version)
+        # a recent BOM is not cached, links may still be committed
+        self.assertEqual(None, bom_cache.get_key(self.controller.id, date, "all"))
+        self.addCleanup(setattr, bom_cache, "PAST_DELAY", bom_cache.PAST_DELAY)
+        bom_cache.PAST_DELAY = 0
+        # a past BOM is not modified
+        bom = self.controller.get_bom(date, "all")
+        self.assertEqual(1, len(bom["children"]))
+        with self.assertNumQueries(1):
+            self.controller.get_bom(date, "all")
+
+    def test_cmp_bom(self):
+        controller4 = self.create("aPart4")
+        self.add_child(10, 15)
+        self.controller.add_child(self.controller3, 10, 20)
+        date = timezone.now()
+        self.controller.modify_child(self.controller2, 5, 15, "-")
+        self.controller.delete_child(self.controller3)
+        self.controller.add_child(controller4, 10, 5)
+        diff = self.controller.cmp_bom(date, None)["diff"]
+        result = [(tag, [(r1 and r1[1].link.child_id, r2 and r2[1].link.child_id)
+            for r1, r2 in rows]) for tag, rows in diff]
+        self.assertEqual([
+            ("insert", [(None, controller4.id)]),
+            ("replace", [(self.controller2.id, self.controller2.id)]),
+            ("delete", [(self.controller3.id, None)]),
+            ], result)
+
+    def test_cmp_bom_last_level(self):
+        """ Tests that "last" rows are keyed by their real path. """
+        controller4 = self.create("aPart4")
+        controller5 = self.create("aPart5")
+        self.controller.add_child(self.controller2, 10, 15)
+        self.controller.add_child(controller4, 10, 20)
+        self.controller2.add_child(self.controller3, 10, 15)
+        controller4.add_child(controller5, 10, 15)
+        date = timezone.now()
+        self.controller2.delete_child(self.controller3)
+        diff = self.controller.cmp_bom(date, None, "last")["diff"]
+        result = [(tag, [(r1 and r1[1].link.child_id, r2 and r2[1].link.child_id)
+            for r1, r2 in rows]) for tag, rows in diff]
+        self.assertEqual([
+            ("insert", [(None, self.controller2.id)]),
+            ("delete", [(self.controller3.id, None)]),
+            ("equal", [(controller5.id, controller5.id)]),
+            ], result)
+
     def test_get_parents(self):
         controller4 = self.create("aPart4")
         self.controller.add_child(self.controller2, 10, 15)
@@ -27,11 +27,16 @@ This module contains some tests for openPLM.
 """
 
 
+import datetime
+
+from django.core import mail
 from django.db import IntegrityError
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 from openPLM.plmapp.utils import level_to_sign_str
+from openPLM.plmapp import permissions, delegations
+import openPLM.plmapp.mail
 import openPLM.plmapp.exceptions as exc
 import openPLM.plmapp.models as models
 from openPLM.plmapp.controllers import PLMObjectController, UserController
@@ -392,6 +397,42 @@ class ControllerTest(BaseTestCase):
         self.assertRaises(exc.PermissionError, controller.set_role, user,
                           level_to_sign_str(0))
 
+    def test_mail_digest(self):
+        controller = self.create("Part1")
+        controller2 = self.create("Part2")
+        user = self.get_contributor()
+        user.email = "user2@example.net"
+        user.save()
+        controller.add_notified(user)
+        controller2.add_notified(user)
+        openPLM.plmapp.mail.do_flush_outbox()
+        mail.outbox = []
+        # histories recorded during the digest delay
+        histories = [models.History.objects.create(plmobject=c.object,
+            action="Modify", details="", user=self.user) for c in (controller, controller2)]
+        models.PendingMail.objects.bulk_create([models.PendingMail(history_type="History",
+            history_id=h.id, roles="notified", blacklist=self.user.email)
+            for h in histories])
+        self.assertEqual(1, openPLM.plmapp.mail.do_flush_outbox())
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(["user2@example.net"], mail.outbox[0].bcc)
+        self.assertFalse(models.PendingMail.objects.exists())
+        self.assertEqual(0, openPLM.plmapp.mail.do_flush_outbox())
+        # a flush is scheduled (and run, tasks are eager) if none is scheduled
+        controller.name = "a"
+        controller.save()
+        self.assertEqual(2, len(mail.outbox))
+        self.assertFalse(models.PendingMail.objects.exists())
+        # a flush is already scheduled: no task is sent
+        self.assertTrue(models.ScheduledTask.schedule(openPLM.plmapp.mail.FLUSH_TASK_NAME))
+        controller.name = "b"
+        controller.save()
+        self.assertEqual(2, len(mail.outbox))
+        self.assertTrue(models.PendingMail.objects.exists())
+        self.assertEqual(1, openPLM.plmapp.mail.do_flush_outbox())
+        self.assertEqual(3, len(mail.outbox))
+        self.assertFalse(models.ScheduledTask.objects.exists())
+
     def test_add_notified(self):
         controller = self.create("Part1")
         user = User(username="user2")
@@ -492,6 +533,29 @@ class ControllerTest(BaseTestCase):
         self.assertFalse(controller.is_cancelled)
         controller.check_readable()
 
+    def test_state_category(self):
+        """
+        Tests that the state category of an object is updated when it
+        is promoted or cancelled.
+        """
+        def category(ctrl):
+            return models.PLMObject.objects.get(id=ctrl.id).state_category
+        controller = self.create("Part1")
+        self.assertEqual(models.LifecycleInfo.DRAFT, category(controller))
+        controller.object.is_promotable = lambda: True
+        controller.promote()
+        self.assertEqual(models.LifecycleInfo.OFFICIAL, category(controller))
+        qs = models.PLMObject.objects.filter(id=controller.id)
+        self.assertTrue(qs.officials().exists())
+        controller.promote()
+        self.assertEqual(models.LifecycleInfo.DEPRECATED, category(controller))
+        self.assertFalse(qs.officials().exists())
+        controller2 = self.create("Part2")
+        controller2.cancel()
+        self.assertEqual(models.LifecycleInfo.CANCELLED, category(controller2))
+        qs = models.PLMObject.objects.filter(id__in=(controller.id, controller2.id))
+        self.assertEqual([controller.id], list(qs.exclude_cancelled().values_list("id", flat=True)))
+
     def test_approve_promotion_two_signers(self):
         controller = self.create("Part1")
         controller.object.is_promotable = lambda: True
@@ -570,6 +634,133 @@ class ControllerTest(BaseTestCase):
         self.assertEqual(self.cie, obj.owner)
         self.assertEqual("official", obj.state.name)
 
+    def test_permission_context(self):
+        ctrls = [self.create("Part%d" % i) for i in range(5)]
+        context = permissions.activate(self.user)
+        self.addCleanup(permissions.deactivate, self.user)
+        context.prefetch(c.id for c in ctrls)
+        role = level_to_sign_str(0)
+        for c in ctrls:
+            # caches lifecycle stuff
+            c.is_official, c.is_deprecated, c.is_cancelled
+        with self.assertNumQueries(0):
+            for c in ctrls:
+                ctrl = self.CONTROLLER(c.object, self.user)
+                self.assertTrue(ctrl.check_readable(False))
+                self.assertTrue(ctrl.check_permission(role, False))
+                self.assertFalse(ctrl.check_permission(models.ROLE_READER, False))
+
+    def test_permission_context_delegation(self):
+        controller = self.create("Part1")
+        user = self.get_contributor("gege")
+        permissions.activate(user)
+        self.addCleanup(permissions.deactivate, user)
+        role = level_to_sign_str(0)
+        self.assertFalse(self.CONTROLLER(controller.object, user).check_permission(role, False))
+        UserController(self.user, self.user).delegate(user, role)
+        self.assertTrue(self.CONTROLLER(controller.object, user).check_permission(role, False))
+        controller.users.now().filter(role=role).end()
+        self.assertFalse(self.CONTROLLER(controller.object, user).check_permission(role, False))
+
+    def test_permission_context_groups_cleared(self):
+        user = self.get_contributor("gege")
+        context = permissions.activate(user)
+        self.addCleanup(permissions.deactivate, user)
+        self.assertEqual(set([self.group.id]), context.group_ids)
+        version = context.version
+        user.groups.clear()
+        self.assertNotEqual(version, models.CacheVersion.get(delegations.VERSION_NAME))
+        context.check_generation()
+        self.assertFalse(context.group_ids)
+        self.assertNotEqual(version, context.version)
+
+    def test_delegation_index(self):
+        role = level_to_sign_str(0)
+        user2 = self.get_contributor("user2")
+        user3 = self.get_contributor("user3")
+        # user3 represents user2 who represents self.user
+        UserController(self.user, self.user).delegate(user2, role)
+        UserController(user2, user2).delegate(user3, role)
+        self.assertEqual(set([self.user.id, user2.id]),
+                delegations.get_delegators(user3.id, role))
+        # only the version of the index is read
+        with self.assertNumQueries(3):
+            self.assertEqual(set([user2.id, user3.id]),
+                    delegations.get_delegatees(self.user.id, role))
+            bulk = delegations.get_delegators_in_bulk([self.user.id, user2.id], role)
+            self.assertEqual({self.user.id : set(), user2.id : set([self.user.id])}, bulk)
+            self.assertFalse(delegations.get_delegators(user3.id, "notified"))
+        link = models.DelegationLink.current_objects.get(delegator=user2)
+        UserController(user2, user2).remove_delegation(link)
+        self.assertEqual([], models.DelegationLink.get_delegators(user3, role))
+        # a delegation made by another process: no signal is sent here
+        # but the version stored in the database is replaced
+        models.DelegationLink.objects.bulk_create([models.DelegationLink(
+            delegator=user2, delegatee=user3, role=role)])
+        self.assertFalse(delegations.get_delegators(user3.id, role))
+        models.CacheVersion.bump(delegations.VERSION_NAME)
+        self.assertEqual(set([self.user.id, user2.id]),
+                delegations.get_delegators(user3.id, role))
+
+    def test_filter_readable(self):
+        readable = [self.create("P%d" % i).object for i in range(5)]
+        user = User(username="other")
+        user.save()
+        self.assertEqual([], permissions.filter_readable(user, readable))
+        user.groups.add(self.group)
+        user = User.objects.get(id=user.id)
+        user.profile
+        readable[0].is_official # loads the lifecycle
+        objects = readable + [user]
+        with self.assertNumQueries(1):
+            # only the user's groups
+            objects = permissions.annotate_readable(user, objects)
+        self.assertTrue(all(obj.readable for obj in objects))
+        ids = [obj.id for obj in readable]
+        with self.assertNumQueries(2):
+            # the objects and the user's groups
+            result = permissions.filter_readable(user,
+                    models.PLMObject.objects.filter(id__in=ids))
+        self.assertEqual(set(ids), set(obj.id for obj in result))
+        self.assertEqual(readable, permissions.filter_readable(self.cie, readable))
+
+    def test_archive_histories(self):
+        ctrl = self.create("P1")
+        ctrl.name = "new name"
+        ctrl.save()
+        old = timezone.now() - datetime.timedelta(days=400)
+        histories = models.History.objects.filter(plmobject=ctrl.object)
+        archived_ids = set(histories.order_by("id").values_list("id", flat=True)[:1])
+        models.History.objects.filter(id__in=archived_ids).update(date=old)
+        before = timezone.now() - datetime.timedelta(days=365)
+        self.assertEqual(1, models.archive_rows(models.History, before))
+        self.assertEqual(old, models.get_archive_date(models.History))
+        self.assertEqual(archived_ids,
+            set(models.ArchivedHistory.objects.values_list("id", flat=True)))
+        self.assertFalse(histories.filter(id__in=archived_ids))
+        # reads across hot and archived rows
+        all_histories = list(histories.with_archive().order_by("-date", "-id"))
+        self.assertEqual(old, all_histories[-1].date)
+        self.assertTrue(isinstance(all_histories[-1], models.History))
+        # recent periods do not read the archive
+        recent = histories.with_archive(before)
+        self.assertEqual(histories.count(), recent.count())
+        self.assertEqual(len(all_histories), recent.count() + 1)
+
+    def test_recent_objects(self):
+        controllers = [self.create("P%d" % i) for i in range(6)]
+        controllers[0].name = "new name"
+        controllers[0].save()
+        with self.assertNumQueries(1):
+            recents = models.RecentObject.get_last_edited(self.user, 5)
+        expected = [controllers[0]] + controllers[5:1:-1]
+        self.assertEqual([c.id for c in expected], [r.plmobject_id for r in recents])
+        self.assertEqual("Modify", recents[0].action)
+        counts = models.UserActivity.get_counts(self.user)
+        self.assertEqual(6, counts["created"])
+        self.assertEqual(1, counts["Modify"])
+        self.assertEqual(7, models.UserActivity.get_count(self.user, "created", "Modify"))
+
     def check_cancelled_object(self, ctrl):
         """ Checks a cancelled plmobject."""
         self.assertTrue(ctrl.is_cancelled)
@@ -11,7 +11,8 @@ from celery.signals import task_prerun
 import openPLM.plmapp.models as models
 from openPLM.plmapp.models import GroupInfo, PLMObject, ParentChildLink
 from openPLM.plmapp.csvimport import PLMObjectsImporter, BOMImporter,\
-        CSVImportError, UsersImporter
+        CSVImportError, UsersImporter, BulkPLMObjectsImporter, BulkBOMImporter
+from openPLM.plmapp.controllers import PLMObjectController
 from openPLM.plmapp.views.base import get_obj
 from openPLM.plmapp.utils.unicodecsv import UnicodeWriter
 from openPLM.plmapp.forms import CSVForm
@@ -131,6 +132,70 @@ class CSVImportTestCase(TransactionTestCase):
         self.assertEqual(len(mail.outbox), 0)
         self.assertFalse(self.sent_tasks["openPLM.plmapp.tasks.update_indexes"])
 
+    def test_bulk_import_valid(self):
+        csv_rows = self.get_valid_rows()
+        objects = self.import_csv(BulkPLMObjectsImporter, csv_rows)
+        self.assertEquals(len(csv_rows) - 1, len(objects))
+        sp1 = get_obj("SinglePart", "sp1", "s", self.user)
+        self.assertEquals("SP1", sp1.name)
+        self.assertEquals("Lui", sp1.supplier)
+        self.assertEquals(self.group, sp1.group)
+        self.assertEquals(self.user, sp1.owner)
+        self.assertTrue(sp1.is_draft)
+        self.assertTrue(sp1.check_permission("sign_1st_level", False))
+        self.assertEqual(1, sp1.history.filter(action="created").count())
+        self.assertEqual(1, models.StateHistory.objects.filter(plmobject=sp1.object).count())
+        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(1, len(self.sent_tasks["openPLM.plmapp.tasks.update_indexes"]))
+
+    def test_bulk_import_invalid_rows(self):
+        """
+        Tests that a bulk import with invalid rows does not modify
+        the database and reports all errors.
+        """
+        self.import_csv(PLMObjectsImporter, self.get_valid_rows()[:2])
+        csv_rows = self.get_valid_rows()
+        csv_rows.append(["BadType", "bt", "1", "BT", "",
+            self.group.name, u'draft_official_deprecated'])
+        csv_rows.append(["Part", "p2", "a", "P2", "", "unknown group",
+            u'draft_official_deprecated'])
+        csv_rows.append(csv_rows[-3])
+        plmobjects = list(PLMObject.objects.all())
+        try:
+            self.import_csv(BulkPLMObjectsImporter, csv_rows)
+        except CSVImportError as exc:
+            # p1 already exists, 7: bad type, 8: bad group, 9: duplicated sp2
+            self.assertEqual([2, 7, 8, 9], sorted(exc.errors.keys()))
+        else:
+            self.fail("CSVImportError not raised")
+        self.assertEquals(plmobjects, list(PLMObject.objects.all()))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_bulk_import_one_transaction(self):
+        """
+        Tests that a bulk import which fails after its first chunk
+        does not modify the database.
+        """
+        class Importer(BulkPLMObjectsImporter):
+            CHUNK_SIZE = 2
+        original = PLMObjectController.__dict__["create_in_bulk"]
+        chunks = []
+        def create_in_bulk(cls, rows, user):
+            chunks.append(rows)
+            if len(chunks) == 2:
+                raise ValueError("second chunk")
+            return original.__func__(cls, rows, user)
+        PLMObjectController.create_in_bulk = classmethod(create_in_bulk)
+        plmobjects = list(PLMObject.objects.all())
+        try:
+            self.assertRaises(ValueError, self.import_csv, Importer,
+                    self.get_valid_rows())
+        finally:
+            PLMObjectController.create_in_bulk = original
+        self.assertEqual(2, len(chunks))
+        self.assertEquals(plmobjects, list(PLMObject.objects.all()))
+        self.assertFalse(self.sent_tasks["openPLM.plmapp.tasks.update_indexes"])
+
     def get_valid_bom(self):
         return [["parent-type", "parent-reference", "parent-revision",
                  "child-type", "child-reference", "child-revision",
@@ -167,6 +232,40 @@ class CSVImportTestCase(TransactionTestCase):
         self.assertEquals(c.link.quantity, 10.5)
         self.assertEquals(c.link.order, 16)
 
+    def test_bulk_import_bom_valid(self):
+        """
+        Tests a bulk import of a valid bom.
+        """
+        self.import_csv(PLMObjectsImporter, self.get_valid_rows())
+        csv_rows = self.get_valid_bom()
+        objects = self.import_csv(BulkBOMImporter, csv_rows)
+        # p1, sp1 and sp2, each part is listed once
+        self.assertEquals(3, len(set(obj.id for obj in objects)))
+        self.assertEquals(3, len(objects))
+        parent = get_obj("Part", "p1", "a", self.user)
+        child = get_obj("SinglePart", "sp2", "s", self.user)
+        c = parent.get_children(-1)[1]
+        self.assertEquals(c.link.child.id, child.id)
+        self.assertEquals(c.link.quantity, 10.5)
+        self.assertEquals(c.link.order, 16)
+        self.assertTrue(parent.is_ancestor(child))
+
+    def test_bulk_import_bom_invalid_cycle(self):
+        """
+        Tests a bulk import of an invalid bom: a row makes a cycle.
+        """
+        self.import_csv(PLMObjectsImporter, self.get_valid_rows())
+        csv_rows = self.get_valid_bom()
+        csv_rows.append(["SinglePart", "sp2", "s", "Part", "p1", "a", "1", "1"])
+        csv_rows.append(["Part", "p1", "a", "Part", "unknown", "a", "1", "1"])
+        try:
+            self.import_csv(BulkBOMImporter, csv_rows)
+        except CSVImportError as exc:
+            self.assertEqual([2, 3, 4, 5], sorted(exc.errors.keys()))
+        else:
+            self.fail("CSVImportError not raised")
+        self.assertEquals(0, len(ParentChildLink.objects.all()))
+
     def test_import_bom_invalid_order(self):
         """
         Tests an import of an invalid bom: invalid order.
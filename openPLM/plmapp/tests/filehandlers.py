@@ -27,9 +27,12 @@ This module contains test for filehandlers stuff.
 """
 
 import os.path
+import hashlib
 from django.test import TestCase
 
-from openPLM.plmapp.filehandlers import HandlersManager, ODFHandler
+from openPLM.plmapp.filehandlers import HandlersManager, ODFHandler, VaultUploadHandler
+from openPLM.plmapp.files.content import sniff_type, map_file
+from openPLM.plmapp.models import docfs
 
 class FileHandlerTest(TestCase):
     FILE_TYPE = ".odt"
@@ -54,7 +57,40 @@ class FileHandlerTest(TestCase):
         self.assertEqual("A4", myfile.format)
         self.assertEqual(3, myfile.nb_pages)
 
+    def test_parse_mapped_file(self):
+        mapped_file = map_file(self.FILE)
+        try:
+            myfile = ODFHandler(self.FILE, os.path.basename(self.FILE), mapped_file)
+            self.assertTrue(myfile.is_valid())
+            self.assertEqual(3, myfile.nb_pages)
+            # the shared map is left open
+            mapped_file.seek(0)
+            self.assertEqual("PK", mapped_file.read(2))
+        finally:
+            mapped_file.close()
+
     def test_get_all_supported_types(self):
         handlers = sorted(HandlersManager.get_all_supported_types())
         self.assertEquals(handlers, [".odt", ".pdf"])
 
+
+class VaultUploadHandlerTest(TestCase):
+
+    def test_upload(self):
+        data = "ISO-10303-21;" + "x" * 100000
+        handler = VaultUploadHandler()
+        handler.new_file("filename", "a.stp", "application/octet-stream", len(data))
+        handler.receive_data_chunk(data[:1000], 0)
+        handler.receive_data_chunk(data[1000:], 1000)
+        f = handler.file_complete(len(data))
+        self.assertEqual(hashlib.sha256(data).hexdigest(), f.sha256)
+        self.assertEqual("application/step", sniff_type(f.header, f.name))
+        tmp_path = f.temporary_file_path()
+        name = docfs.save(f.name, f)
+        # the uploaded file has been moved, not copied
+        self.assertFalse(os.path.exists(tmp_path))
+        self.assertEqual(f.sha256, docfs.get_digest(name))
+        with open(docfs.path(name), "rb") as stored:
+            self.assertEqual(data, stored.read())
+        f.close()
+        os.remove(docfs.path(name))
@@ -29,7 +29,10 @@ This module contains test for lifecycle stuff.
 from django.test import TestCase
 
 from openPLM.plmapp.models import Lifecycle, get_default_lifecycle, \
-        get_default_state, LifecycleStates
+        get_default_state, LifecycleStates, LifecycleInfo, State, \
+        get_lifecycle_registry, get_lifecycle_info, CacheVersion, \
+        REGISTRY_VERSION_NAME
+from django.core.signals import request_started
 from openPLM.plmapp.lifecycle import LifecycleList
 
 class LifecycleTest(TestCase):
@@ -58,3 +61,56 @@ class LifecycleTest(TestCase):
         state = get_default_state()
         self.assertEqual(state.name, "draft")
 
+    def test_registry(self):
+        cycle = LifecycleList("cycle_name", "b", "a", "b", "c", "d")
+        Lifecycle.from_lifecyclelist(cycle)
+        registry = get_lifecycle_registry()
+        with self.assertNumQueries(0):
+            info = get_lifecycle_info("cycle_name")
+            self.assertEqual(("a", "b", "c", "d"), info.states)
+            self.assertEqual(("a", "d"), (info.first_state, info.last_state))
+            self.assertEqual(2, registry.rank("c", "cycle_name"))
+            self.assertEqual(1, info.official_rank)
+            self.assertEqual("c", info.next_state("b"))
+            self.assertEqual(None, info.next_state("d"))
+            self.assertEqual("a", info.previous_state("b"))
+            self.assertEqual(None, info.previous_state("a"))
+            categories = [info.get_category(s) for s in info.states]
+            self.assertEqual([LifecycleInfo.DRAFT, LifecycleInfo.OFFICIAL,
+                LifecycleInfo.PROPOSED, LifecycleInfo.DEPRECATED], categories)
+            self.assertEqual(LifecycleInfo.CANCELLED,
+                    registry.get_category("cancelled", "cancelled"))
+
+    def test_registry_refresh(self):
+        cycle = LifecycleList("cycle_name", "b", "a", "b", "c")
+        lifecycle = Lifecycle.from_lifecyclelist(cycle)
+        self.assertEqual("c", get_lifecycle_info("cycle_name").last_state)
+        LifecycleStates.objects.create(lifecycle=lifecycle,
+                state=State.objects.create(name="e"), rank=3)
+        self.assertEqual("e", get_lifecycle_info("cycle_name").last_state)
+        self.assertEqual("e", lifecycle.last_state.name)
+        self.assertEqual(4, lifecycle.nb_states)
+
+    def test_registry_unknown_lifecycle(self):
+        version = get_lifecycle_registry().version
+        # created by a process which does not share the cache
+        Lifecycle.objects.bulk_create([Lifecycle(name="other",
+            official_state=State.objects.get(name="draft"))])
+        self.assertEqual("other", get_lifecycle_info("other").name)
+        self.assertRaises(Lifecycle.DoesNotExist, get_lifecycle_info, "unknown")
+        # the registries of the other processes are not invalidated
+        self.assertEqual(version, get_lifecycle_registry().version)
+
+    def test_registry_version(self):
+        registry = get_lifecycle_registry()
+        self.assertEqual(CacheVersion.get(REGISTRY_VERSION_NAME), registry.version)
+        # changed by another process
+        version = CacheVersion.bump(REGISTRY_VERSION_NAME)
+        with self.assertNumQueries(0):
+            self.assertEqual(registry, get_lifecycle_registry())
+        # the version is read again by the next request
+        request_started.send(sender=None)
+        registry = get_lifecycle_registry()
+        self.assertEqual(version, registry.version)
+        with self.assertNumQueries(0):
+            get_lifecycle_registry()
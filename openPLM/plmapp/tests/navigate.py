@@ -2,7 +2,7 @@ import lxml.html
 
 from django.contrib.auth.models import User
 
-from openPLM.plmapp import models
+from openPLM.plmapp import models, navigate
 from openPLM.plmapp.navigate import NavigationGraph, OSR
 from openPLM.plmapp.controllers import PartController, DocumentController,\
         UserController, GroupController
@@ -80,6 +80,23 @@ class PLMObjectNavigateTestCase(NavigateTestCase):
             self.get_graph_data({"owner" : True, OSR : True }, (result,))
             self.assertCount(1, 0)
 
+    def test_navigate_layout_cached(self):
+        """
+        Tests that Graphviz is not run again to render the same graph.
+        """
+        self.get_graph_data({"owner" : True})
+        json = self.json
+        popen = navigate.subprocess.Popen
+        def fail(*args, **kwargs):
+            raise AssertionError("the layout is not cached")
+        navigate.subprocess.Popen = fail
+        try:
+            self.get_graph_data({"owner" : True})
+        finally:
+            navigate.subprocess.Popen = popen
+        self.assertCount(2, 1)
+        self.assertEqual(json, self.json)
+
     def test_navigate_signer(self):
         """
         Tests a navigate with the "signer" option set.
@@ -415,6 +432,27 @@ class UserNavigateTestCase(NavigateTestCase):
                 "doc_parts" : [self.part.id]  }, (result,))
             self.assertCount(1, 0)
 
+    def test_navigate_doc_parts_many(self):
+        """
+        Tests a navigate with the "doc_parts" option set for several parts.
+        """
+        data = self.DATA.copy()
+        data["name"] = "Coffee"
+        parts = [self.part]
+        for i in range(2):
+            parts.append(PartController.create("p%d" % i, "Part", "a",
+                self.user, self.DATA, True, True))
+        docs = []
+        for i, part in enumerate(parts):
+            doc = DocumentController.create("doc%d" % i, "Document", "d",
+                    self.cie, data, True, True)
+            part.attach_to_document(doc)
+            docs.append(doc.object)
+        results = [p.object for p in parts] + docs
+        self.get_graph_data({"owned" : True, OSR : True,
+            "doc_parts" : [p.id for p in parts] }, results)
+        self.assertCount(7, 6)
+
     def test_navigate_notified(self):
         """
         Tests a navigate with the "request_notification_from" option set.
@@ -221,6 +221,61 @@ class DocumentViewTestCase(ViewTest):
         self.assertEqual(df.filename, f.name)
         self.assertEqual("crumble", df.file.read())
 
+    def test_download(self):
+        df = self.controller.add_file(self.get_file(data="crumble"))
+        response = self.client.get("/file/%d/" % df.id)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("crumble", "".join(response.streaming_content))
+        self.assertEqual("bytes", response["Accept-Ranges"])
+        etag = response["ETag"]
+        # conditional request
+        response = self.client.get("/file/%d/" % df.id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        # a new revision changes the etag
+        self.controller.checkin(df, self.get_file(name=df.filename, data="crumbles"))
+        response = self.client.get("/file/%d/" % df.id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+    def test_download_range(self):
+        df = self.controller.add_file(self.get_file(data="crumble"))
+        url = "/file/%d/" % df.id
+        response = self.client.get(url, HTTP_RANGE="bytes=2-4")
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 2-4/7", response["Content-Range"])
+        self.assertEqual("umb", "".join(response.streaming_content))
+        response = self.client.get(url, HTTP_RANGE="bytes=3-")
+        self.assertEqual("mble", "".join(response.streaming_content))
+        response = self.client.get(url, HTTP_RANGE="bytes=-2")
+        self.assertEqual("le", "".join(response.streaming_content))
+        response = self.client.get(url, HTTP_RANGE="bytes=10-")
+        self.assertEqual(416, response.status_code)
+        self.assertEqual("bytes */7", response["Content-Range"])
+        # outdated If-Range: whole file
+        response = self.client.get(url, HTTP_RANGE="bytes=2-4", HTTP_IF_RANGE='"old"')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("crumble", "".join(response.streaming_content))
+        # no range of an empty file is satisfiable
+        df = self.controller.add_file(self.get_file(name="empty.test", data=""))
+        response = self.client.get("/file/%d/" % df.id, HTTP_RANGE="bytes=-2")
+        self.assertEqual(416, response.status_code)
+        self.assertEqual("bytes */0", response["Content-Range"])
+
+    def test_download_sendfile(self):
+        df = self.controller.add_file(self.get_file(data="crumble"))
+        with self.settings(DOCUMENT_SENDFILE="x-accel-redirect",
+                DOCUMENT_SENDFILE_URL="/protected/"):
+            response = self.client.get("/file/%d/" % df.id)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("/protected/" + df.file.name, response["X-Accel-Redirect"])
+        self.assertEqual("", response.content)
+        # the path is URL-quoted
+        df = self.controller.add_file(self.get_file(name="crumble.a%20b", data="crumble"))
+        with self.settings(DOCUMENT_SENDFILE="x-accel-redirect",
+                DOCUMENT_SENDFILE_URL="/protected/"):
+            response = self.client.get("/file/%d/" % df.id)
+        self.assertTrue(response["X-Accel-Redirect"].startswith("/protected/.a%2520b/"))
+
     def test_lifecycle(self):
         # ensures the controller is promotable
         self.controller.add_file(self.get_file())
@@ -32,6 +32,7 @@ import datetime
 import lxml.html
 
 from openPLM.plmapp.utils import level_to_sign_str
+from openPLM.plmapp import timeline
 import openPLM.plmapp.models as m
 from openPLM.plmapp.controllers import DocumentController, PartController
 from openPLM.plmapp.lifecycle import LifecycleList
@@ -390,6 +391,30 @@ class ViewTest(CommonViewTest):
         history6 = response.context["object_history"]
         self.assertEqual(list(history6), list(m.GroupHistory.objects.filter(date__gte = date_end, date__lt = date_begin, user__username="company")))
         
+    def test_timeline_pages(self):
+        for i in range(5):
+            self.controller.name = "name %d" % i
+            self.controller.save()
+        sources = timeline.get_sources(self.user)
+        expected = sorted(list(m.History.objects.all()) + list(m.GroupHistory.objects.all()),
+                key=lambda h: (h.date, isinstance(h, m.GroupHistory), h.id), reverse=True)
+        histories = []
+        cursor = None
+        while True:
+            page, cursor = timeline.get_page(sources, 3, cursor)
+            self.assertTrue(len(page) <= 3)
+            histories.extend(page)
+            if cursor is None:
+                break
+            cursor = timeline.parse_cursor(timeline.format_cursor(cursor))
+        self.assertEqual(expected, histories)
+        # a page costs one query per source
+        with self.assertNumQueries(len(sources)):
+            timeline.get_page(sources, 3)
+        # the view links to the next page
+        response = self.get("/timeline/")
+        self.assertEqual(histories[:50], list(response.context["object_history"]))
+
     def test_navigate_get(self):
         response = self.get(self.base_url + "navigate/")
         self.assertTrue(response.context["filter_object_form"])
@@ -0,0 +1,134 @@
+"""
+This module contains tests for :class:`openPLM.xapian_backend.IndexWriter`
+and the :func:`openPLM.plmapp.tasks.flush_index` task.
+"""
+
+import os
+import shutil
+import tempfile
+
+import xapian
+from django.test import TestCase
+
+from openPLM.xapian_backend import IndexWriter
+from openPLM.plmapp import tasks
+from openPLM.plmapp.models import GroupInfo, PendingIndex, ScheduledTask
+from openPLM.plmapp.tests.base import BaseTestCase
+from openPLM.plmapp.management.commands.parallel_reindex import merge_shard, merge_shards
+
+
+class IndexWriterTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, True)
+        self.writer = IndexWriter(self.path, batch_size=3)
+        self.addCleanup(self.writer.close)
+
+    def doc_count(self):
+        return xapian.Database(self.path).get_doccount()
+
+    def add(self, name):
+        with self.writer.lock:
+            document = self.writer.new_document()
+            self.writer.term_generator.index_text(name)
+            document.add_term("Q" + name)
+            self.writer.replace_document("Q" + name, document)
+
+    def test_batch(self):
+        with self.writer.batch():
+            self.add("a")
+            with self.writer.batch():
+                self.add("b")
+            # not yet committed
+            self.assertEqual(2, self.writer.pending)
+            self.assertEqual(0, self.doc_count())
+        self.assertEqual(0, self.writer.pending)
+        self.assertEqual(2, self.doc_count())
+
+    def test_batch_size(self):
+        with self.writer.batch():
+            self.add("a")
+            self.add("b")
+            self.assertEqual(0, self.doc_count())
+            self.add("c")
+            self.assertEqual(0, self.writer.pending)
+            self.assertEqual(3, self.doc_count())
+
+    def test_close(self):
+        with self.writer.batch():
+            self.add("a")
+        # the database stays opened between two batches
+        self.assertRaises(xapian.DatabaseLockError, xapian.WritableDatabase,
+                self.path, xapian.DB_OPEN)
+        self.writer.close()
+        database = xapian.WritableDatabase(self.path, xapian.DB_OPEN)
+        self.assertEqual(1, database.get_doccount())
+        database.close()
+
+    def test_no_batch(self):
+        self.add("a")
+        self.assertEqual(0, self.writer.pending)
+        self.assertEqual(1, self.doc_count())
+        self.writer.delete_document("Qa")
+        self.assertEqual(0, self.doc_count())
+
+    def test_merge_shards(self):
+        shards = []
+        for name in ("a", "b"):
+            path = os.path.join(self.path, name)
+            shards.append(path)
+            self.writer = IndexWriter(path)
+            with self.writer.batch():
+                self.add(name)
+                self.add(name + "2")
+            self.writer.close()
+        destination = os.path.join(self.path, "merged")
+        merge_shards(shards, destination)
+        database = xapian.Database(destination)
+        self.assertEqual(4, database.get_doccount())
+        self.assertTrue(database.term_exists("Qb2"))
+
+    def test_merge_shard(self):
+        with self.writer.batch():
+            self.add("a")
+            self.add("b")
+        destination = xapian.WritableDatabase(os.path.join(self.path, "merged"),
+                xapian.DB_CREATE_OR_OPEN)
+        # a shard merged twice (an interrupted reindexation) is not duplicated
+        merge_shard(self.path, destination)
+        merge_shard(self.path, destination)
+        self.assertEqual(2, destination.get_doccount())
+        self.assertTrue(destination.term_exists("Qb"))
+        destination.close()
+
+
+class FlushIndexTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(FlushIndexTestCase, self).setUp()
+        PendingIndex.objects.all().delete()
+        ScheduledTask.objects.all().delete()
+
+    def test_flush_index(self):
+        # a flush is already scheduled: operations are only queued
+        self.assertTrue(ScheduledTask.schedule(tasks.INDEX_TASK_NAME))
+        tasks.update_index("auth", "user", self.user.pk)
+        tasks.update_indexes([("plmapp", "groupinfo", self.group.pk),
+            ("auth", "user", self.user.pk)], fast_reindex=True)
+        self.assertEqual(3, PendingIndex.objects.count())
+        self.assertEqual(3, tasks.flush_index(batch_size=2))
+        self.assertFalse(PendingIndex.objects.exists())
+        self.assertFalse(ScheduledTask.objects.exists())
+
+    def test_flush_index_deleted_object(self):
+        self.assertTrue(ScheduledTask.schedule(tasks.INDEX_TASK_NAME))
+        group = GroupInfo.objects.create(name="grp2", owner=self.user,
+                creator=self.user)
+        identifier = "plmapp.groupinfo.%d" % group.pk
+        tasks.update_index("plmapp", "groupinfo", group.pk)
+        group.delete()
+        tasks.remove_index("plmapp", "groupinfo", identifier)
+        count = PendingIndex.objects.count()
+        self.assertEqual(count, tasks.flush_index())
+        self.assertFalse(PendingIndex.objects.exists())
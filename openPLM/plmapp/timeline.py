@@ -0,0 +1,206 @@
+############################################################################
+# openPLM - open source PLM
+# Copyright 2010 Philippe Joulaud, Pierre Cosquer
+#
+# This file is part of openPLM.
+#
+#    openPLM is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    openPLM is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with openPLM.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Contact :
+#    Philippe Joulaud : ninoo.fr@gmail.com
+#    Pierre Cosquer : pcosquer@linobject.com
+################################################################################
+
+"""
+.. versionadded:: 2.0
+
+This module contains the timeline engine.
+
+A timeline is made of several sources: querysets of histories
+(:class:`.History`, :class:`.GroupHistory` or :class:`.UserHistory`)
+sorted by date and id in descending order. Each source is read by small
+batches with keyset pagination (``(date, id) < (last date, last id)``)
+and sources are merged with a heap, so that reading a page of a
+timeline costs one indexed query per source, whatever the size of the
+history tables.
+
+Readable histories of plmobjects are selected with the denormalized
+columns :attr:`.History.public` and :attr:`.History.group`: one source
+reads the public histories and one source per group of the user reads
+the other histories.
+
+Archived histories (see :meth:`.ArchivableQuerySet.archived`) are read
+by extra sources if the timeline reaches the archive tables.
+
+A position in a timeline is a *cursor*, a tuple (date, rank, id) where
+*rank* identifies the history model. :func:`format_cursor` and
+:func:`parse_cursor` convert a cursor to/from a string that can be
+given in an url.
+"""
+
+import heapq
+from operator import itemgetter
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from openPLM.plmapp import models, permissions
+from openPLM.plmapp.models.part import get_all_parts
+from openPLM.plmapp.models.document import get_all_documents
+
+#: rank of each history model, used to sort histories with the same date
+RANKS = {
+    models.History : 0,
+    models.GroupHistory : 1,
+    models.UserHistory : 2,
+}
+# archived rows keep their id, they are ranked like hot rows
+for _model, _archive in models.ARCHIVES.items():
+    if _model in RANKS:
+        RANKS[_archive] = RANKS[_model]
+
+#: number of histories read per query
+BATCH_SIZE = 50
+
+_RELATED = {
+    models.History : ("plmobject", "user", "user__profile"),
+    models.GroupHistory : ("plmobject", "plmobject__groupinfo", "user", "user__profile"),
+    models.UserHistory : ("plmobject", "user", "user__profile"),
+}
+for _model, _archive in models.ARCHIVES.items():
+    if _model in _RELATED:
+        _RELATED[_archive] = _RELATED[_model]
+
+def format_cursor(cursor):
+    """ Converts *cursor* to a string. """
+    date, rank, id = cursor
+    return "%s_%d_%d" % (date.isoformat(), rank, id)
+
+def parse_cursor(value):
+    """
+    Converts a string returned by :func:`format_cursor` to a cursor.
+    Returns None if *value* is not a valid cursor.
+    """
+    try:
+        date, rank, id = value.rsplit("_", 2)
+        date = parse_datetime(date)
+        if date is None:
+            return None
+        return date, int(rank), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+def get_sources(user, date_begin=None, date_end=None, done_by=None, list_display=None):
+    """
+    Returns the sources of the timeline of *user*.
+
+    :param date_begin: if set, only histories older than *date_begin* are returned
+    :param date_end: if set, only histories newer than *date_end* are returned,
+                     archived histories are read only if *date_end* is set
+    :param done_by: if set, only histories made by the user whose username
+                    is *done_by* are returned
+    :param list_display: a dictionary with the keys ``display_part``,
+                         ``display_document``, ``display_group`` and
+                         ``display_user`` (all True by default except
+                         ``display_user``)
+    """
+    display = {"display_part" : True, "display_document" : True,
+            "display_group" : True, "display_user" : False}
+    display.update(list_display or {})
+    filters = Q()
+    if date_begin is not None:
+        filters &= Q(date__lt=date_begin)
+    if date_end is not None:
+        filters &= Q(date__gte=date_end)
+    if done_by:
+        try:
+            filters &= Q(user=models.User.objects.get(username=done_by).id)
+        except models.User.DoesNotExist:
+            return []
+    sources = []
+    if display["display_part"] or display["display_document"]:
+        histories = models.History.objects.filter(filters)
+        if not display["display_part"]:
+            histories = histories.filter(plmobject__type__in=get_all_documents().keys())
+        elif not display["display_document"]:
+            histories = histories.filter(plmobject__type__in=get_all_parts().keys())
+        context = permissions.get_context(user)
+        if context is not None:
+            group_ids = context.group_ids
+        else:
+            group_ids = user.groups.values_list("id", flat=True)
+        sources.append(histories.filter(public=True))
+        for group_id in sorted(group_ids):
+            sources.append(histories.filter(public=False, group=group_id))
+    if display["display_group"]:
+        sources.append(models.GroupHistory.objects.filter(filters))
+    if display["display_user"]:
+        sources.append(models.UserHistory.objects.filter(filters))
+    if date_end is not None:
+        sources.extend([source.archived() for source in sources
+            if models.is_archived(source.model, date_end)])
+    return sources
+
+def _after(source, rank, cursor):
+    if cursor is None:
+        return source
+    date, cursor_rank, id = cursor
+    if rank < cursor_rank:
+        return source.filter(date__lte=date)
+    elif rank > cursor_rank:
+        return source.filter(date__lt=date)
+    return source.filter(Q(date__lt=date) | Q(date=date, id__lt=id))
+
+def _iter_source(source, cursor, batch_size):
+    rank = RANKS[source.model]
+    source = source.select_related(*_RELATED[source.model]).order_by("-date", "-id")
+    while True:
+        histories = list(_after(source, rank, cursor)[:batch_size])
+        for history in histories:
+            if rank == RANKS[models.GroupHistory]:
+                # links to the group page, not to the django group
+                history.plmobject.plmobject_url = history.plmobject.groupinfo.plmobject_url
+            cursor = (history.date, rank, history.id)
+            yield cursor, history
+        if len(histories) < batch_size:
+            return
+
+def iter_timeline(sources, cursor=None, batch_size=BATCH_SIZE):
+    """
+    Yields tuples (cursor, history) of all histories of *sources* after
+    *cursor* (newest first).
+
+    Sources are read lazily by batches of *batch_size* histories.
+    """
+    iterators = [_iter_source(source, cursor, batch_size) for source in sources]
+    return heapq.merge(*iterators, key=itemgetter(0), reverse=True)
+
+def get_page(sources, limit, cursor=None):
+    """
+    Returns a tuple (histories, next cursor) where *histories* is the list
+    of (at most *limit*) histories of *sources* after *cursor* and
+    *next cursor* is the cursor of the next page (None if it is the last
+    page).
+
+    It runs at most one query per source.
+    """
+    histories = []
+    next_cursor = None
+    for position, history in iter_timeline(sources, cursor, limit + 1):
+        if len(histories) == limit:
+            next_cursor = last
+            break
+        histories.append(history)
+        last = position
+    return histories, next_cursor
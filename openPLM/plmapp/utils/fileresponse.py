@@ -0,0 +1,195 @@
+"""
+.. versionadded:: 2.0
+
+This module builds responses which send the content of a stored file.
+
+:func:`serve_file` supports:
+
+    * conditional requests: an ``If-None-Match`` header which matches
+      the ETag of the file returns a 304 (Not Modified) response,
+    * byte ranges: a ``Range`` header (``bytes=start-end``, ``bytes=start-``
+      or ``bytes=-suffix``) returns a 206 (Partial Content) response so that
+      clients can resume an interrupted download. An ``If-Range`` header
+      which does not match the ETag returns the whole file,
+    * offloading the transfer to the front-end web server if
+      ``DOCUMENT_SENDFILE`` is set:
+
+        ``"x-sendfile"``
+            the response contains an ``X-Sendfile`` header with the path
+            of the file (Apache's mod_xsendfile, lighttpd),
+        ``"x-accel-redirect"``
+            the response contains an ``X-Accel-Redirect`` header with
+            ``DOCUMENT_SENDFILE_URL`` followed by the path of the file
+            relative to ``DOCUMENTS_DIR`` and URL-quoted (nginx, the location
+            must be *internal*).
+
+      The web server then handles ranges itself.
+"""
+
+import os.path
+import re
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+#: size of the chunks read from the file
+CHUNK_SIZE = 64 * 1024
+
+_range_rx = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+def get_etag(doc_file, size=None):
+    """
+    Returns a strong ETag of *doc_file* (a :class:`.DocumentFile`) built from
+    its id, its revision and its size (*size* if it is not None).
+    """
+    if size is None:
+        size = doc_file.size
+    return '"%d-%d-%d"' % (doc_file.id, doc_file.revision, size)
+
+
+def parse_range(header, size):
+    """
+    Parses a ``Range`` header and returns a tuple (first byte, last byte) of
+    the requested range of a file of *size* bytes.
+
+    Returns None if the header is not valid or if it requests several ranges
+    (the whole file is then sent) and raises a :exc:`ValueError` if the
+    range is not satisfiable (any range of an empty file).
+    """
+    m = _range_rx.match(header)
+    if not m:
+        return None
+    start, end = m.groups()
+    if not start:
+        if not end:
+            return None
+        # suffix range: the last *end* bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, size - length), size - 1
+    start = int(start)
+    if end and start > int(end):
+        return None
+    if start >= size:
+        raise ValueError("unsatisfiable range")
+    end = int(end) if end else size - 1
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header, etag):
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [tag.strip() for tag in header.split(",")]
+
+
+class RangeFileWrapper(object):
+    """
+    Iterator which yields *length* bytes of *f* starting at *offset*
+    and closes *f* once it has been consumed.
+    """
+
+    def __init__(self, f, offset, length, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.remaining = length
+        self.chunk_size = chunk_size
+        f.seek(offset)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.remaining <= 0:
+            raise StopIteration
+        data = self.f.read(min(self.remaining, self.chunk_size))
+        if not data:
+            raise StopIteration
+        self.remaining -= len(data)
+        return data
+
+    __next__ = next
+
+    def close(self):
+        self.f.close()
+
+
+def get_sendfile_header(path):
+    """
+    Returns a tuple (header, value) that offloads the transfer of the file
+    stored at *path* or None if ``DOCUMENT_SENDFILE`` is not set or
+    if *path* is not stored in ``DOCUMENTS_DIR``.
+    """
+    mode = getattr(settings, "DOCUMENT_SENDFILE", None)
+    if not mode or not path:
+        return None
+    root = os.path.realpath(settings.DOCUMENTS_DIR)
+    path = os.path.realpath(path)
+    if not path.startswith(os.path.join(root, "")):
+        return None
+    if mode == "x-sendfile":
+        return "X-Sendfile", path
+    if mode == "x-accel-redirect":
+        url = getattr(settings, "DOCUMENT_SENDFILE_URL", "/protected/docs/")
+        relpath = os.path.relpath(path, root).replace(os.sep, "/")
+        return "X-Accel-Redirect", url + quote(relpath.encode("utf-8"))
+    raise ValueError("invalid DOCUMENT_SENDFILE value: %r" % mode)
+
+
+def serve_file(request, f, size, content_type, etag=None, path=None):
+    """
+    Returns a response which sends the *size* bytes of the opened file *f*.
+
+    :param request: the current request
+    :param f: file opened in binary mode, it is closed by the response
+    :param size: size of the file
+    :param content_type: content type of the response
+    :param etag: strong ETag of the file (see :func:`get_etag`) or None
+                 to disable conditional requests
+    :param path: path of the stored file if the transfer can be offloaded
+                 to the web server (see :func:`get_sendfile_header`)
+    """
+    if etag is not None and _etag_matches(request.META.get("HTTP_IF_NONE_MATCH"), etag):
+        f.close()
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+    sendfile = get_sendfile_header(path)
+    if sendfile is not None:
+        f.close()
+        response = HttpResponse(content_type=content_type)
+        response[sendfile[0]] = sendfile[1]
+    else:
+        byte_range = None
+        header = request.META.get("HTTP_RANGE")
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if header and (if_range is None or (etag is not None and if_range.strip() == etag)):
+            try:
+                byte_range = parse_range(header, size)
+            except ValueError:
+                f.close()
+                response = HttpResponse(status=416, content_type=content_type)
+                response["Content-Range"] = "bytes */%d" % size
+                response["Accept-Ranges"] = "bytes"
+                return response
+        if byte_range is None:
+            response = StreamingHttpResponse(RangeFileWrapper(f, 0, size),
+                    content_type=content_type)
+            response["Content-Length"] = size
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(RangeFileWrapper(f, start, length),
+                    status=206, content_type=content_type)
+            response["Content-Length"] = length
+            response["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+        response["Accept-Ranges"] = "bytes"
+    if etag is not None:
+        response["ETag"] = etag
+    return response
@@ -31,6 +31,7 @@ import json
 import functools
 
 import django.forms
+from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, login
 from django.db import transaction
@@ -38,9 +39,10 @@ from django.http import HttpResponseForbidden
 from django.views.decorators.csrf import csrf_exempt
 
 import openPLM.plmapp.models as models
-from openPLM.plmapp.controllers import get_controller, DocumentController
+from openPLM.plmapp.controllers import get_controller
 import openPLM.plmapp.forms as forms
 from openPLM.plmapp.utils import get_next_revision
+from openPLM.plmapp import permissions
 from openPLM.plmapp.views.base import json_view, get_obj_by_id, object_to_dict,\
         secure_required
 
@@ -121,6 +123,15 @@ def search(request, editable_only="true", with_file_only="true"):
         if form.is_valid():
             # object may have been deleted but not yet unindexed
             results = [r.object for r in form.search().load_all()[:30] if r is not None]
+            # the company belongs to all groups (see check_in_group)
+            check_group = editable_only == "true" and \
+                request.user.username != settings.COMPANY
+            if check_group:
+                context = permissions.get_context(request.user)
+                if context is not None:
+                    group_ids = context.group_ids
+                else:
+                    group_ids = set(request.user.groups.values_list("id", flat=True))
             objects = []
             ids = set()
             for res in results:
@@ -132,10 +143,8 @@ def search(request, editable_only="true", with_file_only="true"):
                     if with_file_only == "true" and hasattr(res, "files") \
                        and not bool(res.files):
                         continue
-                    if editable_only == "true":
-                        obj = DocumentController(res, request.user)
-                        if not obj.check_in_group(request.user, False):
-                            continue
+                    if check_group and res.group_id not in group_ids:
+                        continue
                     ids.add(res.id)
                     objects.append(object_to_dict(res))
             return {"objects" : objects}
@@ -50,7 +50,8 @@ import openPLM.plmapp.models as models
 from openPLM.plmapp.controllers import get_controller
 from openPLM.plmapp.exceptions import ControllerError
 from openPLM.plmapp.forms import get_navigate_form, SimpleSearchForm
-from openPLM.plmapp.navigate import NavigationGraph, OSR
+from openPLM.plmapp.navigate import NavigationGraph, OSR, get_id_card_data
+from openPLM.plmapp.permissions import annotate_readable
 from openPLM.plmapp.utils import can_generate_pdf
 
 
@@ -353,6 +354,7 @@ def get_generic_data(request, type_='-', reference='-', revision='-', search=Tru
             search_query = request.session.get("search_query", "")
             search_count = request.session.get("search_count", 0)
             search_official = request.session.get("search_official", "")
+        qset = annotate_readable(request.user, qset)
 
         ctx.update({
            'results' : qset,
@@ -419,7 +421,8 @@ def get_navigate_data(request, obj_type, obj_ref, obj_revi):
     else:
         options = form.cleaned_data
     if options[OSR]:
-        results = [r.object for r in ctx.get("results", [])]
+        # results have been annotated by get_generic_data
+        results = [r.object for r in ctx.get("results", []) if r.readable]
     else:
         results = []
     graph = NavigationGraph(obj, results)
@@ -469,33 +472,6 @@ def get_creation_view(type_):
     return _creation_views.get(type_)
 
 
-def get_id_card_data(doc_ids):
-    """
-    Get informations to display in the id-cards of all Document which id is in doc_ids
-
-    :param doc_ids: list of Document ids to treat
-
-    :return: a dictionary which contains the following data
-
-        * ``thumbnails``
-            list of tuple (document,thumbnail)
-
-        * ``num_files``
-            list of tuple (document, number of file)
-    """
-    ctx = { "thumbnails" : {}, "num_files" : {} }
-    if doc_ids:
-        thumbnails = models.DocumentFile.objects.filter(deprecated=False,
-            document__in=doc_ids, thumbnail__isnull=False).exclude(thumbnail="")
-        ctx["thumbnails"].update(thumbnails.values_list("document", "thumbnail"))
-        num_files = dict.fromkeys(doc_ids, 0)
-        for doc_id in models.DocumentFile.objects.filter(deprecated=False,
-            document__in=doc_ids).values_list("document", flat=True):
-            num_files[doc_id] += 1
-        ctx["num_files"] = num_files
-    return ctx
-
-
 def get_pagination(request, object_list, type):
     """
     Returns a dictionary with pagination data.
@@ -535,6 +511,8 @@ def get_pagination(request, object_list, type):
     if type in ("object", "document"):
          ids = objects.object_list.values_list("id", flat=True)
          ctx.update(get_id_card_data(ids))
+    if type in ("object", "part", "topassembly", "document"):
+        objects.object_list = annotate_readable(request.user, objects.object_list)
     ctx.update({
          "objects": objects,
          "sort": sort,
@@ -26,13 +26,11 @@
 
 import os
 import glob
-import tempfile
 from mimetypes import guess_type
 
-from django.conf import settings
 from django.http import (HttpResponseRedirect, HttpResponse, Http404,
                         HttpResponseForbidden,
-                        HttpResponseBadRequest, StreamingHttpResponse)
+                        HttpResponseBadRequest)
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.contrib import messages
@@ -40,6 +38,7 @@ from django.contrib import messages
 import openPLM.plmapp.models as models
 import openPLM.plmapp.forms as forms
 from openPLM.plmapp.utils.archive import ARCHIVE_FORMATS
+from openPLM.plmapp.utils.fileresponse import get_etag, serve_file
 from openPLM.plmapp.views.base import (get_obj, get_obj_from_form, get_id_card_data,
     get_obj_by_id, handle_errors, get_generic_data,  secure_required)
 from openPLM.plmapp.controllers import UserController
@@ -358,7 +357,7 @@ def up_progress(request, obj_type, obj_ref, obj_revi):
     obj, ctx = get_generic_data(request, obj_type, obj_ref, obj_revi)
     ret = ""
     suffix = get_upload_suffix(request.GET['X-Progress-ID'])
-    tempdir = settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+    tempdir = models.docfs.get_temporary_dir()
     f = glob.glob(os.path.join(tempdir, "*" + suffix))
     if f:
         ret = str(os.path.getsize(f[0]))
@@ -461,7 +460,7 @@ def download(request, docfile_id):
     doc_file = models.DocumentFile.objects.get(id=docfile_id)
     ctrl = get_obj_by_id(int(doc_file.document.id), request.user)
     ctrl.check_readable()
-    return serve(ctrl, doc_file, "view" in request.GET)
+    return serve(request, ctrl, doc_file, "view" in request.GET)
 
 
 @secure_required
@@ -484,19 +483,30 @@ def public_download(request, docfile_id):
             raise Http404
     elif not ctrl.published:
         return HttpResponseForbidden()
-    return serve(ctrl, doc_file)
+    return serve(request, ctrl, doc_file)
 
 
-def serve(ctrl, doc_file, view=False):
+def serve(request, ctrl, doc_file, view=False):
+    """
+    Returns a response which sends the content of *doc_file*.
+
+    .. versionchanged:: 2.0
+        Added the *request* parameter. Byte ranges, conditional requests
+        and sendfile offloading are supported (see :func:`.serve_file`).
+        Recomposed files (see :meth:`.Document.get_content_and_size`)
+        have no ETag and are never offloaded.
+    """
     name = doc_file.filename.encode("utf-8", "ignore")
     content_type = guess_type(name, False)[0]
     if not content_type:
         content_type = 'application/octet-stream'
     f, size = ctrl.get_content_and_size(doc_file)
-    response = StreamingHttpResponse(f, content_type=content_type)
-    response["Content-Length"] = size
+    path = doc_file.file.path
+    if getattr(f, "name", None) == path:
+        etag = get_etag(doc_file, size)
+    else:
+        etag = path = None
+    response = serve_file(request, f, size, content_type, etag, path)
     if not view:
         response['Content-Disposition'] = 'attachment; filename="%s"' % name
     return response
-
-
@@ -61,12 +61,14 @@ from haystack.views import SearchView
 import openPLM.plmapp.csvimport as csvimport
 import openPLM.plmapp.models as models
 import openPLM.plmapp.forms as forms
+import openPLM.plmapp.timeline as timeline_engine
 from openPLM.plmapp.views.base import (init_ctx, get_obj,
     get_obj_by_id, handle_errors, get_generic_data, get_navigate_data,
     get_creation_view, secure_required, get_pagination)
 from openPLM.plmapp.controllers import get_controller
 from openPLM.plmapp.exceptions import ControllerError, PermissionError
 from openPLM.plmapp.utils import filename_to_name, r2r
+from openPLM.plmapp.permissions import annotate_readable
 
 
 def set_language(request):
@@ -247,7 +249,10 @@ def redirect_history(request, type, hid):
     H = {"group" : models.GroupHistory,
          "user" : models.UserHistory,
          "object" : models.History,}[type]
-    h = H.objects.get(id=int(hid))
+    try:
+        h = H.objects.get(id=int(hid))
+    except H.DoesNotExist:
+        h = H.objects.filter(id=int(hid)).archived().get()
     date_page = str(h.date)[:10]
     items = H.objects.filter(plmobject=h.plmobject, date__gte=h.date).count() - 1
     page = items // ITEMS_PER_HISTORY + 1
@@ -330,7 +335,14 @@ def display_object_history(request, obj_type="-", obj_ref="-", obj_revi="-", tim
             display_document = True
             display_group = True
         list_display = {"display_document": display_document, "display_part": display_part, "display_group" : display_group}
-        history = models.timeline_histories(obj, from_current_timezone(date_begin + datetime.timedelta(days = 1)), date_end, done_by, list_display)
+        # histories of the period are read by pages of ITEMS_PER_HISTORY items
+        sources = timeline_engine.get_sources(request.user,
+            from_current_timezone(date_begin + datetime.timedelta(days = 1)),
+            date_end, done_by, list_display)
+        cursor = timeline_engine.parse_cursor(request.GET.get("cursor"))
+        history, next_cursor = timeline_engine.get_page(sources, ITEMS_PER_HISTORY, cursor)
+        if next_cursor is not None:
+            ctx["next_cursor"] = timeline_engine.format_cursor(next_cursor)
         ctx['form_object'] = form_object
 
         if display_document:
@@ -359,7 +371,8 @@ def display_object_history(request, obj_type="-", obj_ref="-", obj_revi="-", tim
             ctx["show_revisions"] = True
         else:
             ctx["show_revisions"] = False
-        history = history.select_related("plmobject", "user__profile")
+        history = history.prefetch_related("plmobject", "user__profile")
+        history = history.with_archive(date_end).order_by("-date", "-id")
 
 
 
@@ -697,6 +710,11 @@ class OpenPLMSearchView(SearchView):
         extra.update(ctx)
         return extra
 
+    def build_page(self):
+        paginator, page = super(OpenPLMSearchView, self).build_page()
+        page.object_list = annotate_readable(self.request.user, page.object_list)
+        return paginator, page
+
     def get_query(self):
         query = super(OpenPLMSearchView, self).get_query() or "*"
         self.request.session["search_query"] = query
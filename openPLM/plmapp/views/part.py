@@ -375,6 +375,8 @@ def display_parents(request, obj_type, obj_ref, obj_revi):
     states = models.StateHistory.objects.at(date).filter(plmobject__in=ids)
     if only_official:
         states = states.officials()
+    if date is not None:
+        states = states.with_archive(date)
     states = dict(states.values_list("plmobject", "state"))
 
     ctx.update({'current_page':'parents',
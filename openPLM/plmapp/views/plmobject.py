@@ -153,13 +153,13 @@ def get_lifecycle_data(obj):
         List of plmobjects that will be deprecated if the object is promoted
     """
     ctx = {}
-    state = obj.state.name
+    state = obj.state_id
     object_lifecycle = []
     roles = defaultdict(list)
     for link in obj.users.now().order_by("ctime").select_related("user"):
         roles[link.role].append(link)
-    lcs = obj.lifecycle.to_states_list()
-    for i, st in enumerate(lcs):
+    info = models.get_lifecycle_info(obj.lifecycle_id)
+    for i, st in enumerate(info.states):
         links = roles.get(level_to_sign_str(i), [])
         object_lifecycle.append((st, st == state, links))
     is_signer = obj.check_permission(obj.get_current_sign_level(), False)
@@ -177,8 +177,8 @@ def get_lifecycle_data(obj):
     deprecated = []
     previous_alternates = []
     alternates = obj.get_alternates() if obj.is_part else []
-    if is_signer and can_approve and lcs[-1] != state:
-        if lcs.next_state(state) == obj.lifecycle.official_state.name:
+    if is_signer and can_approve and info.last_state != state:
+        if info.next_state(state) == info.official_state:
             revisions = obj.get_previous_revisions()
             for rev in revisions:
                 if rev.is_official:
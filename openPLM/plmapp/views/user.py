@@ -41,23 +41,11 @@ def get_last_edited_objects(user):
     """
     Returns the 5 last objects edited by *user*. It returns a list of the most
     recent history entries associated to these objects.
+
+    .. versionchanged:: 2.0
+        Entries are :class:`.RecentObject` read with one query.
     """
-    histories = []
-    plmobjects = []
-    r = ("plmobject__id", "plmobject__reference", "plmobject__revision", "plmobject__type")
-    qs = user.history_user.order_by("-date", "-pk").select_related("plmobject")
-    qs = qs.only("date", "action", "details", *r)
-    try:
-        h = qs[0]
-        histories.append(h)
-        plmobjects.append(h.plmobject_id)
-        for i in range(4):
-            h = qs.filter(date__lt=h.date).exclude(plmobject__in=plmobjects)[0]
-            histories.append(h)
-            plmobjects.append(h.plmobject_id)
-    except (models.History.DoesNotExist, IndexError):
-        pass # no more histories
-    return histories
+    return models.RecentObject.get_last_edited(user, 5)
 
 
 @handle_errors(restricted_access=False)
@@ -132,8 +132,9 @@ CELERY_ROUTES = {
     "openPLM.plmapp.tasks.update_index": {"queue": "index"},
     "openPLM.plmapp.tasks.update_indexes": {"queue": "index"},
     "openPLM.plmapp.tasks.remove_index": {"queue": "index"},
-    "openPLM.plmapp.mail.do_send_histories_mail" : {"queue" : "mails"},
+    "openPLM.plmapp.tasks.flush_index": {"queue": "index"},
     "openPLM.plmapp.mail.do_send_mail" : {"queue" : "mails"},
+    "openPLM.plmapp.mail.do_flush_outbox" : {"queue" : "mails"},
 }
 if "openPLM.apps.document3D" in INSTALLED_APPS:
     CELERY_ROUTES.update({
@@ -159,8 +160,27 @@ EMAIL_PORT = 1025
 #: to the SMTP server will be logged by celery (`/var/log/celery/*.log`).
 EMAIL_FAIL_SILENTLY = True
 
+#: delay (in seconds) during which notifications of histories are merged:
+#: each user receives one digest of all histories recorded during this delay.
+MAIL_DIGEST_DELAY = 0
+
+#: number of days during which histories stay in the hot tables. Older
+#: histories are moved to the archive tables by the ``archive_histories``
+#: command (which should be run daily by cron).
+HISTORY_HOT_DAYS = 365
+
+#: delay (in seconds) before badges are evaluated by a background task
+#: (only used if the openPLM.apps.badges application is installed)
+#BADGE_EVALUATION_DELAY = 0
+
 #: directory that stores documents. Make sure to use a trailing slash.
 DOCUMENTS_DIR = "/var/openPLM/docs/"
+#: offloads document downloads to the web server: None (files are sent
+#: by Django), "x-sendfile" (Apache's mod_xsendfile) or "x-accel-redirect"
+#: (nginx, files are served from DOCUMENT_SENDFILE_URL which must be an
+#: internal location aliased to DOCUMENTS_DIR)
+DOCUMENT_SENDFILE = None
+DOCUMENT_SENDFILE_URL = "/protected/docs/"
 #: directory that stores thumbnails. Make sure to use a trailing slash.
 THUMBNAILS_DIR = os.path.join(MEDIA_ROOT, "thumbnails/")
 #: URL where thumbnails are located . Make sure to use a trailing slash.
@@ -194,8 +214,12 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'openPLM.plmapp.middleware.permissions.PermissionContextMiddleware',
     # ...
 ]
+if "openPLM.apps.badges" in INSTALLED_APPS:
+    # shows the won badges
+    MIDDLEWARE.append('openPLM.apps.badges.middleware.BadgeNotificationMiddleware')
 
 #XYZ:
 #: expeditor's mail used when sending notification emails
@@ -218,6 +242,9 @@ MAX_FILE_SIZE = -1
 #HAYSTACK_SITECONF = 'openPLM.plmapp.search_sites'
 #HAYSTACK_SEARCH_ENGINE = 'xapian'
 #HAYSTACK_XAPIAN_PATH = "/var/openPLM/xapian_index/"
+#: index operations are queued and written by the flush_index task
+#: by batches of HAYSTACK_XAPIAN_BATCH_SIZE operations
+#HAYSTACK_XAPIAN_BATCH_SIZE = 1000
 #EXTRACTOR = os.path.abspath(os.path.join(os.path.dirname(__file__), "bin", "extractor.sh"))
 import os 
 from pathlib import Path
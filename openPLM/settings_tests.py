@@ -177,6 +177,8 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'openPLM.plmapp.middleware.permissions.PermissionContextMiddleware',
+    'openPLM.apps.badges.middleware.BadgeNotificationMiddleware',
     # ...
 ]
 
@@ -7,11 +7,13 @@ __version__ = (1, 1, 6, 'beta')
 
 import time
 import datetime
+import threading
 import  pickle
 import os
 import re
 import shutil
 import sys
+from contextlib import contextmanager
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
@@ -113,6 +115,142 @@ class XHExpandDecider(xapian.ExpandDecider):
         return True
 
 
+class IndexWriter(object):
+    """
+    Long-lived writer of the Xapian database.
+
+    Opening a :class:`xapian.WritableDatabase` and committing it for each
+    indexed object is slow, so a writer keeps its term generator and its
+    database opened and buffers the :meth:`replace_document` and
+    :meth:`delete_document` operations done in a :meth:`batch` block.
+    They are committed when the block exits or once *batch_size*
+    operations have been done. An operation done outside a batch is
+    committed immediately.
+    The database stays opened until :meth:`close` is called: it releases
+    the lock of the database so that other processes (``rebuild_index``
+    for example) can write.
+
+    The default values of the arguments are taken from the settings
+    ``HAYSTACK_XAPIAN_PATH``, ``HAYSTACK_XAPIAN_LANGUAGE`` and
+    ``HAYSTACK_XAPIAN_BATCH_SIZE`` (1000).
+
+    All methods are thread safe. :attr:`lock` must be held while
+    :attr:`term_generator` is used. The writer does not synchronize
+    processes: the index is only written by the
+    :func:`openPLM.plmapp.tasks.flush_index` task which drains the
+    pending index operations (:class:`.PendingIndex`).
+
+    An in-memory database is never buffered.
+    """
+
+    def __init__(self, path=None, language=None, batch_size=None):
+        self.path = path or settings.HAYSTACK_XAPIAN_PATH
+        language = language or getattr(settings, 'HAYSTACK_XAPIAN_LANGUAGE', 'english')
+        if batch_size is None:
+            batch_size = getattr(settings, 'HAYSTACK_XAPIAN_BATCH_SIZE', 1000)
+        self.batch_size = batch_size
+        self.lock = threading.RLock()
+        self.stemmer = xapian.Stem(language)
+        self.term_generator = xapian.TermGenerator()
+        self.term_generator.set_stemmer(self.stemmer)
+        self.spelling = getattr(settings, 'HAYSTACK_INCLUDE_SPELLING', False)
+        if self.spelling:
+            self.term_generator.set_flags(xapian.TermGenerator.FLAG_SPELLING)
+        self.pending = 0
+        self._database = None
+        self._depth = 0
+
+    @property
+    def database(self):
+        """ The opened :class:`xapian.WritableDatabase`. """
+        if self.path == MEMORY_DB_NAME:
+            # the in-memory database may be reset by tests
+            if not SearchBackend.inmemory_db:
+                SearchBackend.inmemory_db = xapian.inmemory_open()
+            database = SearchBackend.inmemory_db
+        else:
+            if self._database is None:
+                self._database = xapian.WritableDatabase(self.path, xapian.DB_CREATE_OR_OPEN)
+            database = self._database
+        if self.spelling:
+            self.term_generator.set_database(database)
+        return database
+
+    def new_document(self):
+        """
+        Returns a new :class:`xapian.Document` bound to :attr:`term_generator`.
+        """
+        document = xapian.Document()
+        self.term_generator.set_document(document)
+        return document
+
+    def replace_document(self, document_id, document):
+        with self.lock:
+            self.database.replace_document(document_id, document)
+            self._operation_done()
+
+    def delete_document(self, term):
+        with self.lock:
+            self.database.delete_document(term)
+            self._operation_done()
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager which buffers the operations done in its block and
+        commits them when the outermost block exits. The writer is locked
+        during the block.
+        """
+        with self.lock:
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.commit()
+
+    def _operation_done(self):
+        if self.path == MEMORY_DB_NAME:
+            return
+        self.pending += 1
+        if self._depth == 0 or self.pending >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        """
+        Commits all buffered operations.
+        """
+        with self.lock:
+            if self._database is not None and self.pending:
+                self._database.commit()
+            self.pending = 0
+
+    def close(self):
+        """
+        Commits all buffered operations and closes the database.
+        """
+        with self.lock:
+            if self._database is not None:
+                self._database.close()
+                self._database = None
+            self.pending = 0
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    """
+    Returns the :class:`IndexWriter` of the current process.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = IndexWriter()
+        return _writer
+
+
 class SearchBackend(BaseSearchBackend):
     """
     `SearchBackend` defines the Xapian search backend for use with the Haystack
@@ -169,7 +307,7 @@ class SearchBackend(BaseSearchBackend):
             self._content_field_name, self._schema = self.build_schema(self.site.all_searchfields())
         return self._content_field_name
 
-    def update(self, index, iterable):
+    def update(self, index, iterable, writer=None):
         """
         Updates the `index` with any objects in `iterable` by adding/updating
         the database as needed.
@@ -178,6 +316,10 @@ class SearchBackend(BaseSearchBackend):
             `index` -- The `SearchIndex` to process
             `iterable` -- An iterable of model instances to index
 
+        Optional arguments:
+            `writer` -- The `IndexWriter` used to write documents
+                        (default = the writer of the process)
+
         For each object in `iterable`, a document is created containing all
         of the terms extracted from `index.full_prepare(obj)` with field prefixes,
         and 'as-is' as needed.  Also, if the field type is 'text' it will be
@@ -206,18 +348,20 @@ class SearchBackend(BaseSearchBackend):
         for the document ID).  All values are stored as unicode strings with
         conversion of float, int, double, values being done by Xapian itself
         through the use of the :method:xapian.sortable_serialise method.
+
+        Documents are written by the :class:`IndexWriter` of the process
+        in one batch: they are committed when this method returns unless
+        a batch of the writer is already open (see :meth:`IndexWriter.batch`).
         """
-        database = self._database(writable=True)
+        writer = writer or get_writer()
+        with writer.batch():
+            self._update(index, iterable, writer)
+
+    def _update(self, index, iterable, writer):
         try:
+            term_generator = writer.term_generator
             for obj in iterable:
-                document = xapian.Document()
-
-                term_generator = xapian.TermGenerator()
-                term_generator.set_database(database)
-                term_generator.set_stemmer(xapian.Stem(self.language))
-                if getattr(settings, 'HAYSTACK_INCLUDE_SPELLING', False):
-                    term_generator.set_flags(xapian.TermGenerator.FLAG_SPELLING)
-                term_generator.set_document(document)
+                document = writer.new_document()
 
                 document_id = DOCUMENT_ID_TERM_PREFIX + get_identifier(obj)
                 data = index.full_prepare(obj)
@@ -288,17 +432,12 @@ class SearchBackend(BaseSearchBackend):
                     DOCUMENT_CT_TERM_PREFIX + u'%s.%s' %
                     (obj._meta.app_label, obj._meta.module_name)
                 )
-                database.replace_document(document_id, document)
+                writer.replace_document(document_id, document)
 
         except UnicodeDecodeError:
             sys.stderr.write('Chunk failed.\n')
             pass
 
-        finally:
-            if settings.HAYSTACK_XAPIAN_PATH != MEMORY_DB_NAME:
-                database.close()
-            database = None
-
     def remove(self, obj):
         """
         Remove indexes for `obj` from the database.
@@ -306,10 +445,7 @@ class SearchBackend(BaseSearchBackend):
         We delete all instances of `Q<app_name>.<model_name>.<pk>` which
         should be unique to this object.
         """
-        database = self._database(writable=True)
-        database.delete_document(DOCUMENT_ID_TERM_PREFIX + get_identifier(obj))
-        if settings.HAYSTACK_XAPIAN_PATH != MEMORY_DB_NAME:
-            database.close()
+        get_writer().delete_document(DOCUMENT_ID_TERM_PREFIX + get_identifier(obj))
 
     def clear(self, models=[]):
         """
@@ -326,21 +462,22 @@ class SearchBackend(BaseSearchBackend):
         the term `XCONTENTTYPE<app_name>.<model_name>`.  This will delete
         all documents with the specified model type.
         """
-        database = self._database(writable=True)
-        if not models:
-            # Because there does not appear to be a "clear all" method,
-            # it's much quicker to remove the contents of the `HAYSTACK_XAPIAN_PATH`
-            # folder than it is to remove each document one at a time.
-            if os.path.exists(settings.HAYSTACK_XAPIAN_PATH):
-                shutil.rmtree(settings.HAYSTACK_XAPIAN_PATH)
-        else:
-            for model in models:
-                database.delete_document(
-                    DOCUMENT_CT_TERM_PREFIX + '%s.%s' %
-                    (model._meta.app_label, model._meta.module_name)
-                )
-        if settings.HAYSTACK_XAPIAN_PATH != MEMORY_DB_NAME:
-            database.close()
+        writer = get_writer()
+        with writer.lock:
+            if not models:
+                writer.close()
+                # Because there does not appear to be a "clear all" method,
+                # it's much quicker to remove the contents of the `HAYSTACK_XAPIAN_PATH`
+                # folder than it is to remove each document one at a time.
+                if os.path.exists(settings.HAYSTACK_XAPIAN_PATH):
+                    shutil.rmtree(settings.HAYSTACK_XAPIAN_PATH)
+            else:
+                for model in models:
+                    writer.delete_document(
+                        DOCUMENT_CT_TERM_PREFIX + '%s.%s' %
+                        (model._meta.app_label, model._meta.module_name)
+                    )
+                writer.commit()
 
     def document_count(self):
         try: